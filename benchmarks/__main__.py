@@ -0,0 +1,266 @@
+import json
+import logging
+import os
+import tempfile
+
+import click
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def _language_mix(ctx, param, value: str | None) -> dict[str, float] | None:
+    if value is None:
+        return None
+    try:
+        return {
+            extension.strip(): float(share)
+            for extension, share in (item.split("=") for item in value.split(","))
+        }
+    except ValueError as e:
+        raise click.BadParameter("expected e.g. py=0.5,ts=0.3,md=0.2") from e
+
+
+def _sizes(ctx, param, value: str | None) -> list[int] | None:
+    if value is None:
+        return None
+    try:
+        sizes = [int(size) for size in value.split(",")]
+    except ValueError as e:
+        raise click.BadParameter("expected e.g. 100000,1000000") from e
+    if any(size < 1 for size in sizes):
+        raise click.BadParameter("sizes must be positive")
+    return sizes
+
+
+@click.command()
+@click.option("--files", type=click.IntRange(min=1), default=500)
+@click.option(
+    "--language-mix",
+    callback=_language_mix,
+    help="Share of files per extension, e.g. py=0.5,ts=0.3,md=0.2.",
+)
+@click.option("--llm-latency-ms", type=click.FloatRange(min=0), default=20.0)
+@click.option("--llm-jitter-ms", type=click.FloatRange(min=0), default=10.0)
+@click.option(
+    "--llm-rate-limit",
+    type=click.FloatRange(min=0, min_open=True),
+    default=None,
+    help="Requests per second the fake LLM accepts before answering 429.",
+)
+@click.option("--upsert-latency-ms", type=click.FloatRange(min=0), default=20.0)
+@click.option("--pinecone-records", type=click.IntRange(min=1), default=2000)
+@click.option("--pinecone-latency-ms", type=click.FloatRange(min=0), default=200.0)
+@click.option(
+    "--pinecone-rate-limited-share",
+    type=click.FloatRange(min=0, max=1),
+    default=0.2,
+    help="Share of fake Pinecone upserts answered with a 429.",
+)
+@click.option(
+    "--pinecone-server-error-share",
+    type=click.FloatRange(min=0, max=1),
+    default=0.1,
+    help="Share of fake Pinecone upserts answered with a 503.",
+)
+@click.option(
+    "--enrichment-strategy",
+    type=click.Choice(["chunk", "document"]),
+    default="chunk",
+)
+@click.option("--enrichment-concurrency", type=click.IntRange(min=1), default=16)
+@click.option("--chunking-workers", type=click.IntRange(min=1), default=1)
+@click.option(
+    "--chunking-sweep-files",
+    type=click.IntRange(min=1),
+    default=3000,
+    help="Files of the repository chunked with each number of workers.",
+)
+@click.option(
+    "--discovery-files",
+    type=click.IntRange(min=1),
+    default=200_000,
+    help="Files of the checkout discovered with each file source.",
+)
+@click.option(
+    "--duplicate-share",
+    type=click.FloatRange(min=0, max=1),
+    default=0.0,
+    help="Share of the files that copy an earlier file.",
+)
+@click.option(
+    "--deduplication",
+    type=click.Choice(["off", "exact", "near"]),
+    default="off",
+)
+@click.option("--queries", type=click.IntRange(min=1), default=200)
+@click.option("--throughput-queries", type=click.IntRange(min=1), default=5000)
+@click.option(
+    "--vector-store-sizes",
+    callback=_sizes,
+    help="Rows of the local vector store to search at, e.g. 100000,1000000.",
+)
+@click.option("--vector-queries", type=click.IntRange(min=1), default=50)
+@click.option("--seed", type=int, default=0)
+@click.option(
+    "--baseline",
+    type=click.Path(dir_okay=False),
+    default=BASELINE_PATH,
+    show_default=True,
+)
+@click.option(
+    "--save-baseline",
+    is_flag=True,
+    default=False,
+    help="Write the results to the baseline file instead of comparing them.",
+)
+@click.option(
+    "--tolerance",
+    type=click.FloatRange(min=0),
+    default=0.25,
+    help="Fraction by which a metric may be worse than its baseline.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Also write the results to this file as JSON.",
+)
+@click.option(
+    "--work-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Where to generate the repository; a temporary directory by default.",
+)
+def main(
+    files,
+    language_mix,
+    llm_latency_ms,
+    llm_jitter_ms,
+    llm_rate_limit,
+    upsert_latency_ms,
+    pinecone_records,
+    pinecone_latency_ms,
+    pinecone_rate_limited_share,
+    pinecone_server_error_share,
+    enrichment_strategy,
+    enrichment_concurrency,
+    chunking_workers,
+    chunking_sweep_files,
+    discovery_files,
+    duplicate_share,
+    deduplication,
+    queries,
+    throughput_queries,
+    vector_store_sizes,
+    vector_queries,
+    seed,
+    baseline,
+    save_baseline,
+    tolerance,
+    output,
+    work_dir,
+):
+    """
+    Runs the offline embed and search benchmarks and compares the results
+    with the baseline, exiting with status 1 if any metric regressed.
+    """
+    import structlog
+    from rich.console import Console
+    from rich.table import Table
+
+    from benchmarks.runner import (
+        BenchmarkConfig,
+        compare_with_baseline,
+        flatten,
+        load_baseline,
+        run_benchmarks,
+    )
+
+    structlog.configure(
+        wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING)
+    )
+    options = {
+        "files": files,
+        "llm_latency_ms": llm_latency_ms,
+        "llm_jitter_ms": llm_jitter_ms,
+        "llm_rate_limit": llm_rate_limit,
+        "upsert_latency_ms": upsert_latency_ms,
+        "pinecone_records": pinecone_records,
+        "pinecone_latency_ms": pinecone_latency_ms,
+        "pinecone_rate_limited_share": pinecone_rate_limited_share,
+        "pinecone_server_error_share": pinecone_server_error_share,
+        "enrichment_strategy": enrichment_strategy,
+        "enrichment_concurrency": enrichment_concurrency,
+        "chunking_workers": chunking_workers,
+        "chunking_sweep_files": chunking_sweep_files,
+        "discovery_files": discovery_files,
+        "duplicate_share": duplicate_share,
+        "deduplication": deduplication,
+        "queries": queries,
+        "throughput_queries": throughput_queries,
+        "vector_queries": vector_queries,
+        "seed": seed,
+    }
+    if language_mix is not None:
+        options["language_mix"] = language_mix
+    if vector_store_sizes is not None:
+        options["vector_store_sizes"] = vector_store_sizes
+    config = BenchmarkConfig(**options)
+    stored = None if save_baseline else load_baseline(baseline)
+    if stored is not None and stored["config"] != config.model_dump():
+        raise click.UsageError(
+            f"The baseline in {baseline} was recorded with other options: "
+            f"{stored['config']}. Pass the same options or --save-baseline."
+        )
+
+    if work_dir is None:
+        with tempfile.TemporaryDirectory() as temporary_dir:
+            results = run_benchmarks(config, temporary_dir)
+    else:
+        os.makedirs(work_dir, exist_ok=True)
+        results = run_benchmarks(config, work_dir)
+    report = {"config": config.model_dump(), "results": results}
+
+    console = Console()
+    table = Table(title="Benchmark results")
+    table.add_column("Metric")
+    table.add_column("Value", justify="right")
+    table.add_column("Baseline", justify="right")
+    baseline_metrics = flatten(stored["results"]) if stored is not None else {}
+    for name, value in flatten(results).items():
+        expected = baseline_metrics.get(name)
+        table.add_row(name, _format(value), _format(expected))
+    console.print(table)
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    if save_baseline:
+        with open(baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        console.print(f"Saved the baseline to {baseline}")
+        return
+    if stored is None:
+        console.print(f"No baseline at {baseline}; run with --save-baseline")
+        return
+
+    regressions = compare_with_baseline(results, stored["results"], tolerance)
+    if not regressions:
+        console.print(f"No regressions beyond {tolerance:.0%} of the baseline")
+        return
+    for name, expected, value in regressions:
+        console.print(
+            f"[bold red]REGRESSION[/] {name}: {_format(value)} "
+            f"(baseline {_format(expected)})"
+        )
+    raise SystemExit(1)
+
+
+def _format(value) -> str:
+    if value is None:
+        return "-"
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+if __name__ == "__main__":
+    main()
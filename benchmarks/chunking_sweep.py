@@ -0,0 +1,73 @@
+import os
+import time
+
+from benchmarks.fakes import LocalGitClient
+from benchmarks.synthetic_repo import generate_repository
+from codemine.domain.model.code_document import ChunkedDocument, CodeDocument
+from codemine.domain.services.code_chunking_service import CodeChunkingService
+
+REPO_OWNER = "benchmark"
+REPO_NAME = "chunking"
+DEFAULT_CHUNKING_SWEEP_FILES = 3000
+# Worker counts every machine is swept with, besides its CPU count.
+CHUNKING_WORKERS = (1, 2, 4)
+
+
+def run_chunking_sweep(work_dir: str, files: int, seed: int = 0) -> dict:
+    """
+    Chunks every file of a synthetic repository of the given size once per
+    worker count of CHUNKING_WORKERS and the machine's CPU count, in process
+    with one worker and with chunk_documents_parallel otherwise, as
+    EmbedGitRepoUseCase does. Reports the throughput of each and its speedup
+    over one worker; the parallel runs include starting their pool. Files are
+    read and every grammar is loaded before measuring. Raises RuntimeError if
+    a worker count yields different chunks, or if two workers are not faster
+    than one on a machine with at least two CPUs.
+    """
+    root = os.path.join(work_dir, "chunking-sweep")
+    generate_repository(root, REPO_OWNER, REPO_NAME, files=files, seed=seed)
+    chunking_service = CodeChunkingService()
+    with LocalGitClient(root).temporary_clone(REPO_OWNER, REPO_NAME) as git_directory:
+        documents = list(chunking_service.walk_directory(git_directory))
+    for document in documents:
+        chunking_service.chunk_document(document)
+    cpus = os.cpu_count() or 1
+    results: dict = {"cpus": cpus}
+    expected_chunks = None
+    for workers in sorted({*CHUNKING_WORKERS, cpus}):
+        start = time.perf_counter()
+        chunked = _chunk_documents(chunking_service, documents, workers)
+        seconds = time.perf_counter() - start
+        chunks = [
+            (document.file_path, chunk.start, chunk.end)
+            for document in chunked
+            for chunk in document.chunks
+        ]
+        if expected_chunks is None:
+            expected_chunks = chunks
+        elif chunks != expected_chunks:
+            raise RuntimeError(f"Chunking with {workers} workers changed the chunks")
+        results[f"workers_{workers}"] = {
+            "seconds": seconds,
+            "files_per_second": len(documents) / seconds,
+            "chunks_per_second": len(chunks) / seconds,
+            "speedup": results["workers_1"]["seconds"] / seconds
+            if workers > 1
+            else 1.0,
+        }
+    if cpus >= 2 and results["workers_2"]["speedup"] <= 1:
+        raise RuntimeError(
+            f"Chunking with 2 workers on {cpus} CPUs was "
+            f"{results['workers_2']['speedup']:.2f} times as fast as with one"
+        )
+    return results
+
+
+def _chunk_documents(
+    chunking_service: CodeChunkingService,
+    documents: list[CodeDocument],
+    workers: int,
+) -> list[ChunkedDocument]:
+    if workers > 1:
+        return list(chunking_service.chunk_documents_parallel(documents, workers))
+    return [chunking_service.chunk_document(document) for document in documents]
@@ -0,0 +1,211 @@
+import logging
+import os
+import subprocess
+import sys
+import threading
+from collections.abc import Iterable
+
+import click
+import httpx
+import structlog
+from openai import OpenAI
+
+from benchmarks.fake_llm_server import FakeChatServer
+from benchmarks.fakes import InMemoryVectorStore, LocalGitClient
+from benchmarks.synthetic_repo import generate_repository
+from codemine.application.commands import ProcessRepoCommand
+from codemine.application.use_cases.embed_git_repo import EmbedGitRepoUseCase
+from codemine.domain.model.code_document import ChunkedDocument, CodeDocument
+from codemine.domain.services.code_chunking_service import CodeChunkingService
+from codemine.domain.services.context_enrichment_service import ContextEnrichmentService
+from codemine.domain.value_objects import GenericRecord
+from codemine.infrastructure.sqlite_checkpoint_repo import SqliteCheckpointRepo
+from codemine.infrastructure.sqlite_enrichment_cache import SqliteEnrichmentCache
+
+REPO_OWNER = "benchmark"
+REPO_NAME = "checkpoints"
+# Enough chunks for more than one checkpointed upsert group.
+CHECK_FILES = 600
+CRASH_EXIT_CODE = 75
+# The stage each interrupted run is killed in, and the number of calls of that
+# stage it completes first: documents chunked, LLM requests sent or upsert
+# groups. Each run resumes the previous one.
+CRASH_POINTS = (("chunk", 50), ("enrich", 200), ("upsert", 1))
+UPSERT_LOG = "upserted_ids.txt"
+
+
+def check_crash_recovery(work_dir: str, seed: int = 0) -> None:
+    """
+    Embeds a synthetic repository with checkpoints in a subprocess, killed in
+    the chunk, enrich and upsert stages in turn and resumed each time, and
+    embeds it again without interruption. Raises RuntimeError if a run was not
+    killed where expected, or if the interrupted runs together sent more LLM
+    requests or upserted any record more often than the uninterrupted run.
+    """
+    root = os.path.join(work_dir, "crash-recovery")
+    generate_repository(root, REPO_OWNER, REPO_NAME, files=CHECK_FILES, seed=seed)
+    with FakeChatServer(latency=0.0) as llm_server:
+        expected_requests = llm_server.requests
+        _run_embed(root, "uninterrupted", llm_server.base_url)
+        expected_requests = llm_server.requests - expected_requests
+        requests = llm_server.requests
+        for run, (stage, calls) in enumerate(CRASH_POINTS):
+            returncode = _run_embed(
+                root,
+                "interrupted",
+                llm_server.base_url,
+                "--crash-stage",
+                stage,
+                "--crash-after",
+                str(calls),
+                *(["--resume"] if run else []),
+            )
+            if returncode != CRASH_EXIT_CODE:
+                raise RuntimeError(f"The embed run was not killed in the {stage} stage")
+        if _run_embed(root, "interrupted", llm_server.base_url, "--resume"):
+            raise RuntimeError("Resuming the interrupted embed run failed")
+        requests = llm_server.requests - requests
+    expected_ids = _upserted_ids(root, "uninterrupted")
+    upserted_ids = _upserted_ids(root, "interrupted")
+    if requests != expected_requests:
+        raise RuntimeError(
+            f"Resumed embed runs sent {requests} LLM requests, "
+            f"{expected_requests} without interruption"
+        )
+    if len(upserted_ids) != len(set(upserted_ids)):
+        raise RuntimeError("Resumed embed runs upserted records again")
+    if set(upserted_ids) != set(expected_ids):
+        raise RuntimeError("Resumed embed runs did not upsert every record")
+
+
+def _run_embed(root: str, state: str, base_url: str, *args: str) -> int:
+    """Runs embed in a subprocess and returns its exit code."""
+    return subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.crash_recovery",
+            root,
+            os.path.join(root, state),
+            base_url,
+            *args,
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    ).returncode
+
+
+def _upserted_ids(root: str, state: str) -> list[str]:
+    with open(os.path.join(root, state, UPSERT_LOG)) as f:
+        return f.read().splitlines()
+
+
+class _Crash:
+    """
+    Exits the process at the call of stage after the given number of calls.
+    Other stages wait for the document being enriched, so no LLM request is
+    lost in flight, whose response would not be cached.
+    """
+
+    def __init__(self, stage: str | None, calls: int):
+        self.stage = stage
+        self.calls = calls
+        self.enriching = threading.RLock()
+
+    def count(self, stage: str) -> None:
+        if stage != self.stage:
+            return
+        if self.calls == 0:
+            with self.enriching:
+                os._exit(CRASH_EXIT_CODE)
+        self.calls -= 1
+
+
+class _CrashingChunkingService(CodeChunkingService):
+    def __init__(self, crash: _Crash):
+        super().__init__()
+        self.crash = crash
+
+    def chunk_document(self, document: CodeDocument) -> ChunkedDocument:
+        self.crash.count("chunk")
+        return super().chunk_document(document)
+
+
+class _CrashingEnrichmentService(ContextEnrichmentService):
+    def __init__(self, crash: _Crash, cache: SqliteEnrichmentCache):
+        super().__init__(cache=cache)
+        self.crash = crash
+
+    def enrich_document(
+        self, client: OpenAI, document: ChunkedDocument
+    ) -> ChunkedDocument:
+        with self.crash.enriching:
+            return super().enrich_document(client, document)
+
+
+class _LoggingVectorStore(InMemoryVectorStore):
+    """Appends the ID of every upserted record to a file that outlives a crash."""
+
+    def __init__(self, path: str, crash: _Crash):
+        super().__init__()
+        self.path = path
+        self.crash = crash
+
+    def embed_and_insert_records_bulk(self, records: Iterable[GenericRecord]) -> int:
+        self.crash.count("upsert")
+        records = list(records)
+        with open(self.path, "a") as f:
+            f.writelines(f"{record.id}\n" for record in records)
+        return super().embed_and_insert_records_bulk(records)
+
+
+@click.command()
+@click.argument("root")
+@click.argument("state_dir")
+@click.argument("base_url")
+@click.option("--resume", is_flag=True, default=False)
+@click.option("--crash-stage", type=click.Choice(["chunk", "enrich", "upsert"]))
+@click.option("--crash-after", type=click.IntRange(min=0), default=0)
+def main(root, state_dir, base_url, resume, crash_stage, crash_after):
+    """
+    Embeds the synthetic repository under root with state kept in state_dir,
+    exiting with CRASH_EXIT_CODE at the given point of crash_stage.
+    """
+    structlog.configure(
+        wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING)
+    )
+    crash = _Crash(crash_stage, crash_after)
+    os.makedirs(state_dir, exist_ok=True)
+    use_case = EmbedGitRepoUseCase(
+        git_client=LocalGitClient(root),
+        code_chunking_service=_CrashingChunkingService(crash),
+        # Requests of an enrichment batch that did not finish are only
+        # answered again from the cache.
+        context_enrichment_service=_CrashingEnrichmentService(
+            crash, SqliteEnrichmentCache(os.path.join(state_dir, "enrichment.sqlite"))
+        ),
+        vector_store=_LoggingVectorStore(os.path.join(state_dir, UPSERT_LOG), crash),
+        openai_client=OpenAI(
+            base_url=base_url,
+            api_key="benchmark",
+            max_retries=0,
+            http_client=httpx.Client(
+                event_hooks={"request": [lambda request: crash.count("enrich")]}
+            ),
+        ),
+        checkpoint_repo=SqliteCheckpointRepo(
+            os.path.join(state_dir, "checkpoints.sqlite")
+        ),
+    )
+    use_case.execute(
+        ProcessRepoCommand(
+            repo_owner=REPO_OWNER,
+            repo_name=REPO_NAME,
+            async_enrichment=False,
+            resume=resume,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GROUP_CHUNK_ID_PATTERN = re.compile(r'<chunk id="(\d+)">')
+# Rough number of characters per token, used for the usage of each response.
+CHARACTERS_PER_TOKEN = 4
+
+
+class FakeChatServer:
+    """
+    OpenAI-compatible chat completions server answering every request with a
+    made-up context after latency seconds, plus up to jitter seconds. With a
+    rate_limit, requests beyond that many per second are rejected with a 429,
+    as a rate-limited provider would.
+
+    Answers JSON requests for a group of chunks with a context for each chunk.
+    The server runs in its own process, so its work does not slow down the
+    code under test.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.02,
+        jitter: float = 0.0,
+        rate_limit: float | None = None,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.seed = seed
+        self._context = multiprocessing.get_context("spawn")
+        self._requests = self._context.Value("q", 0)
+        self._rate_limited = self._context.Value("q", 0)
+        self._process = None
+        self.port: int | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    @property
+    def requests(self) -> int:
+        return self._requests.value
+
+    @property
+    def rate_limited(self) -> int:
+        return self._rate_limited.value
+
+    def __enter__(self) -> "FakeChatServer":
+        receiver, sender = self._context.Pipe(duplex=False)
+        self._process = self._context.Process(
+            target=_serve,
+            args=(
+                sender,
+                self.latency,
+                self.jitter,
+                self.rate_limit,
+                self.seed,
+                self._requests,
+                self._rate_limited,
+            ),
+            daemon=True,
+        )
+        self._process.start()
+        self.port = receiver.recv()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self._process.terminate()
+        self._process.join()
+
+
+class FakeHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Concurrent clients open more connections at once than the default
+    # backlog of 5, and connections beyond it are refused.
+    request_queue_size = 128
+
+
+def _serve(
+    port_sender,
+    latency: float,
+    jitter: float,
+    rate_limit: float | None,
+    seed: int,
+    requests,
+    rate_limited,
+) -> None:
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    # Token bucket holding up to one second of requests.
+    bucket = {"tokens": rate_limit or 0.0, "refilled_at": time.monotonic()}
+
+    def admit() -> bool:
+        with requests.get_lock():
+            requests.value += 1
+        if rate_limit is None:
+            return True
+        with lock:
+            now = time.monotonic()
+            bucket["tokens"] = min(
+                rate_limit,
+                bucket["tokens"] + (now - bucket["refilled_at"]) * rate_limit,
+            )
+            bucket["refilled_at"] = now
+            if bucket["tokens"] >= 1:
+                bucket["tokens"] -= 1
+                return True
+        with rate_limited.get_lock():
+            rate_limited.value += 1
+        return False
+
+    def delay() -> float:
+        with lock:
+            return latency + rng.uniform(0, jitter)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are written separately, and with Nagle's algorithm
+        # the body waits for the client's delayed ACK of the headers.
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+        def do_POST(self) -> None:
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if not admit():
+                self._send(
+                    429, {"error": {"message": "Rate limit exceeded", "type": "rate"}}
+                )
+                return
+            time.sleep(delay())
+            self._send(200, _completion(body))
+
+        def _send(self, status: int, payload: dict) -> None:
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = FakeHTTPServer(("127.0.0.1", 0), Handler)
+    port_sender.send(server.server_port)
+    server.serve_forever()
+
+
+def _completion(body: dict) -> dict:
+    prompt = body["messages"][-1]["content"]
+    if body.get("response_format", {}).get("type") == "json_object":
+        content = json.dumps(
+            {
+                "contexts": [
+                    {"id": int(chunk_id), "context": f"Part {chunk_id} of the file."}
+                    for chunk_id in GROUP_CHUNK_ID_PATTERN.findall(prompt)
+                ]
+            }
+        )
+    elif "<part>" in prompt:
+        content = "A summary of the file so far."
+    else:
+        content = "This chunk is part of the file."
+    input_characters = sum(len(message["content"]) for message in body["messages"])
+    input_tokens = input_characters // CHARACTERS_PER_TOKEN
+    output_tokens = len(content) // CHARACTERS_PER_TOKEN
+    return {
+        "id": "chatcmpl-benchmark",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body["model"],
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }
+        ],
+        "usage": {
+            "prompt_tokens": input_tokens,
+            "completion_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        },
+    }
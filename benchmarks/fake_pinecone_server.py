@@ -0,0 +1,181 @@
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+from benchmarks.fake_llm_server import FakeHTTPServer
+
+# Limits of the Pinecone data plane for a single upsert request.
+MAX_PAYLOAD_BYTES = 2 * 1024 * 1024
+MAX_RECORDS_PER_REQUEST = 96
+MAX_VECTORS_PER_REQUEST = 1000
+RECORDS_UPSERT_PATTERN = re.compile(r"^/records/namespaces/[^/]+/upsert$")
+VECTORS_UPSERT_PATH = "/vectors/upsert"
+
+
+class FakePineconeServer:
+    """
+    Stand-in for the upsert endpoints of a Pinecone index's data plane,
+    answering each request after latency seconds. Of the requests within the
+    limits, a rate_limited_share is rejected with a 429 and a
+    server_error_share with a 503, picked by a generator seeded with seed.
+    Requests above Pinecone's payload or count limits get a 400, as they
+    would from Pinecone.
+
+    Counts requests, their outcomes, the distinct records stored and the most
+    requests that were in flight at once. The server runs in its own process,
+    so its work does not slow down the code under test.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.02,
+        rate_limited_share: float = 0.0,
+        server_error_share: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.rate_limited_share = rate_limited_share
+        self.server_error_share = server_error_share
+        self.seed = seed
+        self._context = multiprocessing.get_context("spawn")
+        self._counters = {
+            name: self._context.Value("q", 0)
+            for name in (
+                "requests",
+                "rate_limited",
+                "server_errors",
+                "rejected",
+                "payload_bytes",
+                "records",
+                "max_in_flight",
+            )
+        }
+        self._process = None
+        self.port: int | None = None
+
+    @property
+    def host(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def counts(self) -> dict[str, int]:
+        return {name: counter.value for name, counter in self._counters.items()}
+
+    def __enter__(self) -> "FakePineconeServer":
+        receiver, sender = self._context.Pipe(duplex=False)
+        self._process = self._context.Process(
+            target=_serve,
+            args=(
+                sender,
+                self.latency,
+                self.rate_limited_share,
+                self.server_error_share,
+                self.seed,
+                self._counters,
+            ),
+            daemon=True,
+        )
+        self._process.start()
+        self.port = receiver.recv()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self._process.terminate()
+        self._process.join()
+
+
+def _serve(
+    port_sender,
+    latency: float,
+    rate_limited_share: float,
+    server_error_share: float,
+    seed: int,
+    counters: dict,
+) -> None:
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    stored_ids: set[str] = set()
+    in_flight = 0
+
+    def increment(name: str, value: int = 1) -> None:
+        with counters[name].get_lock():
+            counters[name].value += value
+
+    def outcome() -> int:
+        with lock:
+            draw = rng.random()
+        if draw < rate_limited_share:
+            increment("rate_limited")
+            return 429
+        if draw < rate_limited_share + server_error_share:
+            increment("server_errors")
+            return 503
+        return 200
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+        def do_POST(self) -> None:
+            nonlocal in_flight
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            with lock:
+                in_flight += 1
+                if in_flight > counters["max_in_flight"].value:
+                    counters["max_in_flight"].value = in_flight
+            try:
+                self._upsert(body)
+            finally:
+                with lock:
+                    in_flight -= 1
+
+        def _upsert(self, body: bytes) -> None:
+            increment("requests")
+            if RECORDS_UPSERT_PATTERN.match(self.path):
+                ids = [json.loads(line)["_id"] for line in body.splitlines() if line]
+                max_count = MAX_RECORDS_PER_REQUEST
+            elif self.path == VECTORS_UPSERT_PATH:
+                ids = [vector["id"] for vector in json.loads(body)["vectors"]]
+                max_count = MAX_VECTORS_PER_REQUEST
+            else:
+                self._send_error(404, f"Unknown path {self.path}")
+                return
+            if len(body) > MAX_PAYLOAD_BYTES or len(ids) > max_count:
+                increment("rejected")
+                self._send_error(400, "Request exceeds the upsert limits")
+                return
+            time.sleep(latency)
+            status = outcome()
+            if status != 200:
+                self._send_error(status, "Injected failure")
+                return
+            with lock:
+                new_ids = set(ids) - stored_ids
+                stored_ids.update(new_ids)
+            increment("records", len(new_ids))
+            increment("payload_bytes", len(body))
+            if self.path == VECTORS_UPSERT_PATH:
+                self._send(200, {"upsertedCount": len(ids)})
+            else:
+                self._send(201, None)
+
+        def _send_error(self, status: int, message: str) -> None:
+            self._send(status, {"code": status, "message": message, "details": []})
+
+        def _send(self, status: int, payload: dict | None) -> None:
+            data = b"" if payload is None else json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = FakeHTTPServer(("127.0.0.1", 0), Handler)
+    port_sender.send(server.server_port)
+    server.serve_forever()
@@ -0,0 +1,332 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import zlib
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import batched
+
+import numpy as np
+
+from codemine.domain.ports.embedding_client import EmbeddingClient
+from codemine.domain.ports.enrichment_cache import EnrichmentCache
+from codemine.domain.ports.git_client import GitClient
+from codemine.domain.repositories.vector_store_repo import (
+    DEFAULT_SEARCH_CONCURRENCY,
+    VectorIndexRepo,
+)
+from codemine.domain.value_objects import (
+    EmbeddedRecord,
+    GenericRecord,
+    SearchFilter,
+    chunk_id_prefix,
+)
+from codemine.infrastructure.local_vector_store import SEARCH_BATCH_SIZE
+from codemine.infrastructure.settings import Settings
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9]+")
+HASHING_DIMENSION = 256
+CLUSTERS = 1024
+# Rows of noise, two of which are added to a record's centroid.
+NOISE_ROWS = 4096
+# Records per upsert request and requests in flight, as with Pinecone.
+UPSERT_BATCH_SIZE = 96
+DEFAULT_MAX_IN_FLIGHT_UPSERTS = 8
+LIST_PAGE_SIZE = 1000
+FIXED_CONTEXT = "This chunk defines a helper of the module that processes records."
+
+
+class LocalGitClient(GitClient):
+    """Clones owner/repo_name from the bare repository root/owner/repo_name.git."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def generate_url(self, owner: str, repo_name: str, *args, **kwargs) -> str:
+        return os.path.join(self.root, owner, f"{repo_name}.git")
+
+
+class HashingEmbeddingClient(EmbeddingClient):
+    """
+    Embeds content as a bag of hashed words, so searches for words of a
+    record's content find it without an embedding model.
+    """
+
+    model = "hashing"
+
+    def __init__(self, dimension: int = HASHING_DIMENSION):
+        self.dimension = dimension
+
+    def embed_records(self, records: list[GenericRecord]) -> np.ndarray:
+        vectors = np.zeros((len(records), self.dimension), dtype=np.float32)
+        for row, record in enumerate(records):
+            for token in TOKEN_PATTERN.findall(record.unembedded_content.lower()):
+                vectors[row, zlib.crc32(token.encode()) % self.dimension] += 1
+        return vectors
+
+
+class ClusteredEmbeddingClient(EmbeddingClient):
+    """
+    Embeds content as a point near one of clusters random centroids, with
+    the centroid and the noise picked by a hash of the content. Vectors are
+    clustered like real embeddings, which approximate indexes rely on, and
+    are built without a loop over dimensions, so millions can be made.
+    """
+
+    model = "clustered"
+
+    def __init__(
+        self,
+        dimension: int = HASHING_DIMENSION,
+        clusters: int = CLUSTERS,
+        spread: float = 1.0,
+        seed: int = 0,
+    ):
+        self.dimension = dimension
+        rng = np.random.default_rng(seed)
+        self._centroids = rng.standard_normal((clusters, dimension), np.float32)
+        noise = rng.standard_normal((NOISE_ROWS, dimension), np.float32)
+        self._noise = noise * np.float32(spread / np.sqrt(2))
+
+    def embed_records(self, records: list[GenericRecord]) -> np.ndarray:
+        hashes = np.fromiter(
+            (
+                int.from_bytes(
+                    hashlib.blake2b(
+                        record.unembedded_content.encode(), digest_size=8
+                    ).digest()
+                )
+                for record in records
+            ),
+            dtype=np.uint64,
+            count=len(records),
+        )
+        clusters = hashes % np.uint64(len(self._centroids))
+        first = (hashes >> np.uint64(20)) % np.uint64(NOISE_ROWS)
+        second = (hashes >> np.uint64(40)) % np.uint64(NOISE_ROWS)
+        return self._centroids[clusters] + self._noise[first] + self._noise[second]
+
+
+class FixedContextCache(EnrichmentCache):
+    """Enrichment cache holding the same context for every chunk."""
+
+    def __init__(self, context: str = FIXED_CONTEXT):
+        self.context = context
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> str | None:
+        self.hits += 1
+        return self.context
+
+    def set(self, key: str, context: str) -> None:
+        pass
+
+
+class InMemoryVectorStore(VectorIndexRepo):
+    """
+    Vector store kept in memory. Each upsert request sleeps upsert_latency
+    seconds, as a round trip to a hosted vector store would, with at most
+    max_in_flight_upserts requests in flight.
+    """
+
+    def __init__(
+        self,
+        index_name: str = "benchmark",
+        embedding_client: EmbeddingClient | None = None,
+        upsert_latency: float = 0.0,
+        max_in_flight_upserts: int = DEFAULT_MAX_IN_FLIGHT_UPSERTS,
+        settings: Settings | None = None,
+    ):
+        super().__init__(index_name, settings)
+        self.embedding_client = embedding_client or HashingEmbeddingClient()
+        self.upsert_latency = upsert_latency
+        self.max_in_flight_upserts = max_in_flight_upserts
+        self.upsert_requests = 0
+        self._lock = threading.Lock()
+        self._records: dict[str, GenericRecord] = {}
+        self._vectors: dict[str, np.ndarray] = {}
+        # The records and normalised vectors as a matrix, built on search.
+        self._matrix: tuple[list[GenericRecord], np.ndarray] | None = None
+
+    def create_index_if_not_exists(self):
+        pass
+
+    @property
+    def index(self) -> str:
+        return self.index_name
+
+    @property
+    def model_version(self) -> str:
+        return self.embedding_client.model
+
+    def insert_vectors(self, records: list[EmbeddedRecord]):
+        self._insert(
+            records,
+            np.asarray([record.embedded_content for record in records], np.float32),
+        )
+
+    def embed_and_insert_records(self, records: list[GenericRecord]):
+        self._insert(records, self.embedding_client.embed_records(records))
+
+    def embed_and_insert_records_bulk(self, records: Iterable[GenericRecord]) -> int:
+        inserted = 0
+        in_flight: set[Future] = set()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight_upserts) as executor:
+            for batch in batched(records, UPSERT_BATCH_SIZE):
+                if len(in_flight) >= self.max_in_flight_upserts:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    inserted += sum(future.result() for future in done)
+                in_flight.add(executor.submit(self._upsert_batch, list(batch)))
+            inserted += sum(future.result() for future in in_flight)
+        return inserted
+
+    def _upsert_batch(self, records: list[GenericRecord]) -> int:
+        self.embed_and_insert_records(records)
+        return len(records)
+
+    def _insert(self, records: list[GenericRecord], vectors: np.ndarray) -> None:
+        if self.upsert_latency:
+            time.sleep(self.upsert_latency)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        with self._lock:
+            self.upsert_requests += 1
+            for record, vector in zip(records, vectors, strict=True):
+                self._records[record.id] = record
+                self._vectors[record.id] = vector
+            self._matrix = None
+
+    def get_current_files_embedded(self, repo_owner: str, repo_name: str) -> list[str]:
+        with self._lock:
+            return sorted(
+                {
+                    record.metadata["file_path"]
+                    for record in self._records.values()
+                    if record.metadata.get("repo_owner") == repo_owner
+                    and record.metadata.get("repo_name") == repo_name
+                }
+            )
+
+    def remove_vectors_by_file_path(
+        self, file_path: str, repo_owner: str, repo_name: str
+    ) -> bool:
+        with self._lock:
+            ids = [
+                record.id
+                for record in self._records.values()
+                if record.metadata.get("file_path") == file_path
+                and record.metadata.get("repo_owner") == repo_owner
+                and record.metadata.get("repo_name") == repo_name
+            ]
+        self.remove_records_by_id(ids)
+        return True
+
+    def list_record_ids(
+        self, repo_owner: str, repo_name: str, file_path: str | None = None
+    ) -> Iterable[list[str]]:
+        prefix = chunk_id_prefix(repo_owner, repo_name, file_path)
+        with self._lock:
+            ids = [
+                record_id for record_id in self._records if record_id.startswith(prefix)
+            ]
+        yield from (list(page) for page in batched(ids, LIST_PAGE_SIZE))
+
+    def remove_records_by_id(self, ids: list[str]) -> None:
+        with self._lock:
+            for record_id in ids:
+                self._records.pop(record_id, None)
+                self._vectors.pop(record_id, None)
+            self._matrix = None
+
+    def search_vectors(
+        self, query: str, top_k: int = 10, search_filter: SearchFilter | None = None
+    ) -> list[GenericRecord]:
+        return self._search([query], top_k, search_filter)[0]
+
+    def search_vectors_batch(
+        self,
+        queries: Iterable[str],
+        top_k: int = 10,
+        search_filter: SearchFilter | None = None,
+        max_concurrency: int = DEFAULT_SEARCH_CONCURRENCY,
+    ) -> Iterator[list[GenericRecord]]:
+        """
+        Searches SEARCH_BATCH_SIZE queries at a time with one embedding call
+        and one matrix product, as the local vector store does.
+        """
+        for batch in batched(queries, SEARCH_BATCH_SIZE):
+            yield from self._search(list(batch), top_k, search_filter)
+
+    def _search(
+        self, queries: list[str], top_k: int, search_filter: SearchFilter | None
+    ) -> list[list[GenericRecord]]:
+        query_vectors = self.embedding_client.embed_records(
+            [
+                GenericRecord(id="query", unembedded_content=query, metadata={})
+                for query in queries
+            ]
+        )
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = (
+                    list(self._records.values()),
+                    np.stack(list(self._vectors.values()))
+                    if self._vectors
+                    else np.empty((0, self.embedding_client.dimension), np.float32),
+                )
+            records, matrix = self._matrix
+        return [
+            [
+                GenericRecord(
+                    id=records[row].id,
+                    unembedded_content=records[row].unembedded_content,
+                    metadata={**records[row].metadata, "score": float(scores[row])},
+                )
+                for row in _ranked_rows(records, scores, top_k, search_filter)
+            ]
+            for scores in query_vectors @ matrix.T
+        ]
+
+
+def _ranked_rows(
+    records: list[GenericRecord],
+    scores: np.ndarray,
+    top_k: int,
+    search_filter: SearchFilter | None,
+) -> list[int]:
+    """
+    Rows of the top_k records matching search_filter by descending score,
+    ties in row order. Unfiltered searches only sort the rows scoring at least
+    the top_k-th score.
+    """
+    if search_filter is None and 0 < top_k < len(scores):
+        cutoff = np.partition(scores, len(scores) - top_k)[len(scores) - top_k]
+        candidates = np.flatnonzero(scores >= cutoff)
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return order[:top_k].tolist()
+    rows = []
+    for row in np.argsort(-scores, kind="stable"):
+        if search_filter is None or _matches(records[row].metadata, search_filter):
+            rows.append(int(row))
+            if len(rows) == top_k:
+                break
+    return rows
+
+
+def _matches(metadata: dict, search_filter: SearchFilter) -> bool:
+    file_path = metadata.get("file_path", "")
+    return (
+        search_filter.repo_owner in (None, metadata.get("repo_owner"))
+        and search_filter.repo_name in (None, metadata.get("repo_name"))
+        and (
+            search_filter.path_prefix is None
+            or file_path.startswith(search_filter.path_prefix + "/")
+        )
+        and (
+            not search_filter.file_types
+            or file_path.rpartition(".")[2] in search_filter.file_types
+        )
+    )
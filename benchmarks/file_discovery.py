@@ -0,0 +1,102 @@
+import os
+import random
+import subprocess
+import time
+
+from benchmarks.synthetic_repo import FILES_PER_DIRECTORY, WORDS
+from codemine.domain.services.code_splitting import LANGUAGE_LOADERS
+from codemine.domain.services.file_discovery_service import FileDiscoveryService
+
+DEFAULT_DISCOVERY_FILES = 200_000
+# Extensions of the tree's files besides the supported ones, which discovery
+# must skip.
+OTHER_EXTENSIONS = ("json", "txt", "png", "lock")
+# Share of the tree's files under node_modules, which is pruned, and under
+# build, which the root .gitignore ignores. Neither is tracked by git.
+PRUNED_SHARE = 0.1
+IGNORED_SHARE = 0.1
+# Seconds git-source discovery may take per 200,000 files.
+TARGET_SECONDS_PER_200K_FILES = 1.0
+DISCOVERY_SOURCES = ("git", "walk")
+
+
+def run_discovery_benchmark(work_dir: str, files: int, seed: int = 0) -> dict:
+    """
+    Writes a checkout of files empty files, a share of them under a pruned
+    node_modules directory and a gitignored build directory, and tracks the
+    rest in a git index. Times discovering it with each of DISCOVERY_SOURCES.
+    Raises RuntimeError if a source finds other files than the tracked ones
+    with a supported extension, or if the git source is slower than
+    TARGET_SECONDS_PER_200K_FILES.
+    """
+    root = os.path.join(work_dir, "discovery")
+    expected = _generate_tree(root, files, seed)
+    results: dict = {"files": files, "discovered": len(expected)}
+    for source in DISCOVERY_SOURCES:
+        file_discovery = FileDiscoveryService(source=source)
+        start = time.perf_counter()
+        discovered = list(file_discovery.discover(root, LANGUAGE_LOADERS))
+        seconds = time.perf_counter() - start
+        if sorted(discovered) != expected:
+            raise RuntimeError(
+                f"Discovering files with the {source} source found "
+                f"{len(discovered)} files instead of {len(expected)}"
+            )
+        results[source] = {"seconds": seconds, "files_per_second": files / seconds}
+    target_seconds = TARGET_SECONDS_PER_200K_FILES * files / 200_000
+    if results["git"]["seconds"] > target_seconds:
+        raise RuntimeError(
+            f"Discovering {files} files with git took "
+            f"{results['git']['seconds']:.2f}s, over {target_seconds:.2f}s"
+        )
+    return results
+
+
+def _generate_tree(root: str, files: int, seed: int) -> list[str]:
+    """
+    Writes the tree and its git index, returning the sorted paths discovery
+    should find. Every tracked file has the same empty blob, so the index is
+    written in one update-index call without hashing each file.
+    """
+    rng = random.Random(seed)
+    extensions = [*LANGUAGE_LOADERS, *OTHER_EXTENSIONS]
+    tracked = []
+    for number in range(files):
+        share = rng.random()
+        directory = f"{rng.choice(WORDS)}_{number // FILES_PER_DIRECTORY}"
+        file_name = f"{rng.choice(WORDS)}_{number}.{rng.choice(extensions)}"
+        if share < PRUNED_SHARE:
+            relative_path = f"node_modules/{directory}/{file_name}"
+        elif share < PRUNED_SHARE + IGNORED_SHARE:
+            relative_path = f"build/{directory}/{file_name}"
+        else:
+            relative_path = f"src/{directory}/{file_name}"
+            tracked.append(relative_path)
+        path = os.path.join(root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "w").close()
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("build/\n")
+    _git(root, "init", "-q")
+    blob = _git(root, "hash-object", "-w", "--stdin").strip()
+    _git(
+        root,
+        "update-index",
+        "--add",
+        "--index-info",
+        input="".join(f"100644 {blob}\t{path}\n" for path in tracked),
+    )
+    return sorted(
+        path for path in tracked if path.rpartition(".")[2] in LANGUAGE_LOADERS
+    )
+
+
+def _git(cwd: str, *args: str, input: str = "") -> str:
+    return subprocess.run(
+        ["git", *args],
+        cwd=cwd,
+        input=input,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
@@ -0,0 +1,124 @@
+import random
+import time
+
+from pinecone.exceptions import PineconeApiException
+
+from benchmarks.fake_pinecone_server import (
+    MAX_PAYLOAD_BYTES,
+    FakePineconeServer,
+)
+from benchmarks.fakes import ClusteredEmbeddingClient
+from benchmarks.synthetic_repo import WORDS
+from codemine.domain.value_objects import GenericRecord
+from codemine.infrastructure.pinecone_vector_store import (
+    DEFAULT_MAX_IN_FLIGHT_UPSERTS,
+    PineconeVectorStore,
+)
+from codemine.infrastructure.settings import Settings
+from codemine.infrastructure.telemetry import RecordingTelemetry
+
+REPO_OWNER = "benchmark"
+REPO_NAME = "pinecone"
+# Record content lengths, in words, so that some requests are limited by
+# their payload size rather than their record count.
+MIN_RECORD_WORDS = 20
+MAX_RECORD_WORDS = 6000
+# Without an embedding client records are embedded by Pinecone, otherwise
+# they are upserted as vectors.
+UPSERT_MODES = ("records", "vectors")
+
+
+def run_pinecone_upsert_benchmark(
+    records: int,
+    latency: float,
+    rate_limited_share: float,
+    server_error_share: float,
+    seed: int = 0,
+) -> dict:
+    """
+    Upserts records with PineconeVectorStore.embed_and_insert_records_bulk
+    against a FakePineconeServer, once with integrated and once with
+    client-side embedding, and reports the throughput, requests and retries
+    of each. Raises RuntimeError if a request exceeded Pinecone's limits,
+    more than max_in_flight_upserts requests were in flight, or a record was
+    not stored despite the retries.
+    """
+    results = {}
+    for mode in UPSERT_MODES:
+        telemetry = RecordingTelemetry()
+        with FakePineconeServer(
+            latency=latency,
+            rate_limited_share=rate_limited_share,
+            server_error_share=server_error_share,
+            seed=seed,
+        ) as server:
+            store = PineconeVectorStore(
+                "benchmark",
+                Settings(
+                    github_token="benchmark",
+                    openai_api_key="benchmark",
+                    pinecone_api_key="benchmark",
+                    pinecone_index_host=server.host,
+                ),
+                embedding_client=ClusteredEmbeddingClient(seed=seed)
+                if mode == "vectors"
+                else None,
+                telemetry=telemetry,
+            )
+            start = time.perf_counter()
+            try:
+                inserted = store.embed_and_insert_records_bulk(_records(records, seed))
+            except PineconeApiException as e:
+                raise RuntimeError(f"Upserting {mode} failed") from e
+            seconds = time.perf_counter() - start
+            counts = server.counts()
+        if counts["rejected"]:
+            raise RuntimeError(f"{counts['rejected']} {mode} upserts exceeded limits")
+        if counts["max_in_flight"] > DEFAULT_MAX_IN_FLIGHT_UPSERTS:
+            raise RuntimeError(
+                f"{counts['max_in_flight']} {mode} upserts were in flight, "
+                f"more than {DEFAULT_MAX_IN_FLIGHT_UPSERTS}"
+            )
+        if inserted != records or counts["records"] != records:
+            raise RuntimeError(
+                f"{counts['records']} of {records} {mode} records were stored"
+            )
+        accepted = counts["requests"] - counts["rate_limited"] - counts["server_errors"]
+        retries = sum(
+            value
+            for name, value in telemetry.report()["counters"].items()
+            if name.startswith("pinecone_retries")
+        )
+        results[mode] = {
+            "seconds": seconds,
+            "records_per_second": records / seconds,
+            "requests": counts["requests"],
+            "rate_limited": counts["rate_limited"],
+            "server_errors": counts["server_errors"],
+            "retries": retries,
+            "max_in_flight": counts["max_in_flight"],
+            "payload_fill": counts["payload_bytes"] / accepted / MAX_PAYLOAD_BYTES,
+        }
+    return results
+
+
+def _records(count: int, seed: int) -> list[GenericRecord]:
+    rng = random.Random(seed)
+    records = []
+    for number in range(count):
+        file_path = f"src/{number // 10}.py"
+        words = rng.randint(MIN_RECORD_WORDS, MAX_RECORD_WORDS)
+        records.append(
+            GenericRecord(
+                id=f"{REPO_OWNER}#{REPO_NAME}#{file_path}#{number}",
+                unembedded_content=" ".join(rng.choices(WORDS, k=words)),
+                metadata={
+                    "repo_owner": REPO_OWNER,
+                    "repo_name": REPO_NAME,
+                    "file_path": file_path,
+                    "index": number % 10,
+                    "file_type": "py",
+                },
+            )
+        )
+    return records
@@ -0,0 +1,573 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pydantic
+from openai import AsyncOpenAI, OpenAI
+
+from benchmarks.chunking_sweep import (
+    CHUNKING_WORKERS,
+    DEFAULT_CHUNKING_SWEEP_FILES,
+    run_chunking_sweep,
+)
+from benchmarks.crash_recovery import check_crash_recovery
+from benchmarks.fake_llm_server import FakeChatServer
+from benchmarks.fakes import FixedContextCache, InMemoryVectorStore, LocalGitClient
+from benchmarks.file_discovery import (
+    DEFAULT_DISCOVERY_FILES,
+    DISCOVERY_SOURCES,
+    run_discovery_benchmark,
+)
+from benchmarks.pinecone_upserts import UPSERT_MODES, run_pinecone_upsert_benchmark
+from benchmarks.synthetic_repo import DEFAULT_LANGUAGE_MIX, generate_repository
+from benchmarks.vector_search import (
+    DEFAULT_VECTOR_STORE_SIZES,
+    IVF_NPROBES,
+    check_ivf_compaction,
+    check_ivf_recall,
+    run_local_store_benchmark,
+)
+from codemine.application.commands import ProcessRepoCommand
+from codemine.application.pipeline import QUEUE_WAIT_HISTOGRAM, STAGE_BUSY_HISTOGRAM
+from codemine.application.use_cases.embed_git_repo import EmbedGitRepoUseCase
+from codemine.application.use_cases.search_chunks import SearchChunksUseCase
+from codemine.domain.services.code_chunking_service import CodeChunkingService
+from codemine.domain.services.context_enrichment_service import ContextEnrichmentService
+from codemine.domain.services.file_discovery_service import FileDiscoveryService
+from codemine.domain.value_objects import DeduplicationMode, EnrichmentStrategy
+from codemine.infrastructure.bm25_index import Bm25Index
+from codemine.infrastructure.telemetry import RecordingTelemetry
+from codemine.presentation.cli.search_benchmark import (
+    run_retrieval_benchmark,
+    run_search_benchmark,
+    run_use_case_search_benchmark,
+)
+
+REPO_OWNER = "benchmark"
+REPO_NAME = "synthetic"
+STAGES = ("clone", "walk", "chunk", "enrich", "upsert", "lexical_index")
+# Stages that run concurrently, whose spans overlap, so their busy time is
+# reported instead.
+PIPELINE_STAGES = ("walk", "chunk", "enrich", "upsert")
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+SEARCH_RUNS = 3
+STARTUP_RUNS = 3
+# Modules the CLI must not import before a command runs, since they make
+# every command start slowly.
+HEAVY_MODULES = (
+    "openai",
+    "pinecone",
+    "numpy",
+    "git",
+    "pydantic_settings",
+    "tree_sitter",
+    "semantic_text_splitter",
+)
+# The only heavy modules a lexical search of a local store needs: settings,
+# and numpy for the store.
+SEARCH_MODULES = ("numpy", "pydantic_settings")
+# Compared metrics, whether higher values are better, and the smallest change
+# that counts as a regression, below which differences are timing noise.
+COMPARED_METRICS = {
+    "embed.seconds": (False, 0.1),
+    "embed.files_per_second": (True, 0.0),
+    "embed.chunks_per_second": (True, 0.0),
+    **{f"embed.stage_seconds.{stage}": (False, 0.1) for stage in STAGES},
+    "embed.peak_rss_mb": (False, 20.0),
+    "embed.sync.seconds": (False, 0.1),
+    "embed.sync.chunks_per_second": (True, 0.0),
+    **{
+        f"chunking.workers_{workers}.files_per_second": (True, 0.0)
+        for workers in CHUNKING_WORKERS
+    },
+    **{
+        f"discovery.{source}.files_per_second": (True, 0.0)
+        for source in DISCOVERY_SOURCES
+    },
+    "chunk_memory.retained_mb": (False, 1.0),
+    "chunk_memory.peak_mb": (False, 1.0),
+    "chunk_memory.record_characters_per_chunk": (False, 1.0),
+    **{f"search.{mode}.p50_ms": (False, 0.5) for mode in SEARCH_MODES},
+    **{f"search.{mode}.p99_ms": (False, 2.0) for mode in SEARCH_MODES},
+    **{f"search.{mode}.recall": (True, 0.01) for mode in SEARCH_MODES},
+    "search.queries_per_second": (True, 0.0),
+    "search.batch_queries_per_second": (True, 0.0),
+    "search.hybrid_queries_per_second": (True, 0.0),
+    "search.hybrid_batch_queries_per_second": (True, 0.0),
+    "search.peak_rss_mb": (False, 20.0),
+    **{
+        f"local_store.rows_{size}.{metric}": (False, noise_floor)
+        for size in DEFAULT_VECTOR_STORE_SIZES
+        for metric, noise_floor in (
+            ("insert_seconds", 0.5),
+            ("p50_ms", 1.0),
+            ("p99_ms", 5.0),
+        )
+    },
+    **{
+        f"local_store.rows_{size}.ivf.{metric}": (False, noise_floor)
+        for size in DEFAULT_VECTOR_STORE_SIZES
+        for metric, noise_floor in (("build_seconds", 1.0),)
+    },
+    **{
+        f"local_store.rows_{size}.ivf.nprobe_{nprobe}.{metric}": compared
+        for size in DEFAULT_VECTOR_STORE_SIZES
+        for nprobe in IVF_NPROBES
+        for metric, compared in (
+            ("recall_at_10", (True, 0.02)),
+            ("p50_ms", (False, 0.5)),
+            ("p99_ms", (False, 2.0)),
+        )
+    },
+    **{
+        f"pinecone.{mode}.{metric}": compared
+        for mode in UPSERT_MODES
+        for metric, compared in (
+            ("records_per_second", (True, 0.0)),
+            ("requests", (False, 0.0)),
+            ("payload_fill", (True, 0.02)),
+        )
+    },
+    "startup.cli_help_seconds": (False, 0.05),
+    "startup.search_chunks_seconds": (False, 0.05),
+}
+
+
+class BenchmarkConfig(pydantic.BaseModel):
+    files: int = 500
+    language_mix: dict[str, float] = DEFAULT_LANGUAGE_MIX
+    llm_latency_ms: float = 20.0
+    llm_jitter_ms: float = 10.0
+    llm_rate_limit: float | None = None
+    upsert_latency_ms: float = 20.0
+    pinecone_records: int = 2000
+    pinecone_latency_ms: float = 200.0
+    pinecone_rate_limited_share: float = 0.2
+    pinecone_server_error_share: float = 0.1
+    enrichment_strategy: EnrichmentStrategy = "chunk"
+    enrichment_concurrency: int = 16
+    chunking_workers: int = 1
+    chunking_sweep_files: int = DEFAULT_CHUNKING_SWEEP_FILES
+    discovery_files: int = DEFAULT_DISCOVERY_FILES
+    duplicate_share: float = 0.0
+    deduplication: DeduplicationMode = "off"
+    queries: int = 200
+    throughput_queries: int = 5000
+    vector_store_sizes: list[int] = list(DEFAULT_VECTOR_STORE_SIZES)
+    vector_queries: int = 50
+    seed: int = 0
+
+
+def run_benchmarks(config: BenchmarkConfig, work_dir: str) -> dict:
+    """
+    Embeds a synthetic repository with EmbedGitRepoUseCase against a fake LLM
+    server and an in-memory vector store, then searches it with
+    SearchChunksUseCase. Also sweeps the number of chunking workers over a
+    larger repository, times file discovery over a large checkout, measures a
+    local vector store at each of config.vector_store_sizes, upserts to a
+    fake Pinecone index, and times CLI startup. Nothing leaves the machine.
+    Raises RuntimeError if a correctness check fails.
+    """
+    check_ivf_compaction(work_dir)
+    check_ivf_recall(work_dir, config.seed)
+    check_crash_recovery(work_dir, config.seed)
+    generate_repository(
+        work_dir,
+        REPO_OWNER,
+        REPO_NAME,
+        files=config.files,
+        language_mix=config.language_mix,
+        seed=config.seed,
+        duplicate_share=config.duplicate_share,
+    )
+    vector_store = InMemoryVectorStore(upsert_latency=config.upsert_latency_ms / 1000)
+    lexical_index = Bm25Index(os.path.join(work_dir, "lexical-index"))
+    results = {
+        "embed": run_embed_benchmark(config, work_dir, vector_store, lexical_index),
+        "chunking": run_chunking_sweep(
+            work_dir, config.chunking_sweep_files, config.seed
+        ),
+        "discovery": run_discovery_benchmark(
+            work_dir, config.discovery_files, config.seed
+        ),
+        "chunk_memory": run_chunk_memory_benchmark(work_dir),
+        "search": run_search_benchmarks(config, vector_store, lexical_index),
+        "local_store": run_local_store_benchmark(
+            work_dir, config.vector_store_sizes, config.vector_queries, config.seed
+        ),
+        "pinecone": run_pinecone_upsert_benchmark(
+            config.pinecone_records,
+            config.pinecone_latency_ms / 1000,
+            config.pinecone_rate_limited_share,
+            config.pinecone_server_error_share,
+            config.seed,
+        ),
+        "startup": run_startup_benchmark(work_dir),
+    }
+    lexical_index.close()
+    return results
+
+
+def run_embed_benchmark(
+    config: BenchmarkConfig,
+    work_dir: str,
+    vector_store: InMemoryVectorStore,
+    lexical_index: Bm25Index,
+) -> dict:
+    """
+    Embeds the synthetic repository with async enrichment into vector_store
+    and lexical_index, then again with sync enrichment into a store of its
+    own, both against the same fake LLM server, and reports both runs.
+    """
+    telemetry = RecordingTelemetry()
+    with FakeChatServer(
+        latency=config.llm_latency_ms / 1000,
+        jitter=config.llm_jitter_ms / 1000,
+        rate_limit=config.llm_rate_limit,
+        seed=config.seed,
+    ) as llm_server:
+        results, seconds = _embed(
+            config,
+            work_dir,
+            llm_server,
+            vector_store,
+            lexical_index,
+            telemetry,
+            async_enrichment=True,
+        )
+        llm_requests = llm_server.requests
+        llm_rate_limited = llm_server.rate_limited
+        sync_results, sync_seconds = _embed(
+            config,
+            work_dir,
+            llm_server,
+            InMemoryVectorStore(upsert_latency=config.upsert_latency_ms / 1000),
+            None,
+            RecordingTelemetry(),
+            async_enrichment=False,
+        )
+        sync_llm_requests = llm_server.requests - llm_requests
+    report = telemetry.report()
+    files = results["chunked_files"]
+    chunks = results["total_chunks"]
+    embed = {
+        "seconds": seconds,
+        "files": files,
+        "chunks": chunks,
+        "files_per_second": files / seconds,
+        "chunks_per_second": chunks / seconds,
+        "stage_seconds": _stage_seconds(report),
+        "queue_wait_seconds": _queue_wait_seconds(report),
+        "llm_requests": llm_requests,
+        "llm_rate_limited": llm_rate_limited,
+        "upsert_requests": vector_store.upsert_requests,
+        "peak_rss_mb": _peak_rss_mb(),
+        "sync": {
+            "seconds": sync_seconds,
+            "chunks_per_second": sync_results["total_chunks"] / sync_seconds,
+            "llm_requests": sync_llm_requests,
+        },
+        "async_speedup": sync_seconds / seconds,
+    }
+    if "dedup_ratio" in results:
+        embed["dedup_ratio"] = results["dedup_ratio"]
+    return embed
+
+
+def _embed(
+    config: BenchmarkConfig,
+    work_dir: str,
+    llm_server: FakeChatServer,
+    vector_store: InMemoryVectorStore,
+    lexical_index: Bm25Index | None,
+    telemetry: RecordingTelemetry,
+    async_enrichment: bool,
+) -> tuple[dict, float]:
+    """Embeds the synthetic repository, returning the results and wall time."""
+    git_client = LocalGitClient(work_dir)
+    git_client.telemetry = telemetry
+    use_case = EmbedGitRepoUseCase(
+        git_client=git_client,
+        code_chunking_service=CodeChunkingService(
+            file_discovery=FileDiscoveryService(telemetry=telemetry),
+            telemetry=telemetry,
+        ),
+        context_enrichment_service=ContextEnrichmentService(
+            strategy=config.enrichment_strategy, telemetry=telemetry
+        ),
+        vector_store=vector_store,
+        openai_client=OpenAI(base_url=llm_server.base_url, api_key="benchmark"),
+        async_openai_client=AsyncOpenAI(
+            base_url=llm_server.base_url, api_key="benchmark", max_retries=0
+        ),
+        lexical_index=lexical_index,
+        telemetry=telemetry,
+    )
+    start = time.perf_counter()
+    results = use_case.execute(
+        ProcessRepoCommand(
+            repo_owner=REPO_OWNER,
+            repo_name=REPO_NAME,
+            async_enrichment=async_enrichment,
+            enrichment_concurrency=config.enrichment_concurrency,
+            chunking_workers=config.chunking_workers,
+            deduplication=config.deduplication,
+        )
+    )
+    return results, time.perf_counter() - start
+
+
+def _stage_seconds(report: dict) -> dict:
+    """
+    Sums the spans of the stages that run alone, and the busy time of the
+    pipeline stages.
+    """
+    seconds = {}
+    for stage in STAGES:
+        if stage in PIPELINE_STAGES:
+            summary = report["histograms"].get(
+                f"{STAGE_BUSY_HISTOGRAM}{{stage={stage}}}"
+            )
+        else:
+            summary = report["spans"].get(stage)
+        if summary is not None:
+            seconds[stage] = summary["sum"]
+    return seconds
+
+
+def _queue_wait_seconds(report: dict) -> dict:
+    """
+    Sums the time blocked getting items from (get) and putting items on (put)
+    the queue of each background stage.
+    """
+    seconds: dict = {}
+    for stage in PIPELINE_STAGES:
+        for side in ("get", "put"):
+            summary = report["histograms"].get(
+                f"{QUEUE_WAIT_HISTOGRAM}{{side={side},stage={stage}}}"
+            )
+            if summary is not None:
+                seconds.setdefault(stage, {})[side] = summary["sum"]
+    return seconds
+
+
+def run_chunk_memory_benchmark(work_dir: str) -> dict:
+    """
+    Chunks and enriches every file of the synthetic repository, keeping every
+    enriched document, and measures with tracemalloc the memory they hold and
+    the peak while building them. Also reports the mean length of the record
+    text built from each chunk. Files are read and every grammar is loaded
+    before measuring.
+    """
+    chunking_service = CodeChunkingService()
+    enrichment_service = ContextEnrichmentService(cache=FixedContextCache())
+    with LocalGitClient(work_dir).temporary_clone(
+        REPO_OWNER, REPO_NAME
+    ) as git_directory:
+        documents = list(chunking_service.walk_directory(git_directory))
+    for document in documents:
+        chunking_service.chunk_document(document)
+    tracemalloc.start()
+    try:
+        enriched = [
+            enrichment_service.enrich_document(
+                None, chunking_service.chunk_document(document)
+            )
+            for document in documents
+        ]
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    chunks = [chunk for document in enriched for chunk in document.chunks]
+    record_characters = sum(
+        len(chunk.generic_record.unembedded_content) for chunk in chunks
+    )
+    return {
+        "chunks": len(chunks),
+        "retained_mb": retained / 1024**2,
+        "peak_mb": peak / 1024**2,
+        "record_characters_per_chunk": record_characters / len(chunks),
+    }
+
+
+def run_search_benchmarks(
+    config: BenchmarkConfig,
+    vector_store: InMemoryVectorStore,
+    lexical_index: Bm25Index,
+) -> dict:
+    """
+    Searches config.queries known items in every search mode, then measures
+    the throughput of the vector store and of hybrid search over
+    config.throughput_queries. Sub-millisecond timings are noisy, so each
+    metric is the best of SEARCH_RUNS runs. Raises RuntimeError if a hybrid
+    batch search is not faster than searching its queries one at a time.
+    """
+    search_chunks = SearchChunksUseCase(vector_store, lexical_index=lexical_index)
+    queries = [
+        record.unembedded_content.split("\n", 1)[0]
+        for record in lexical_index.sample_records(config.queries, seed=config.seed)
+    ]
+    runs = []
+    for _ in range(SEARCH_RUNS):
+        retrieval = run_retrieval_benchmark(
+            search_chunks, lexical_index, samples=config.queries, seed=config.seed
+        )
+        throughput = run_search_benchmark(
+            vector_store, queries, query_count=config.throughput_queries
+        )
+        hybrid_throughput = run_use_case_search_benchmark(
+            search_chunks, queries, query_count=config.throughput_queries
+        )
+        runs.append(
+            {
+                **{
+                    f"{mode}.{name}": retrieval[mode][key]
+                    for mode in SEARCH_MODES
+                    for name, key in (
+                        ("p50_ms", "p50_ms"),
+                        ("p99_ms", "p99_ms"),
+                        ("recall", "recall_at_10"),
+                    )
+                },
+                "queries_per_second": throughput["sequential_queries_per_second"],
+                "batch_queries_per_second": throughput["batch_queries_per_second"],
+                "hybrid_queries_per_second": hybrid_throughput[
+                    "sequential_queries_per_second"
+                ],
+                "hybrid_batch_queries_per_second": hybrid_throughput[
+                    "batch_queries_per_second"
+                ],
+            }
+        )
+    results: dict = {"queries": retrieval["queries"]}
+    for name in runs[0]:
+        higher_is_better = COMPARED_METRICS[f"search.{name}"][0]
+        best = (max if higher_is_better else min)(run[name] for run in runs)
+        mode, _, metric = name.rpartition(".")
+        (results.setdefault(mode, {}) if mode else results)[metric] = best
+    # Vector searches of the in-memory store are mostly building their
+    # results, so only hybrid batches, which also batch the lexical index, are
+    # checked against single queries.
+    if (
+        results["hybrid_batch_queries_per_second"]
+        <= results["hybrid_queries_per_second"]
+    ):
+        raise RuntimeError(
+            "Batch hybrid search ran at "
+            f"{results['hybrid_batch_queries_per_second']:.0f} queries/s, not "
+            f"faster than {results['hybrid_queries_per_second']:.0f} queries/s "
+            "one at a time"
+        )
+    results["peak_rss_mb"] = _peak_rss_mb()
+    return results
+
+
+def run_startup_benchmark(work_dir: str) -> dict:
+    """
+    Times `codemine --help`, and a lexical `codemine search-chunks` of an
+    empty local store, in fresh interpreters, best of STARTUP_RUNS each.
+    Fails if importing the CLI imports any of HEAVY_MODULES, or if the search
+    imports any of them but SEARCH_MODULES.
+    """
+    script = (
+        "import sys\n"
+        "from codemine.presentation.cli.main import cli\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    heavy = _python(script).strip()
+    if heavy:
+        raise RuntimeError(f"Importing the CLI imports {heavy}")
+    directory = os.path.join(work_dir, "startup")
+    search_env = {
+        **os.environ,
+        "GITHUB_TOKEN": "benchmark",
+        "OPENAI_API_KEY": "benchmark",
+        "VECTOR_STORE_BACKEND": "local",
+        "EMBEDDING_MODEL": "benchmark",
+        "LOCAL_VECTOR_STORE_DIR": os.path.join(directory, "vectors"),
+        "LEXICAL_INDEX_DIR": os.path.join(directory, "lexical"),
+        "SEARCH_CACHE_PATH": os.path.join(directory, "search_cache.sqlite"),
+    }
+    search_args = ("search-chunks", "--mode", "lexical", "--query", "benchmark")
+    search_modules = [name for name in HEAVY_MODULES if name not in SEARCH_MODULES]
+    script = (
+        "import sys\n"
+        "from codemine.presentation.cli.main import cli\n"
+        "cli(standalone_mode=False)\n"
+        f"print(','.join(m for m in {search_modules!r} if m in sys.modules))\n"
+    )
+    heavy = _python(script, *search_args, env=search_env).strip()
+    if heavy:
+        raise RuntimeError(f"Searching chunks imports {heavy}")
+    return {
+        "cli_help_seconds": _best_startup_seconds("--help"),
+        "search_chunks_seconds": _best_startup_seconds(*search_args, env=search_env),
+    }
+
+
+def _best_startup_seconds(*args: str, env: dict | None = None) -> float:
+    seconds = []
+    for _ in range(STARTUP_RUNS):
+        start = time.perf_counter()
+        _python("from codemine.presentation.cli.main import cli\ncli()", *args, env=env)
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns (metric, baseline, result) for every compared metric that is worse
+    than its baseline by more than the tolerance, as a fraction of the
+    baseline, and by more than its noise floor.
+    """
+    metrics = flatten(results)
+    baseline_metrics = flatten(baseline)
+    regressions = []
+    for name, (higher_is_better, noise_floor) in COMPARED_METRICS.items():
+        if name not in metrics or name not in baseline_metrics:
+            continue
+        expected, value = baseline_metrics[name], metrics[name]
+        change = expected - value if higher_is_better else value - expected
+        if change > tolerance * abs(expected) and change > noise_floor:
+            regressions.append((name, expected, value))
+    return regressions
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    """Flattens nested results into dotted metric names."""
+    metrics = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{prefix}{key}."))
+        else:
+            metrics[f"{prefix}{key}"] = value
+    return metrics
+
+
+def load_baseline(path: str) -> dict | None:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _python(script: str, *args: str, env: dict | None = None) -> str:
+    return subprocess.run(
+        [sys.executable, "-c", script, *args],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+    ).stdout
+
+
+def _peak_rss_mb() -> float:
+    # The peak resident set size of the process so far, in kilobytes on Linux
+    # and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
@@ -0,0 +1,171 @@
+import os
+import random
+import subprocess
+import tempfile
+
+# Share of the files written in each language, by extension.
+DEFAULT_LANGUAGE_MIX = {
+    "py": 0.4,
+    "ts": 0.2,
+    "js": 0.1,
+    "rs": 0.1,
+    "md": 0.1,
+    "yaml": 0.1,
+}
+DEFAULT_FUNCTIONS_PER_FILE = (2, 12)
+FILES_PER_DIRECTORY = 25
+WORDS = (
+    "account",
+    "batch",
+    "cache",
+    "chunk",
+    "client",
+    "config",
+    "document",
+    "embed",
+    "event",
+    "index",
+    "invoice",
+    "job",
+    "manifest",
+    "order",
+    "parser",
+    "payment",
+    "query",
+    "record",
+    "repo",
+    "request",
+    "session",
+    "token",
+    "user",
+    "vector",
+)
+# Fixed author and dates make the commit, and so the checkout, reproducible.
+GIT_ENVIRONMENT = {
+    "GIT_AUTHOR_NAME": "benchmark",
+    "GIT_AUTHOR_EMAIL": "benchmark@example.com",
+    "GIT_AUTHOR_DATE": "2024-01-01T00:00:00Z",
+    "GIT_COMMITTER_NAME": "benchmark",
+    "GIT_COMMITTER_EMAIL": "benchmark@example.com",
+    "GIT_COMMITTER_DATE": "2024-01-01T00:00:00Z",
+}
+
+
+def generate_repository(
+    root: str,
+    owner: str,
+    repo_name: str,
+    files: int,
+    language_mix: dict[str, float] | None = None,
+    functions_per_file: tuple[int, int] = DEFAULT_FUNCTIONS_PER_FILE,
+    seed: int = 0,
+    duplicate_share: float = 0.0,
+) -> str:
+    """
+    Writes a repository of synthetic source files to a local bare repository
+    at root/owner/repo_name.git and returns its path. The same arguments
+    always produce the same files. About duplicate_share of the files are
+    copies of an earlier file, as vendored code would be.
+    """
+    rng = random.Random(seed)
+    language_mix = language_mix or DEFAULT_LANGUAGE_MIX
+    extensions = list(language_mix)
+    weights = [language_mix[extension] for extension in extensions]
+    bare_path = os.path.join(root, owner, f"{repo_name}.git")
+    sources: list[tuple[str, str]] = []
+    with tempfile.TemporaryDirectory() as work_tree:
+        for number in range(files):
+            if duplicate_share and sources and rng.random() < duplicate_share:
+                extension, source = rng.choice(sources)
+            else:
+                extension, source = rng.choices(extensions, weights)[0], None
+            relative_path = (
+                f"src/{rng.choice(WORDS)}_{number // FILES_PER_DIRECTORY}/"
+                f"{rng.choice(WORDS)}_{number}.{extension}"
+            )
+            if source is None:
+                source = _source_file(extension, rng, rng.randint(*functions_per_file))
+                sources.append((extension, source))
+            path = os.path.join(work_tree, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(source)
+        _git(work_tree, "init", "-q", "-b", "main")
+        _git(work_tree, "add", "-A")
+        _git(work_tree, "commit", "-q", "-m", "Synthetic repository")
+        os.makedirs(os.path.dirname(bare_path), exist_ok=True)
+        _git(root, "clone", "-q", "--bare", work_tree, bare_path)
+    return bare_path
+
+
+def _git(cwd: str, *args: str) -> None:
+    subprocess.run(
+        ["git", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        env={**os.environ, **GIT_ENVIRONMENT},
+    )
+
+
+def _identifier(rng: random.Random) -> str:
+    return "_".join(rng.sample(WORDS, 2)) + f"_{rng.randrange(1000)}"
+
+
+def _camel_case(identifier: str) -> str:
+    first, *rest = identifier.split("_")
+    return first + "".join(part.capitalize() for part in rest)
+
+
+def _source_file(extension: str, rng: random.Random, functions: int) -> str:
+    names = [_identifier(rng) for _ in range(functions)]
+    if extension == "py":
+        return "\n\n".join(
+            f"def {name}(items, limit=10):\n"
+            f'    """Returns the {name.replace("_", " ")} of the items."""\n'
+            f"    result = []\n"
+            f"    for item in items[:limit]:\n"
+            f"        if item.{rng.choice(WORDS)} is not None:\n"
+            f"            result.append(item.{rng.choice(WORDS)})\n"
+            f"    return result\n"
+            for name in names
+        )
+    if extension in ("ts", "js"):
+        annotation = ": unknown[]" if extension == "ts" else ""
+        return "\n".join(
+            f"export function {_camel_case(name)}(items{annotation}, limit = 10) {{\n"
+            f"  // Returns the {name.replace('_', ' ')} of the items.\n"
+            f"  return items\n"
+            f"    .slice(0, limit)\n"
+            f"    .filter((item) => item !== null)\n"
+            f"    .map((item) => String(item).length + {rng.randrange(100)});\n"
+            f"}}\n"
+            for name in names
+        )
+    if extension == "rs":
+        return "\n".join(
+            f"/// Returns the {name.replace('_', ' ')} of the items.\n"
+            f"pub fn {name}(items: &[u64], limit: usize) -> Vec<u64> {{\n"
+            f"    items\n"
+            f"        .iter()\n"
+            f"        .take(limit)\n"
+            f"        .map(|item| item + {rng.randrange(100)})\n"
+            f"        .collect()\n"
+            f"}}\n"
+            for name in names
+        )
+    if extension == "md":
+        return "\n".join(
+            f"## {name.replace('_', ' ').title()}\n\n"
+            f"The {name.replace('_', ' ')} step reads each "
+            f"{rng.choice(WORDS)} and writes its {rng.choice(WORDS)} to the "
+            f"{rng.choice(WORDS)} store, retrying failed requests.\n"
+            for name in names
+        )
+    return "".join(
+        f"{name}:\n"
+        f"  enabled: {rng.choice(['true', 'false'])}\n"
+        f"  limit: {rng.randrange(1000)}\n"
+        f"  target: {rng.choice(WORDS)}\n"
+        for name in names
+    )
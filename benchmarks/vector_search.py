@@ -0,0 +1,205 @@
+import os
+import random
+import statistics
+import time
+
+import numpy as np
+
+from benchmarks.fakes import ClusteredEmbeddingClient, HashingEmbeddingClient
+from benchmarks.synthetic_repo import WORDS
+from codemine.domain.ports.embedding_client import EmbeddingClient
+from codemine.domain.value_objects import GenericRecord
+from codemine.infrastructure.ivf_index import DEFAULT_NPROBE
+from codemine.infrastructure.local_vector_store import IVF_MIN_ROWS, LocalVectorStore
+from codemine.infrastructure.settings import Settings
+
+REPO_OWNER = "benchmark"
+REPO_NAME = "vectors"
+RECORDS_PER_FILE = 10
+CHECK_QUERIES = 20
+DEFAULT_VECTOR_STORE_SIZES = (100_000, 1_000_000)
+INSERT_BATCH_SIZE = 10_000
+TOP_K = 10
+# nprobe values an IVF index over the same store is searched with.
+IVF_NPROBES = (1, 2, 4, 8, 16, 32, 64)
+# Least recall@10 the IVF index must reach with the default nprobe, and the
+# queries it is measured over.
+MIN_IVF_RECALL = 0.95
+RECALL_CHECK_QUERIES = 100
+
+
+def run_local_store_benchmark(
+    work_dir: str, sizes: list[int], queries: int, seed: int = 0
+) -> dict:
+    """
+    Grows a memory-mapped LocalVectorStore of clustered vectors to each of
+    sizes in turn, and measures at each size the latency of exact searches
+    through search_vectors, including embedding the query and reading the
+    matching records from SQLite. Then searches the same files through an IVF
+    index with each of IVF_NPROBES, reporting latency and recall@10 against
+    the exact results.
+    """
+    settings = _settings(os.path.join(work_dir, "local-store"))
+    embedding_client = ClusteredEmbeddingClient(seed=seed)
+    store = LocalVectorStore("benchmark", settings, embedding_client)
+    query_texts = _queries(queries, seed)
+    results = {}
+    rows = 0
+    for size in sorted(sizes):
+        start = time.perf_counter()
+        for batch_start in range(rows, size, INSERT_BATCH_SIZE):
+            batch_end = min(batch_start + INSERT_BATCH_SIZE, size)
+            store.embed_and_insert_records(_records(batch_start, batch_end, "file"))
+        rows = max(rows, size)
+        insert_seconds = time.perf_counter() - start
+        store.warm_up()
+        store.search_vectors(query_texts[0], top_k=TOP_K)
+        latencies, exact_ids = _timed_searches(store, query_texts)
+        results[f"rows_{size}"] = {
+            "insert_seconds": insert_seconds,
+            **_percentiles(latencies),
+            "ivf": _ivf_sweep(settings, embedding_client, query_texts, exact_ids),
+        }
+    return results
+
+
+def _ivf_sweep(
+    settings: Settings,
+    embedding_client: EmbeddingClient,
+    queries: list[str],
+    exact_ids: list[list[str]],
+) -> dict:
+    store = LocalVectorStore(
+        "benchmark", settings, embedding_client, use_ivf_index=True
+    )
+    # The first search trains the index, or updates the one left on disk.
+    start = time.perf_counter()
+    store.search_vectors(queries[0], top_k=TOP_K)
+    sweep: dict = {"build_seconds": time.perf_counter() - start}
+    for nprobe in IVF_NPROBES:
+        latencies, ids = _timed_searches(store, queries, nprobe=nprobe)
+        sweep[f"nprobe_{nprobe}"] = {
+            "recall_at_10": _recall(ids, exact_ids),
+            **_percentiles(latencies),
+        }
+    return sweep
+
+
+def check_ivf_recall(work_dir: str, seed: int = 0) -> None:
+    """
+    Inserts IVF_MIN_ROWS clustered records into a local store, where an IVF
+    index has the smallest lists it is used with, and raises RuntimeError if
+    its recall@10 with the default nprobe is below MIN_IVF_RECALL.
+    """
+    settings = _settings(os.path.join(work_dir, "ivf-recall"))
+    embedding_client = ClusteredEmbeddingClient(seed=seed)
+    store = LocalVectorStore("benchmark", settings, embedding_client)
+    for batch_start in range(0, IVF_MIN_ROWS, INSERT_BATCH_SIZE):
+        batch_end = min(batch_start + INSERT_BATCH_SIZE, IVF_MIN_ROWS)
+        store.embed_and_insert_records(_records(batch_start, batch_end, "file"))
+    queries = _queries(RECALL_CHECK_QUERIES, seed)
+    _, exact_ids = _timed_searches(store, queries)
+    ivf_store = LocalVectorStore(
+        "benchmark", settings, embedding_client, use_ivf_index=True
+    )
+    _, ids = _timed_searches(ivf_store, queries)
+    recall = _recall(ids, exact_ids)
+    if recall < MIN_IVF_RECALL:
+        raise RuntimeError(
+            f"IVF recall@10 with nprobe {DEFAULT_NPROBE} at {IVF_MIN_ROWS} rows "
+            f"is {recall:.3f}, below {MIN_IVF_RECALL}"
+        )
+
+
+def check_ivf_compaction(work_dir: str) -> None:
+    """
+    Inserts IVF_MIN_ROWS records into a local store with an IVF index,
+    searches once so the index is trained, inserts more records, then removes
+    the first ones so the store compacts. Raises RuntimeError if that fails,
+    or if the compacted store answers differently once reopened from disk.
+    """
+    settings = _settings(os.path.join(work_dir, "ivf-compaction"))
+    store = _ivf_store(settings)
+    store.embed_and_insert_records(_records(0, IVF_MIN_ROWS, "old"))
+    queries = _queries(CHECK_QUERIES)
+    store.search_vectors(queries[0])
+    new_records = _records(IVF_MIN_ROWS, IVF_MIN_ROWS * 8 // 5, "new")
+    store.embed_and_insert_records(new_records)
+    new_files = {record.metadata["file_path"] for record in new_records}
+    try:
+        store.remove_outdated_vectors(REPO_OWNER, REPO_NAME, new_files)
+    except Exception as e:
+        raise RuntimeError("Compacting an IVF-indexed local store failed") from e
+    reopened = _ivf_store(settings)
+    for query in queries:
+        results = [record.id for record in store.search_vectors(query)]
+        if results != [record.id for record in reopened.search_vectors(query)]:
+            raise RuntimeError("Compacted store differs from its files on disk")
+        if len(results) == 0 or any("#old" in record_id for record_id in results):
+            raise RuntimeError("Compacted store returned removed or no records")
+
+
+def _settings(directory: str) -> Settings:
+    return Settings(
+        github_token="benchmark",
+        openai_api_key="benchmark",
+        local_vector_store_dir=directory,
+    )
+
+
+def _ivf_store(settings: Settings) -> LocalVectorStore:
+    return LocalVectorStore(
+        "benchmark", settings, HashingEmbeddingClient(), use_ivf_index=True
+    )
+
+
+def _records(start: int, end: int, prefix: str) -> list[GenericRecord]:
+    records = []
+    for number in range(start, end):
+        file_path = f"{prefix}/{number // RECORDS_PER_FILE}.py"
+        rng = random.Random(number)
+        records.append(
+            GenericRecord(
+                id=f"{REPO_OWNER}#{REPO_NAME}#{file_path}#{number}",
+                unembedded_content=" ".join(rng.choices(WORDS, k=8)),
+                metadata={
+                    "repo_owner": REPO_OWNER,
+                    "repo_name": REPO_NAME,
+                    "file_path": file_path,
+                },
+            )
+        )
+    return records
+
+
+def _queries(count: int, seed: int = -1) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=3)) for _ in range(count)]
+
+
+def _timed_searches(
+    store: LocalVectorStore, queries: list[str], **kwargs
+) -> tuple[list[float], list[list[str]]]:
+    """Returns the latency in milliseconds and result IDs of each query."""
+    latencies = []
+    ids = []
+    for query in queries:
+        start = time.perf_counter()
+        records = store.search_vectors(query, top_k=TOP_K, **kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append([record.id for record in records])
+    return latencies, ids
+
+
+def _recall(ids: list[list[str]], exact_ids: list[list[str]]) -> float:
+    return statistics.mean(
+        len(set(found) & set(expected)) / len(expected)
+        for found, expected in zip(ids, exact_ids, strict=True)
+    )
+
+
+def _percentiles(latencies: list[float]) -> dict:
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
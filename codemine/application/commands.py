@@ -1,15 +1,67 @@
 import pydantic
 
+from codemine.domain.value_objects import (
+    BatchPriority,
+    CloneStrategy,
+    DeduplicationMode,
+    RepositoryRef,
+)
+
 
 class ProcessRepoCommand(pydantic.BaseModel):
     repo_owner: str
     repo_name: str
     remove_outdated_chunks: bool = True
+    outdated_chunks_dry_run: bool = False
     ignore_globs: list[str] = []
     create_index: bool = False
+    async_enrichment: bool = False
+    enrichment_concurrency: int = 16
+    enrichment_timeout: float = 60.0
+    incremental: bool = False
+    clone_strategy: CloneStrategy = "full"
+    chunking_workers: int = 1
+    resume: bool = False
+    deduplication: DeduplicationMode = "off"
 
 
 class RemoveOutdatedChunksCommand(pydantic.BaseModel):
     repo_owner: str
     repo_name: str
     new_files: list[str]
+    dry_run: bool = False
+
+
+class ReconcileManifestCommand(pydantic.BaseModel):
+    repo_owner: str
+    repo_name: str
+
+
+class EmbedManyReposCommand(pydantic.BaseModel):
+    batch_name: str
+    repositories: list[RepositoryRef]
+    priority: BatchPriority = "none"
+    max_parallel_repos: int = 4
+    restart: bool = False
+    create_index: bool = False
+    # Passed to the ProcessRepoCommand of every repository.
+    embed_options: dict = {}
+
+    @pydantic.field_validator("embed_options")
+    @classmethod
+    def _known_embed_options(cls, embed_options: dict) -> dict:
+        # The repository and whether to resume are set per job.
+        unknown = embed_options.keys() - (
+            ProcessRepoCommand.model_fields.keys()
+            - {"repo_owner", "repo_name", "resume"}
+        )
+        if unknown:
+            raise ValueError(f"Unknown embed options: {', '.join(sorted(unknown))}")
+        return embed_options
+
+
+class EstimateEnrichmentCommand(pydantic.BaseModel):
+    repo_owner: str
+    repo_name: str
+    ignore_globs: list[str] = []
+    clone_strategy: CloneStrategy = "shallow"
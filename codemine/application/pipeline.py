@@ -0,0 +1,155 @@
+import contextvars
+import queue
+import threading
+import time
+from collections.abc import Generator, Iterable
+
+from codemine.domain.ports.telemetry import NullTelemetry, Telemetry
+
+_PUT_TIMEOUT_SECONDS = 0.1
+# Histograms of the seconds a stage works on each item, excluding time blocked
+# on queues, and of the seconds each get and put blocks on a stage's queue.
+STAGE_BUSY_HISTOGRAM = "stage_busy_seconds"
+QUEUE_WAIT_HISTOGRAM = "queue_wait_seconds"
+
+# Seconds each thread has blocked getting items from stage queues, so a stage
+# can leave out the time its producer waited for the stage upstream.
+_thread_waits = threading.local()
+
+
+def _waited_seconds() -> float:
+    return getattr(_thread_waits, "seconds", 0.0)
+
+
+class _StageFinished:
+    pass
+
+
+class _StageFailed:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def run_in_background[T](
+    iterable: Iterable[T],
+    maxsize: int,
+    name: str,
+    telemetry: Telemetry | None = None,
+) -> Generator[T, None, None]:
+    """
+    Iterates iterable in a background thread and yields its items through a
+    queue holding at most maxsize items. A full queue blocks the producer, so
+    a slow consumer applies backpressure to every stage upstream of it.
+    Errors raised by the producer are re-raised in the consumer. Closing the
+    returned generator stops the producer after its current item.
+
+    The producer runs inside a span named after the stage, in a copy of the
+    context this is called from, so its spans nest under the span current
+    here rather than wherever iteration starts. As the span includes time
+    blocked on queues, the time spent producing each item is observed as
+    STAGE_BUSY_HISTOGRAM, and the time each get and put blocks as
+    QUEUE_WAIT_HISTOGRAM, labelled by stage and side.
+    """
+    return _run_stage(
+        iterable,
+        maxsize,
+        name,
+        telemetry or NullTelemetry(),
+        contextvars.copy_context(),
+    )
+
+
+def _run_stage[T](
+    iterable: Iterable[T],
+    maxsize: int,
+    name: str,
+    telemetry: Telemetry,
+    context: contextvars.Context,
+) -> Generator[T, None, None]:
+    items: queue.Queue = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        start = time.perf_counter()
+        try:
+            while not stop.is_set():
+                try:
+                    items.put(item, timeout=_PUT_TIMEOUT_SECONDS)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            telemetry.observe(
+                QUEUE_WAIT_HISTOGRAM,
+                time.perf_counter() - start,
+                stage=name,
+                side="put",
+            )
+
+    def produce() -> None:
+        try:
+            with telemetry.span(name):
+                iterator = iter(iterable)
+                while True:
+                    start = time.perf_counter()
+                    waited = _waited_seconds()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+                    telemetry.observe(
+                        STAGE_BUSY_HISTOGRAM,
+                        time.perf_counter() - start - (_waited_seconds() - waited),
+                        stage=name,
+                    )
+                    if not put(item):
+                        return
+            put(_StageFinished())
+        except BaseException as e:
+            put(_StageFailed(e))
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(
+        target=context.run, args=(produce,), name=name, daemon=True
+    )
+    thread.start()
+    try:
+        while True:
+            start = time.perf_counter()
+            item = items.get()
+            seconds = time.perf_counter() - start
+            _thread_waits.seconds = _waited_seconds() + seconds
+            telemetry.observe(QUEUE_WAIT_HISTOGRAM, seconds, stage=name, side="get")
+            if isinstance(item, _StageFinished):
+                return
+            if isinstance(item, _StageFailed):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def consume_in_stage[T](
+    iterable: Iterable[T],
+    name: str,
+    telemetry: Telemetry | None = None,
+) -> Generator[T, None, None]:
+    """
+    Yields the items of iterable to a stage that runs in the calling thread,
+    observing the time it spends on each item, until it asks for the next,
+    as STAGE_BUSY_HISTOGRAM like the stages of run_in_background.
+    """
+    telemetry = telemetry or NullTelemetry()
+    for item in iterable:
+        start = time.perf_counter()
+        try:
+            yield item
+        finally:
+            telemetry.observe(
+                STAGE_BUSY_HISTOGRAM, time.perf_counter() - start, stage=name
+            )
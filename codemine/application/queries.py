@@ -1,5 +1,18 @@
 import pydantic
 
+from codemine.domain.value_objects import SearchFilter, SearchMode
+
 
 class SearchEmbeddingsQuery(pydantic.BaseModel):
     query: str
+    top_k: int = 10
+    search_filter: SearchFilter | None = None
+    search_mode: SearchMode = "hybrid"
+
+
+class BatchSearchEmbeddingsQuery(pydantic.BaseModel):
+    queries: list[str]
+    top_k: int = 10
+    search_filter: SearchFilter | None = None
+    search_mode: SearchMode = "hybrid"
+    max_concurrency: int = 8
@@ -1,23 +1,89 @@
-from collections.abc import Iterable
+import asyncio
+import hashlib
+import json
+import secrets
+import threading
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator
+from contextlib import ExitStack, closing, contextmanager, nullcontext
+from itertools import batched, chain
 
 import structlog
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI
 
 from codemine.application.commands import ProcessRepoCommand
-from codemine.domain.model.code_document import ChunkedDocument
+from codemine.application.pipeline import consume_in_stage, run_in_background
+from codemine.domain.model.code_document import ChunkedDocument, CodeDocument
 from codemine.domain.ports.git_client import GitClient
-from codemine.domain.repositories.vector_store_repo import VectorIndexRepo
+from codemine.domain.ports.search_cache import INDEX_SCOPE, SearchCache, repo_scope
+from codemine.domain.ports.telemetry import NullTelemetry, Telemetry
+from codemine.domain.repositories.checkpoint_repo import CheckpointRepo
+from codemine.domain.repositories.chunk_manifest_repo import ChunkManifestRepo
+from codemine.domain.repositories.embed_state_repo import EmbedStateRepo
+from codemine.domain.repositories.lexical_index_repo import LexicalIndexRepo
+from codemine.domain.repositories.vector_store_repo import (
+    DEFAULT_DELETE_BATCH_SIZE,
+    VectorIndexRepo,
+)
+from codemine.domain.services.chunk_deduplication_service import (
+    ChunkDeduplicationService,
+)
 from codemine.domain.services.code_chunking_service import CodeChunkingService
 from codemine.domain.services.context_enrichment_service import ContextEnrichmentService
-from codemine.domain.value_objects import GenericRecord, GitDirectory
+from codemine.domain.value_objects import (
+    EmbedRunKey,
+    GenericRecord,
+    GitDiff,
+    GitDirectory,
+    ManifestEntry,
+    OutdatedVectorsReport,
+    file_path_from_chunk_id,
+)
 
 logger = structlog.get_logger()
 ENRICHMENT_BATCH_CHUNK_LIMIT = 50
-EMBEDDING_RECORD_BATCH_SIZE = 50
+# Maximum number of items buffered between two pipeline stages. Documents are
+# buffered after the walk and chunk stages, and enriched batches after the
+# enrich stage.
+PIPELINE_QUEUE_SIZE = 16
+# With checkpoints or a chunk manifest, records are upserted in groups of
+# about this many chunks. Once a whole group is upserted its files are
+# checkpointed and its manifest entries written, so only a group's entries
+# are held in memory.
+UPSERT_GROUP_CHUNKS = 1000
 
 
 class EmbedGitRepoUseCase:
-    """Coordinates the workflow to embed an entire Git repository."""
+    """
+    Coordinates the workflow to embed an entire Git repository.
+
+    The walk, chunk, enrich and upsert stages run concurrently, joined by
+    bounded queues so that memory use does not grow with the repository size.
+
+    With a chunk manifest, chunks whose content is unchanged since they were
+    last embedded are not upserted again, and outdated chunks are found from
+    the manifest instead of by listing the vector store.
+
+    With a checkpoint repo, each file's progress through the chunk, enrich and
+    upsert stages is recorded, so a failed run can be resumed. A resumed run
+    upserts the saved enriched documents without enriching them again and
+    skips files that were already upserted.
+
+    With a search cache, cached search results are invalidated once the run
+    finishes.
+
+    With a lexical index, every chunked file of the run is indexed, including
+    files whose chunks are unchanged, and the index is committed once the run
+    finishes.
+
+    With deduplication, chunks that repeat an earlier chunk of the run, or of
+    an earlier run of the same service, are not enriched but reuse its
+    context, and are still upserted with their own path.
+
+    With telemetry, each run is traced as an embed_repo span holding a span
+    for the clone and for each pipeline stage.
+    """
 
     def __init__(
         self,
@@ -26,58 +92,622 @@ class EmbedGitRepoUseCase:
         context_enrichment_service: ContextEnrichmentService,
         vector_store: VectorIndexRepo,
         openai_client: OpenAI,
+        async_openai_client: AsyncOpenAI | None = None,
+        embed_state_repo: EmbedStateRepo | None = None,
         git_client_token: str | None = None,
+        chunk_manifest_repo: ChunkManifestRepo | None = None,
+        clone_limiter: threading.Semaphore | None = None,
+        checkpoint_repo: CheckpointRepo | None = None,
+        search_cache: SearchCache | None = None,
+        lexical_index: LexicalIndexRepo | None = None,
+        telemetry: Telemetry | None = None,
+        chunk_deduplication_service: ChunkDeduplicationService | None = None,
     ) -> None:
         self.git_client = git_client
         self.code_chunking_service = code_chunking_service
         self.context_enrichment_service = context_enrichment_service
         self.vector_store = vector_store
         self.openai_client = openai_client
+        self.async_openai_client = async_openai_client
+        self.embed_state_repo = embed_state_repo
+        self.chunk_manifest_repo = chunk_manifest_repo
+        self.clone_limiter = clone_limiter
+        self.checkpoint_repo = checkpoint_repo
+        self.search_cache = search_cache
+        self.lexical_index = lexical_index
+        self.telemetry = telemetry or NullTelemetry()
+        self.chunk_deduplication_service = (
+            chunk_deduplication_service
+            or ChunkDeduplicationService(telemetry=self.telemetry)
+        )
 
     def execute(self, command: ProcessRepoCommand) -> dict:
         """Run the embed workflow for the repository defined by the command."""
+        with self.telemetry.span(
+            "embed_repo",
+            repository=f"{command.repo_owner}/{command.repo_name}",
+            clone_strategy=command.clone_strategy,
+        ) as span:
+            results = self._execute(command)
+            span.set(
+                **{name: value for name, value in results.items() if value is not None}
+            )
+        return results
+
+    def _execute(self, command: ProcessRepoCommand) -> dict:
         logger.bind(repo_owner=command.repo_owner, repo_name=command.repo_name).info(
             "Starting embed workflow"
         )
         logger.info("Cloning repository")
-        enriched_documents: list[ChunkedDocument] = []
-        total_chunks = 0
+        embedded_files: list[str] = []
+        # Marks the manifest entries this run writes, so the entries it did
+        # not write can be found in the manifest once it finishes.
+        run_id = secrets.token_hex(8)
+        listed_chunks = 0
+        known_hashes = self._get_known_hashes(command)
         if command.create_index:
             self.vector_store.create_index_if_not_exists()
-        with self.git_client.temporary_clone(
-            owner=command.repo_owner,
-            repo_name=command.repo_name,
-        ) as git_directory:
-            logger.info("Chunking repository")
-            chunked_documents = self._chunk_repository(
-                git_directory, command.ignore_globs
-            )
-            logger.info("Enriching documents")
-            for enriched_batch in self._enrich_documents_in_batches(
-                chunked_documents,
-                ENRICHMENT_BATCH_CHUNK_LIMIT,
+        with self._clone(command) as git_directory:
+            checkpoint = self._get_checkpoint_key(command, git_directory)
+            progress = self._load_progress(command, checkpoint)
+            enriched_before = [
+                document for stage, document in progress.values() if stage == "enriched"
+            ]
+            upserted_before = [
+                document for stage, document in progress.values() if stage == "upserted"
+            ]
+            diff = None
+            if command.incremental:
+                diff = self._get_incremental_diff(command, git_directory)
+            # Without a manifest, the outdated chunks of changed files are
+            # found by listing their records once the new ones are upserted.
+            stale_paths: set[str] = set()
+            if diff is not None and not known_hashes:
+                stale_paths = set(diff.stale_paths)
+            stale_chunk_ids: set[str] = set()
+            logger.info("Starting embed pipeline")
+            documents = run_in_background(
+                self._skip_documents(
+                    self._load_documents(
+                        git_directory,
+                        command.ignore_globs,
+                        only_paths=diff.changed_paths if diff is not None else None,
+                    ),
+                    {
+                        file_path
+                        for file_path, (stage, _) in progress.items()
+                        if stage != "chunked"
+                    },
+                ),
+                PIPELINE_QUEUE_SIZE,
+                name="walk",
+                telemetry=self.telemetry,
+            )
+            chunked_documents = run_in_background(
+                self._checkpoint_chunked(
+                    self._chunk_documents(documents, command.chunking_workers),
+                    checkpoint,
+                ),
+                PIPELINE_QUEUE_SIZE,
+                name="chunk",
+                telemetry=self.telemetry,
+            )
+            deduplication = None
+            if command.deduplication != "off":
+                deduplication = self.chunk_deduplication_service.start_run(
+                    self.context_enrichment_service.context_scope,
+                    near_duplicates=command.deduplication == "near",
+                )
+                chunked_documents = run_in_background(
+                    deduplication.unique_chunks(chunked_documents),
+                    PIPELINE_QUEUE_SIZE,
+                    name="dedup",
+                    telemetry=self.telemetry,
+                )
+            if command.async_enrichment:
+                enriched_batches = self._enrich_documents_in_batches_async(
+                    chunked_documents,
+                    max(ENRICHMENT_BATCH_CHUNK_LIMIT, command.enrichment_concurrency),
+                    command.enrichment_concurrency,
+                    command.enrichment_timeout,
+                )
+            else:
+                enriched_batches = self._enrich_documents_in_batches(
+                    chunked_documents,
+                    ENRICHMENT_BATCH_CHUNK_LIMIT,
+                )
+            if deduplication is not None:
+                enriched_batches = deduplication.with_duplicates(enriched_batches)
+            enriched_batches = self._checkpoint_enriched(enriched_batches, checkpoint)
+            if upserted_before:
+                # Already upserted, but their files and manifest entries are
+                # still part of this run.
+                _, listed_chunks = self._upsert_group(
+                    command,
+                    self._note_chunk_ids(
+                        [upserted_before], stale_paths, stale_chunk_ids
+                    ),
+                    embedded_files,
+                    known_hashes,
+                    git_directory.commit_sha,
+                    run_id,
+                    upsert=False,
+                )
+            with (
+                closing(
+                    run_in_background(
+                        enriched_batches,
+                        PIPELINE_QUEUE_SIZE,
+                        name="enrich",
+                        telemetry=self.telemetry,
+                    )
+                ) as enriched_batches,
+                self.telemetry.span("upsert"),
             ):
-                enriched_documents.extend(enriched_batch)
-                total_chunks += self._embed_documents_batch(enriched_batch)
+                total_chunks, upserted_listed_chunks = self._upsert_documents(
+                    command,
+                    consume_in_stage(
+                        self._note_chunk_ids(
+                            chain([enriched_before], enriched_batches)
+                            if enriched_before
+                            else enriched_batches,
+                            stale_paths,
+                            stale_chunk_ids,
+                        ),
+                        "upsert",
+                        self.telemetry,
+                    ),
+                    checkpoint,
+                    embedded_files,
+                    known_hashes,
+                    git_directory.commit_sha,
+                    run_id,
+                )
+                listed_chunks += upserted_listed_chunks
 
-        if command.remove_outdated_chunks:
-            self._remove_outdated_vectors(command, enriched_documents)
+        failed_removals = self._remove_stale_files(
+            command, stale_paths, stale_chunk_ids
+        )
+        outdated_report = None
+        if known_hashes and (diff is not None or command.remove_outdated_chunks):
+            outdated_report = self._remove_unlisted_chunks(
+                command, known_hashes, run_id, diff
+            )
+        elif command.remove_outdated_chunks and diff is None:
+            outdated_report = self._remove_outdated_vectors(command, embedded_files)
+        # A commit is only recorded once every stale file is removed, so the
+        # next incremental run retries the ones that failed.
+        if not command.outdated_chunks_dry_run and not failed_removals:
+            self._record_embedded_commit(command, git_directory)
+        if self.checkpoint_repo is not None:
+            self.checkpoint_repo.clear(
+                self.vector_store.index_name, command.repo_owner, command.repo_name
+            )
+        if self.lexical_index is not None:
+            with self.telemetry.span("lexical_index"):
+                self._update_lexical_index(command, embedded_files, diff)
+        if self.search_cache is not None:
+            self.search_cache.invalidate(
+                INDEX_SCOPE, repo_scope(command.repo_owner, command.repo_name)
+            )
 
-        return {
-            "chunked_files": len(enriched_documents),
+        results = {
+            "chunked_files": len(embedded_files),
             "total_chunks": total_chunks,
             "index_name": self.vector_store.index_name,
+            "mode": "incremental" if diff is not None else "full",
+            "commit_sha": git_directory.commit_sha,
         }
+        if diff is not None:
+            results["removed_files"] = len(diff.stale_paths) - len(failed_removals)
+        if failed_removals:
+            results["failed_removals"] = failed_removals
+        if progress:
+            results["resumed_files"] = len(enriched_before) + len(upserted_before)
+        if self.chunk_manifest_repo is not None:
+            results["skipped_chunks"] = listed_chunks - total_chunks
+        if outdated_report is not None:
+            results["outdated_vectors"] = outdated_report.outdated_vectors
+            results["outdated_files"] = outdated_report.outdated_files
+            results["outdated_dry_run"] = outdated_report.dry_run
+        if deduplication is not None:
+            deduplication.report()
+            results["duplicate_chunks"] = deduplication.duplicate_chunks
+            results["near_duplicate_chunks"] = deduplication.near_duplicate_chunks
+            results["dedup_ratio"] = deduplication.ratio
+            results["dedup_saved_tokens"] = deduplication.saved_tokens
+        enrichment_cache = self.context_enrichment_service.cache
+        if enrichment_cache is not None:
+            enrichment_cache.flush()
+            results["enrichment_cache_hits"] = enrichment_cache.hits
+            results["enrichment_cache_misses"] = enrichment_cache.misses
+        return results
 
-    def _chunk_repository(
+    @contextmanager
+    def _clone(self, command: ProcessRepoCommand) -> Iterator[GitDirectory]:
+        """Clones the repository, holding a clone_limiter slot only while cloning."""
+        clone = self.git_client.temporary_clone(
+            owner=command.repo_owner,
+            repo_name=command.repo_name,
+            strategy=command.clone_strategy,
+            sparse_extensions=self.code_chunking_service.supported_extensions,
+        )
+        with ExitStack() as stack:
+            with self.clone_limiter or nullcontext():
+                git_directory = stack.enter_context(clone)
+            yield git_directory
+
+    def _get_incremental_diff(
+        self, command: ProcessRepoCommand, git_directory: GitDirectory
+    ) -> GitDiff | None:
+        """
+        Returns the changes since the last embedded commit, or None when a full
+        embed is needed because there is no usable previous commit.
+        """
+        if self.embed_state_repo is None:
+            raise ValueError("Incremental embedding requires an embed state repo")
+        last_commit = self.embed_state_repo.get_last_embedded_commit(
+            self.vector_store.index_name, command.repo_owner, command.repo_name
+        )
+        if last_commit is None:
+            logger.info("No previously embedded commit, running full embed")
+            return None
+        try:
+            return self.git_client.diff_files(git_directory, last_commit)
+        except ValueError:
+            logger.bind(last_commit=last_commit).warning(
+                "Previously embedded commit not in history, running full embed"
+            )
+            return None
+
+    def _get_checkpoint_key(
+        self, command: ProcessRepoCommand, git_directory: GitDirectory
+    ) -> EmbedRunKey | None:
+        if self.checkpoint_repo is None or git_directory.commit_sha is None:
+            return None
+        return EmbedRunKey(
+            index_name=self.vector_store.index_name,
+            repo_owner=command.repo_owner,
+            repo_name=command.repo_name,
+            commit_sha=git_directory.commit_sha,
+        )
+
+    def _load_progress(
+        self, command: ProcessRepoCommand, checkpoint: EmbedRunKey | None
+    ) -> dict:
+        """
+        Returns the progress of the run being resumed. Without resume, or for
+        a run of another commit, previous checkpoints are discarded.
+        """
+        if checkpoint is None:
+            return {}
+        progress = {}
+        if command.resume:
+            progress = self.checkpoint_repo.get_progress(checkpoint)
+        if not progress:
+            self.checkpoint_repo.clear(
+                checkpoint.index_name, checkpoint.repo_owner, checkpoint.repo_name
+            )
+            return {}
+        stages = [stage for stage, _ in progress.values()]
+        logger.bind(
+            commit_sha=checkpoint.commit_sha,
+            chunked=stages.count("chunked"),
+            enriched=stages.count("enriched"),
+            upserted=stages.count("upserted"),
+        ).info("Resuming embed run from checkpoint")
+        return progress
+
+    @staticmethod
+    def _skip_documents(
+        documents: Iterable[CodeDocument], skip_paths: set[str]
+    ) -> Iterable[CodeDocument]:
+        for document in documents:
+            if document.file_path not in skip_paths:
+                yield document
+
+    def _checkpoint_chunked(
+        self, documents: Iterable[ChunkedDocument], checkpoint: EmbedRunKey | None
+    ) -> Iterable[ChunkedDocument]:
+        for document in documents:
+            if checkpoint is not None:
+                self.checkpoint_repo.mark_chunked(checkpoint, [document.file_path])
+            yield document
+
+    def _checkpoint_enriched(
+        self,
+        batches: Iterable[list[ChunkedDocument]],
+        checkpoint: EmbedRunKey | None,
+    ) -> Iterable[list[ChunkedDocument]]:
+        for batch in batches:
+            if checkpoint is not None:
+                self.checkpoint_repo.save_enriched(checkpoint, batch)
+            yield batch
+
+    def _upsert_documents(
+        self,
+        command: ProcessRepoCommand,
+        batches: Iterable[list[ChunkedDocument]],
+        checkpoint: EmbedRunKey | None,
+        embedded_files: list[str],
+        known_hashes: dict[str, str],
+        commit_sha: str | None,
+        run_id: str,
+    ) -> tuple[int, int]:
+        """
+        Upserts the records of every document, returning the chunks upserted
+        and listed in the manifest. With a checkpoint or a manifest, records
+        are upserted in groups, so each group's files can be marked as
+        upserted and its manifest entries written.
+        """
+        if checkpoint is None and self.chunk_manifest_repo is None:
+            groups: Iterable[Iterable[list[ChunkedDocument]]] = [batches]
+        else:
+            groups = self._group_batches(batches, UPSERT_GROUP_CHUNKS)
+        total_chunks = 0
+        listed_chunks = 0
+        for group in groups:
+            upserted, listed = self._upsert_group(
+                command, group, embedded_files, known_hashes, commit_sha, run_id
+            )
+            total_chunks += upserted
+            listed_chunks += listed
+            if checkpoint is not None:
+                self.checkpoint_repo.mark_upserted(
+                    checkpoint,
+                    [document.file_path for batch in group for document in batch],
+                )
+        return total_chunks, listed_chunks
+
+    def _upsert_group(
+        self,
+        command: ProcessRepoCommand,
+        group: Iterable[list[ChunkedDocument]],
+        embedded_files: list[str],
+        known_hashes: dict[str, str],
+        commit_sha: str | None,
+        run_id: str,
+        upsert: bool = True,
+    ) -> tuple[int, int]:
+        """
+        Upserts the group's records whose content changed, then writes the
+        manifest entry of every record of the group, and returns the chunks
+        upserted and listed. Without upsert, the group was already upserted
+        by the run being resumed, and only its entries are written.
+        """
+        entries: list[ManifestEntry] = []
+        records = self._records_for_manifest(
+            self._generate_records(group, embedded_files),
+            known_hashes,
+            commit_sha,
+            entries,
+        )
+        upserted = 0
+        if upsert:
+            upserted = self.vector_store.embed_and_insert_records_bulk(records)
+        else:
+            deque(records, maxlen=0)
+        if self.chunk_manifest_repo is not None:
+            self.chunk_manifest_repo.upsert_chunks(
+                self.vector_store.index_name,
+                command.repo_owner,
+                command.repo_name,
+                entries,
+                run_id,
+            )
+        return upserted, len(entries)
+
+    @staticmethod
+    def _group_batches(
+        batches: Iterable[list[ChunkedDocument]], chunk_limit: int
+    ) -> Iterable[list[list[ChunkedDocument]]]:
+        group: list[list[ChunkedDocument]] = []
+        chunk_count = 0
+        for batch in batches:
+            group.append(batch)
+            chunk_count += sum(len(document.chunks) for document in batch)
+            if chunk_count >= chunk_limit:
+                yield group
+                group = []
+                chunk_count = 0
+        if group:
+            yield group
+
+    def _records_for_manifest(
+        self,
+        records: Iterable[GenericRecord],
+        known_hashes: dict[str, str],
+        commit_sha: str | None,
+        manifest_entries: list[ManifestEntry],
+    ) -> Iterable[GenericRecord]:
+        if self.chunk_manifest_repo is None:
+            return records
+        return self._skip_unchanged_records(
+            records, known_hashes, commit_sha, manifest_entries
+        )
+
+    def _get_known_hashes(self, command: ProcessRepoCommand) -> dict[str, str]:
+        if self.chunk_manifest_repo is None:
+            return {}
+        return self.chunk_manifest_repo.get_content_hashes(
+            self.vector_store.index_name, command.repo_owner, command.repo_name
+        )
+
+    def _skip_unchanged_records(
+        self,
+        records: Iterable[GenericRecord],
+        known_hashes: dict[str, str],
+        commit_sha: str | None,
+        manifest_entries: list[ManifestEntry],
+    ) -> Iterable[GenericRecord]:
+        """
+        Notes a manifest entry for every record, yielding only those whose
+        content hash differs from the one last embedded.
+        """
+        model_version = self.vector_store.model_version
+        for record in records:
+            content_hash = self._content_hash(record, model_version)
+            manifest_entries.append(
+                ManifestEntry(
+                    chunk_id=record.id,
+                    file_path=record.metadata["file_path"],
+                    content_hash=content_hash,
+                    commit_sha=commit_sha,
+                    model_version=model_version,
+                )
+            )
+            if known_hashes.get(record.id) != content_hash:
+                yield record
+
+    @staticmethod
+    def _content_hash(record: GenericRecord, model_version: str) -> str:
+        hasher = hashlib.sha256()
+        for part in (
+            model_version,
+            record.unembedded_content,
+            json.dumps(record.metadata, sort_keys=True),
+        ):
+            hasher.update(part.encode("utf-8"))
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+
+    def _remove_unlisted_chunks(
+        self,
+        command: ProcessRepoCommand,
+        known_hashes: dict[str, str],
+        run_id: str,
+        diff: GitDiff | None,
+    ) -> OutdatedVectorsReport:
+        """
+        Removes manifest chunks that were not written by this run, found page
+        by page in the manifest. A full run considers every chunk of the repo,
+        an incremental run only the chunks of files in the diff.
+        """
+        start = time.perf_counter()
+        file_paths = None
+        scanned = len(known_hashes)
+        if diff is not None:
+            file_paths = set(diff.stale_paths)
+            scanned = sum(
+                file_path_from_chunk_id(chunk_id, command.repo_owner, command.repo_name)
+                in file_paths
+                for chunk_id in known_hashes
+            )
+        report = OutdatedVectorsReport(
+            scanned_vectors=scanned, dry_run=command.outdated_chunks_dry_run
+        )
+        outdated_files: set[str] = set()
+        for page in self.chunk_manifest_repo.list_chunks_not_in_run(
+            self.vector_store.index_name,
+            command.repo_owner,
+            command.repo_name,
+            run_id,
+            file_paths,
+        ):
+            report.outdated_vectors += len(page)
+            outdated_files.update(
+                file_path_from_chunk_id(chunk_id, command.repo_owner, command.repo_name)
+                for chunk_id in page
+            )
+            if command.outdated_chunks_dry_run:
+                continue
+            for batch in batched(page, DEFAULT_DELETE_BATCH_SIZE):
+                self.vector_store.remove_records_by_id(list(batch))
+                self.chunk_manifest_repo.remove_chunks(
+                    self.vector_store.index_name,
+                    command.repo_owner,
+                    command.repo_name,
+                    batch,
+                )
+        report.outdated_files = len(outdated_files)
+        report.seconds = round(time.perf_counter() - start, 3)
+        logger.bind(
+            repo_owner=command.repo_owner,
+            repo_name=command.repo_name,
+            **report.model_dump(),
+        ).info("Removed outdated chunks listed in the manifest")
+        return report
+
+    @staticmethod
+    def _note_chunk_ids(
+        batches: Iterable[list[ChunkedDocument]],
+        file_paths: set[str],
+        chunk_ids: set[str],
+    ) -> Iterable[list[ChunkedDocument]]:
+        """Adds the chunk IDs of documents of file_paths to chunk_ids."""
+        for batch in batches:
+            for document in batch:
+                if document.file_path in file_paths:
+                    chunk_ids.update(chunk.id for chunk in document.chunks)
+            yield batch
+
+    def _remove_stale_files(
+        self,
+        command: ProcessRepoCommand,
+        stale_paths: set[str],
+        upserted_ids: set[str],
+    ) -> list[str]:
+        """
+        Removes the records of stale files, except those upserted by this run,
+        returning the files whose records could not be removed.
+        """
+        failed = []
+        for file_path in sorted(stale_paths):
+            if not self.code_chunking_service.is_supported_file(file_path):
+                continue
+            try:
+                removed = self.vector_store.remove_file_records(
+                    command.repo_owner, command.repo_name, file_path, upserted_ids
+                )
+            except Exception as e:
+                logger.bind(file_path=file_path, error=str(e)).warning(
+                    "Could not remove vectors for changed file"
+                )
+                failed.append(file_path)
+                continue
+            logger.bind(file_path=file_path, removed=removed).info(
+                "Removed vectors for changed file"
+            )
+        return failed
+
+    def _record_embedded_commit(
+        self, command: ProcessRepoCommand, git_directory: GitDirectory
+    ) -> None:
+        if self.embed_state_repo is None or git_directory.commit_sha is None:
+            return
+        self.embed_state_repo.set_last_embedded_commit(
+            self.vector_store.index_name,
+            command.repo_owner,
+            command.repo_name,
+            git_directory.commit_sha,
+        )
+
+    def _load_documents(
         self,
         git_directory: GitDirectory,
         ignore_globs: list[str] | None = None,
-    ) -> Iterable[ChunkedDocument]:
+        only_paths: list[str] | None = None,
+    ) -> Iterable[CodeDocument]:
         ignore_globs = ignore_globs or []
-        for document in self.code_chunking_service.walk_directory(
-            git_directory, ignore_globs
-        ):
+        if only_paths is None:
+            return self.code_chunking_service.walk_directory(
+                git_directory, ignore_globs
+            )
+        return self.code_chunking_service.load_documents(
+            git_directory, only_paths, ignore_globs
+        )
+
+    def _chunk_documents(
+        self,
+        documents: Iterable[CodeDocument],
+        workers: int = 1,
+    ) -> Iterable[ChunkedDocument]:
+        if workers > 1:
+            yield from self.code_chunking_service.chunk_documents_parallel(
+                documents, workers
+            )
+            return
+        for document in documents:
             yield self.code_chunking_service.chunk_document(document)
 
     def _enrich_documents_in_batches(
@@ -101,42 +731,97 @@ class EmbedGitRepoUseCase:
         if batch:
             yield batch
 
-    def _embed_documents_batch(self, documents: list[ChunkedDocument]) -> int:
-        if not documents:
-            return 0
-        logger.bind(batch_size=len(documents)).info("Building records for batch")
-        records = self._build_records(documents)
-        logger.bind(record_count=len(records)).info("Embedding records batch")
-        for start_index in range(0, len(records), EMBEDDING_RECORD_BATCH_SIZE):
-            record_batch = records[
-                start_index : start_index + EMBEDDING_RECORD_BATCH_SIZE
-            ]
-            logger.bind(record_batch_size=len(record_batch)).info(
-                "Embedding record sub-batch"
-            )
-            self.vector_store.embed_and_insert_records(record_batch)
-        return len(records)
+    def _enrich_documents_in_batches_async(
+        self,
+        documents: Iterable[ChunkedDocument],
+        chunk_limit: int,
+        max_concurrency: int,
+        request_timeout: float,
+    ) -> Iterable[list[ChunkedDocument]]:
+        if self.async_openai_client is None:
+            raise ValueError("Async enrichment requires an async OpenAI client")
+        # An async HTTP connection pool is bound to the event loop that first
+        # uses it, so each run, which has its own loop, gets its own pool.
+        client = self.async_openai_client.copy(http_client=DefaultAsyncHttpxClient())
+        with asyncio.Runner() as runner:
+            try:
+                for batch in self._batch_documents(documents, chunk_limit):
+                    logger.bind(
+                        batch_size=len(batch), max_concurrency=max_concurrency
+                    ).info("Enriching document batch concurrently")
+                    yield runner.run(
+                        self.context_enrichment_service.enrich_documents_async(
+                            client,
+                            batch,
+                            max_concurrency=max_concurrency,
+                            request_timeout=request_timeout,
+                        )
+                    )
+            finally:
+                runner.run(client.close())
 
-    def _build_records(
-        self, documents: Iterable[ChunkedDocument]
-    ) -> list[GenericRecord]:
-        records: list[GenericRecord] = []
+    def _batch_documents(
+        self,
+        documents: Iterable[ChunkedDocument],
+        chunk_limit: int,
+    ) -> Iterable[list[ChunkedDocument]]:
+        batch: list[ChunkedDocument] = []
+        chunk_count = 0
         for document in documents:
-            for chunk in document.chunks:
-                records.append(chunk.generic_record)
-        return records
+            batch.append(document)
+            chunk_count += len(document.chunks)
+            if chunk_count >= chunk_limit:
+                yield batch
+                batch = []
+                chunk_count = 0
+        if batch:
+            yield batch
 
-    def _remove_outdated_vectors(
+    def _generate_records(
+        self,
+        batches: Iterable[list[ChunkedDocument]],
+        embedded_files: list[str],
+    ) -> Iterable[GenericRecord]:
+        """Yields a record per chunk, noting each document's path as it goes."""
+        for batch in batches:
+            if self.lexical_index is not None:
+                self.lexical_index.replace_documents(batch)
+            for document in batch:
+                embedded_files.append(document.file_path)
+                for chunk in document.chunks:
+                    yield chunk.generic_record
+
+    def _update_lexical_index(
         self,
         command: ProcessRepoCommand,
-        documents: Iterable[ChunkedDocument],
+        embedded_files: list[str],
+        diff: GitDiff | None,
     ) -> None:
+        """Removes files the run found outdated and commits the lexical index."""
+        if not command.outdated_chunks_dry_run:
+            if diff is not None:
+                self.lexical_index.remove_files(
+                    command.repo_owner,
+                    command.repo_name,
+                    set(diff.stale_paths) - set(embedded_files),
+                )
+            elif command.remove_outdated_chunks:
+                self.lexical_index.retain_files(
+                    command.repo_owner, command.repo_name, embedded_files
+                )
+        self.lexical_index.commit()
+
+    def _remove_outdated_vectors(
+        self,
+        command: ProcessRepoCommand,
+        new_files: list[str],
+    ) -> OutdatedVectorsReport:
         logger.bind(repo_owner=command.repo_owner, repo_name=command.repo_name).info(
             "Searching for outdated vectors"
         )
-        new_files = [document.file_path for document in documents]
-        self.vector_store.remove_outdated_vectors(
+        return self.vector_store.remove_outdated_vectors(
             repo_owner=command.repo_owner,
             repo_name=command.repo_name,
             new_files=new_files,
+            dry_run=command.outdated_chunks_dry_run,
         )
@@ -0,0 +1,142 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import structlog
+
+from codemine.application.commands import EmbedManyReposCommand, ProcessRepoCommand
+from codemine.application.use_cases.embed_git_repo import EmbedGitRepoUseCase
+from codemine.domain.ports.git_client import GitClient
+from codemine.domain.repositories.embed_state_repo import EmbedStateRepo
+from codemine.domain.repositories.job_state_repo import JobStateRepo
+from codemine.domain.value_objects import BatchJob, BatchPriority, RepositoryRef
+
+logger = structlog.get_logger()
+
+
+class EmbedManyReposUseCase:
+    """
+    Embeds a batch of repositories, running up to max_parallel_repos embed
+    runs at once through a single EmbedGitRepoUseCase, so every run shares its
+    clients and their concurrency limits.
+
+    Job state is saved as each repository starts and finishes. Rerunning a
+    batch skips the repositories that already succeeded, and a repository that
+    fails is recorded without stopping the others.
+    """
+
+    def __init__(
+        self,
+        embed_git_repo_use_case: EmbedGitRepoUseCase,
+        job_state_repo: JobStateRepo,
+        git_client: GitClient,
+        embed_state_repo: EmbedStateRepo | None = None,
+    ):
+        self.embed_git_repo_use_case = embed_git_repo_use_case
+        self.job_state_repo = job_state_repo
+        self.git_client = git_client
+        self.embed_state_repo = embed_state_repo
+
+    def execute(self, command: EmbedManyReposCommand) -> list[BatchJob]:
+        if command.restart:
+            self.job_state_repo.clear_batch(command.batch_name)
+        self.job_state_repo.add_jobs(command.batch_name, command.repositories)
+        requested = {repository.full_name for repository in command.repositories}
+        jobs = [
+            job
+            for job in self.job_state_repo.get_jobs(command.batch_name)
+            if job.repository.full_name in requested
+        ]
+        pending = self._prioritise(
+            [job for job in jobs if job.status != "succeeded"], command.priority
+        )
+        logger.bind(
+            batch_name=command.batch_name,
+            repositories=len(jobs),
+            pending=len(pending),
+        ).info("Starting batch embed")
+        if pending and command.create_index:
+            self.embed_git_repo_use_case.vector_store.create_index_if_not_exists()
+        with ThreadPoolExecutor(max_workers=command.max_parallel_repos) as executor:
+            for future in [
+                executor.submit(self._run_job, command, job) for job in pending
+            ]:
+                future.result()
+        return [
+            job
+            for job in self.job_state_repo.get_jobs(command.batch_name)
+            if job.repository.full_name in requested
+        ]
+
+    def _run_job(self, command: EmbedManyReposCommand, job: BatchJob) -> None:
+        repository = job.repository
+        job.status = "running"
+        job.attempts += 1
+        job.error = None
+        self.job_state_repo.save_job(command.batch_name, job)
+        start = time.perf_counter()
+        try:
+            results = self.embed_git_repo_use_case.execute(
+                ProcessRepoCommand(
+                    repo_owner=repository.owner,
+                    repo_name=repository.name,
+                    **command.embed_options,
+                    # Picks up from the checkpoints of a previous failed attempt.
+                    resume=job.attempts > 1,
+                )
+            )
+            job.status = "succeeded"
+            job.chunked_files = results["chunked_files"]
+            job.total_chunks = results["total_chunks"]
+            if "failed_removals" in results:
+                # The vectors of these files are still in the index, so the
+                # job is retried.
+                job.status = "failed"
+                job.error = (
+                    "Could not remove the vectors of "
+                    f"{len(results['failed_removals'])} changed files"
+                )
+        except Exception as e:
+            logger.bind(repository=repository.full_name).exception(
+                "Embedding repository failed"
+            )
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            job.seconds = round(time.perf_counter() - start, 3)
+            self.job_state_repo.save_job(command.batch_name, job)
+
+    def _prioritise(
+        self, jobs: list[BatchJob], priority: BatchPriority
+    ) -> list[BatchJob]:
+        match priority:
+            case "size":
+                # Largest first, so long runs do not end up alone at the tail.
+                for job in jobs:
+                    if job.repository.size_kb is None:
+                        job.repository = self._describe(job)
+                return sorted(jobs, key=lambda job: -(job.repository.size_kb or 0))
+            case "stale":
+                # Never embedded first, then least recently embedded.
+                return sorted(jobs, key=lambda job: self._last_embedded_at(job) or 0)
+            case _:
+                return jobs
+
+    def _describe(self, job: BatchJob) -> RepositoryRef:
+        try:
+            return self.git_client.describe_repository(
+                job.repository.owner, job.repository.name
+            )
+        except Exception:
+            logger.bind(repository=job.repository.full_name).warning(
+                "Could not describe repository"
+            )
+            return job.repository
+
+    def _last_embedded_at(self, job: BatchJob) -> float | None:
+        if self.embed_state_repo is None:
+            return None
+        return self.embed_state_repo.get_last_embedded_at(
+            self.embed_git_repo_use_case.vector_store.index_name,
+            job.repository.owner,
+            job.repository.name,
+        )
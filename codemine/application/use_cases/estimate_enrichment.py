@@ -0,0 +1,76 @@
+import structlog
+
+from codemine.application.commands import EstimateEnrichmentCommand
+from codemine.domain.ports.git_client import GitClient
+from codemine.domain.services.code_chunking_service import CodeChunkingService
+from codemine.domain.services.context_enrichment_service import ContextEnrichmentService
+from codemine.domain.value_objects import EnrichmentEstimate, EnrichmentStrategy
+
+logger = structlog.get_logger()
+STRATEGIES: tuple[EnrichmentStrategy, ...] = ("chunk", "document")
+
+
+class EstimateEnrichmentUseCase:
+    """
+    Estimates the requests, tokens and cost of enriching a repository with
+    each enrichment strategy, without calling the LLM. Cached contexts are
+    not taken into account.
+    """
+
+    def __init__(
+        self,
+        git_client: GitClient,
+        code_chunking_service: CodeChunkingService,
+        context_enrichment_service: ContextEnrichmentService,
+        input_cost_per_million: float,
+        output_cost_per_million: float,
+    ):
+        self.git_client = git_client
+        self.code_chunking_service = code_chunking_service
+        self.context_enrichment_service = context_enrichment_service
+        self.input_cost_per_million = input_cost_per_million
+        self.output_cost_per_million = output_cost_per_million
+
+    def execute(self, command: EstimateEnrichmentCommand) -> dict:
+        logger.bind(repo_owner=command.repo_owner, repo_name=command.repo_name).info(
+            "Estimating enrichment"
+        )
+        estimates = {strategy: EnrichmentEstimate() for strategy in STRATEGIES}
+        documents = 0
+        chunks = 0
+        with self.git_client.temporary_clone(
+            owner=command.repo_owner,
+            repo_name=command.repo_name,
+            strategy=command.clone_strategy,
+            sparse_extensions=self.code_chunking_service.supported_extensions,
+        ) as git_directory:
+            for document in self.code_chunking_service.walk_directory(
+                git_directory, command.ignore_globs
+            ):
+                chunked_document = self.code_chunking_service.chunk_document(document)
+                documents += 1
+                chunks += len(chunked_document.chunks)
+                for strategy in STRATEGIES:
+                    estimates[strategy] += (
+                        self.context_enrichment_service.estimate_document(
+                            chunked_document, strategy
+                        )
+                    )
+        results = {
+            "documents": documents,
+            "chunks": chunks,
+            "strategies": {
+                strategy: {
+                    **estimate.model_dump(),
+                    "cost": round(
+                        estimate.cost(
+                            self.input_cost_per_million, self.output_cost_per_million
+                        ),
+                        4,
+                    ),
+                }
+                for strategy, estimate in estimates.items()
+            },
+        }
+        logger.bind(documents=documents, chunks=chunks).info("Estimated enrichment")
+        return results
@@ -0,0 +1,66 @@
+import structlog
+
+from codemine.application.commands import ReconcileManifestCommand
+from codemine.domain.repositories.chunk_manifest_repo import ChunkManifestRepo
+from codemine.domain.repositories.vector_store_repo import VectorIndexRepo
+from codemine.domain.value_objects import ManifestEntry, file_path_from_chunk_id
+
+logger = structlog.get_logger()
+
+
+class ReconcileManifestUseCase:
+    """
+    Rebuilds a repo's chunk manifest from the IDs in the vector store. Entries
+    for chunks missing from the store are dropped, and chunks only found in
+    the store are added without a content hash so the next embed upserts them.
+    """
+
+    def __init__(
+        self, vector_store: VectorIndexRepo, chunk_manifest_repo: ChunkManifestRepo
+    ):
+        self.vector_store = vector_store
+        self.chunk_manifest_repo = chunk_manifest_repo
+
+    def execute(self, command: ReconcileManifestCommand) -> dict:
+        index_name = self.vector_store.index_name
+        logger.bind(repo_owner=command.repo_owner, repo_name=command.repo_name).info(
+            "Reconciling chunk manifest"
+        )
+        stored_ids = set()
+        for page in self.vector_store.list_record_ids(
+            command.repo_owner, command.repo_name
+        ):
+            stored_ids.update(page)
+        known_ids = set(
+            self.chunk_manifest_repo.get_content_hashes(
+                index_name, command.repo_owner, command.repo_name
+            )
+        )
+        missing_ids = known_ids - stored_ids
+        unlisted_ids = stored_ids - known_ids
+        self.chunk_manifest_repo.remove_chunks(
+            index_name, command.repo_owner, command.repo_name, missing_ids
+        )
+        self.chunk_manifest_repo.upsert_chunks(
+            index_name,
+            command.repo_owner,
+            command.repo_name,
+            (
+                ManifestEntry(
+                    chunk_id=chunk_id,
+                    file_path=file_path_from_chunk_id(
+                        chunk_id, command.repo_owner, command.repo_name
+                    ),
+                    content_hash="",
+                    model_version=self.vector_store.model_version,
+                )
+                for chunk_id in unlisted_ids
+            ),
+        )
+        results = {
+            "stored_chunks": len(stored_ids),
+            "removed_entries": len(missing_ids),
+            "added_entries": len(unlisted_ids),
+        }
+        logger.bind(**results).info("Reconciled chunk manifest")
+        return results
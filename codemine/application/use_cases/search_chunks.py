@@ -1,18 +1,239 @@
+import hashlib
+import time
+from collections.abc import Iterable, Iterator
+from itertools import batched
+
 import structlog
 
-from codemine.application.queries import SearchEmbeddingsQuery
+from codemine.application.queries import (
+    BatchSearchEmbeddingsQuery,
+    SearchEmbeddingsQuery,
+)
+from codemine.domain.ports.search_cache import INDEX_SCOPE, SearchCache, repo_scope
+from codemine.domain.repositories.lexical_index_repo import LexicalIndexRepo
 from codemine.domain.repositories.vector_store_repo import VectorIndexRepo
-from codemine.domain.value_objects import EmbeddedRecord
+from codemine.domain.value_objects import (
+    EmbeddedRecord,
+    GenericRecord,
+    SearchFilter,
+    SearchMode,
+)
 
 logger = structlog.get_logger()
 
+# Constant of reciprocal rank fusion; larger values flatten the weight of the
+# top ranks.
+RRF_K = 60
+# Hybrid search fuses this many candidates per requested result from each
+# ranking.
+HYBRID_CANDIDATES_PER_RESULT = 3
+# Queries of a batch search searched by the lexical index at once.
+LEXICAL_BATCH_SIZE = 64
+
 
 class SearchChunksUseCase:
-    def __init__(self, vector_store: VectorIndexRepo):
+    """
+    With a search cache, results are cached by the query, top_k, filter, the
+    index and its embedding model, and the generation of the searched scope,
+    which every finished embed run bumps. A search filtered to one repository
+    is only invalidated by embed runs of that repository.
+
+    With a lexical index, hybrid searches fuse the vector and lexical rankings
+    with reciprocal rank fusion. Without one, hybrid searches are vector
+    searches.
+    """
+
+    def __init__(
+        self,
+        vector_store: VectorIndexRepo,
+        search_cache: SearchCache | None = None,
+        lexical_index: LexicalIndexRepo | None = None,
+        rrf_k: int = RRF_K,
+    ):
         self.vector_store = vector_store
+        self.search_cache = search_cache
+        self.lexical_index = lexical_index
+        self.rrf_k = rrf_k
 
     def execute(self, query: SearchEmbeddingsQuery) -> list[EmbeddedRecord]:
         logger.bind(query=query.query).info("Searching for chunks")
-        results = self.vector_store.search_vectors(query.query)
-        logger.bind(results=len(results)).info("Found chunks")
+        start = time.perf_counter()
+        cache_key = None
+        if self.search_cache is not None:
+            cache_key = self.cache_key(query)
+            results = self.search_cache.get(cache_key)
+            if results is not None:
+                seconds = time.perf_counter() - start
+                self.search_cache.record_latency(hit=True, seconds=seconds)
+                logger.bind(results=len(results), seconds=round(seconds, 4)).info(
+                    "Found cached chunks"
+                )
+                return results
+        mode = self._resolve_mode(query.search_mode)
+        vector_results = lexical_results = None
+        if mode != "lexical":
+            vector_results = self.vector_store.search_vectors(
+                query.query,
+                top_k=self._candidates(mode, query.top_k),
+                search_filter=query.search_filter,
+            )
+        if mode != "vector":
+            lexical_results = self.lexical_index.search(
+                query.query,
+                top_k=self._candidates(mode, query.top_k),
+                search_filter=query.search_filter,
+            )
+        results = self._combine(vector_results, lexical_results, query.top_k)
+        if self.search_cache is not None:
+            self.search_cache.set(cache_key, results)
+            self.search_cache.record_latency(
+                hit=False, seconds=time.perf_counter() - start
+            )
+        logger.bind(
+            results=len(results), seconds=round(time.perf_counter() - start, 4)
+        ).info("Found chunks")
         return results
+
+    def execute_batch(
+        self, query: BatchSearchEmbeddingsQuery
+    ) -> Iterator[list[GenericRecord]]:
+        """
+        Yields the results of each query in order. Cached results are served
+        from the search cache and the rest are searched as one batch.
+        """
+        logger.bind(queries=len(query.queries)).info("Searching for chunks in batch")
+        start = time.perf_counter()
+        single_queries = [
+            SearchEmbeddingsQuery(
+                query=text,
+                top_k=query.top_k,
+                search_filter=query.search_filter,
+                search_mode=query.search_mode,
+            )
+            for text in query.queries
+        ]
+        cache_keys: list[str | None] = [None] * len(single_queries)
+        cached: list[list[GenericRecord] | None] = [None] * len(single_queries)
+        if self.search_cache is not None:
+            for position, single_query in enumerate(single_queries):
+                cache_keys[position] = self.cache_key(single_query)
+                cached[position] = self.search_cache.get(cache_keys[position])
+        mode = self._resolve_mode(query.search_mode)
+        candidates = self._candidates(mode, query.top_k)
+        miss_texts = [
+            single_query.query
+            for single_query, results in zip(single_queries, cached, strict=True)
+            if results is None
+        ]
+        misses = lexical_misses = iter(())
+        if mode != "lexical":
+            misses = self.vector_store.search_vectors_batch(
+                miss_texts,
+                top_k=candidates,
+                search_filter=query.search_filter,
+                max_concurrency=query.max_concurrency,
+            )
+        if mode != "vector":
+            lexical_misses = self._search_lexical_batch(
+                miss_texts, candidates, query.search_filter
+            )
+        hits = 0
+        for position, results in enumerate(cached):
+            if results is not None:
+                hits += 1
+                yield results
+                continue
+            vector_results = next(misses) if mode != "lexical" else None
+            lexical_results = next(lexical_misses) if mode != "vector" else None
+            results = self._combine(vector_results, lexical_results, query.top_k)
+            if self.search_cache is not None:
+                self.search_cache.set(cache_keys[position], results)
+            yield results
+        if mode != "lexical":
+            misses.close()
+        logger.bind(
+            queries=len(single_queries),
+            cached=hits,
+            seconds=round(time.perf_counter() - start, 4),
+        ).info("Found chunks in batch")
+
+    def cache_key(self, query: SearchEmbeddingsQuery) -> str:
+        search_filter = query.search_filter
+        scope = INDEX_SCOPE
+        if (
+            search_filter is not None
+            and search_filter.repo_owner is not None
+            and search_filter.repo_name is not None
+        ):
+            scope = repo_scope(search_filter.repo_owner, search_filter.repo_name)
+        hasher = hashlib.sha256()
+        for part in (
+            self.vector_store.index_name,
+            self.vector_store.model_version,
+            scope,
+            str(self.search_cache.generation(scope)),
+            query.model_dump_json(),
+        ):
+            hasher.update(part.encode("utf-8"))
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+
+    def _search_lexical_batch(
+        self, texts: Iterable[str], top_k: int, search_filter: SearchFilter | None
+    ) -> Iterator[list[GenericRecord]]:
+        """Yields the lexical results of each text, LEXICAL_BATCH_SIZE at once."""
+        for batch in batched(texts, LEXICAL_BATCH_SIZE):
+            yield from self.lexical_index.search_batch(
+                list(batch), top_k=top_k, search_filter=search_filter
+            )
+
+    def _resolve_mode(self, mode: SearchMode) -> SearchMode:
+        if self.lexical_index is not None:
+            return mode
+        if mode == "lexical":
+            raise ValueError("Lexical search requires a lexical index")
+        return "vector"
+
+    @staticmethod
+    def _candidates(mode: SearchMode, top_k: int) -> int:
+        return top_k * HYBRID_CANDIDATES_PER_RESULT if mode == "hybrid" else top_k
+
+    def _combine(
+        self,
+        vector_results: list[GenericRecord] | None,
+        lexical_results: list[GenericRecord] | None,
+        top_k: int,
+    ) -> list[GenericRecord]:
+        if lexical_results is None:
+            return vector_results
+        if vector_results is None:
+            return lexical_results
+        return reciprocal_rank_fusion(
+            [vector_results, lexical_results], top_k, k=self.rrf_k
+        )
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[GenericRecord]], top_k: int, k: int = RRF_K
+) -> list[GenericRecord]:
+    """
+    Merges rankings by the sum of 1 / (k + rank) over the rankings each record
+    appears in. Only ranks are used, so scores on different scales, such as
+    cosine similarity and BM25, can be fused. The fused score replaces each
+    record's score.
+    """
+    scores: dict[str, float] = {}
+    records: dict[str, GenericRecord] = {}
+    for ranking in rankings:
+        for rank, record in enumerate(ranking, start=1):
+            scores[record.id] = scores.get(record.id, 0.0) + 1 / (k + rank)
+            records.setdefault(record.id, record)
+    fused = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [
+        records[record_id].model_copy(
+            update={
+                "metadata": {**records[record_id].metadata, "score": scores[record_id]}
+            }
+        )
+        for record_id in fused
+    ]
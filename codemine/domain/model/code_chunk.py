@@ -1,15 +1,61 @@
-import pydantic
+from codemine.domain.value_objects import GenericRecord, file_type_from_path
 
-from codemine.domain.value_objects import GenericRecord
 
+class CodeChunk:
+    """
+    A chunk stored as the character offsets of its content in the content of
+    its document, which every chunk of the document shares. The content is
+    only sliced out when it is read, and the record text is only built when
+    the chunk is upserted.
+    """
 
-class CodeChunk(pydantic.BaseModel):
-    content: str
-    context: str | None = None
-    index: int
-    repo_owner: str
-    repo_name: str
-    file_path: str
+    __slots__ = (
+        "source",
+        "start",
+        "end",
+        "repo_owner",
+        "repo_name",
+        "file_path",
+        "context",
+    )
+
+    def __init__(
+        self,
+        source: str,
+        start: int,
+        end: int,
+        repo_owner: str,
+        repo_name: str,
+        file_path: str,
+        context: str | None = None,
+    ):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.repo_owner = repo_owner
+        self.repo_name = repo_name
+        self.file_path = file_path
+        self.context = context
+
+    @property
+    def content(self) -> str:
+        return self.source[self.start : self.end]
+
+    @property
+    def index(self) -> int:
+        # Chunks are numbered by the offset of their first character.
+        return self.start
+
+    def with_context(self, context: str | None) -> "CodeChunk":
+        return CodeChunk(
+            self.source,
+            self.start,
+            self.end,
+            self.repo_owner,
+            self.repo_name,
+            self.file_path,
+            context,
+        )
 
     @property
     def id(self):
@@ -22,19 +68,13 @@ class CodeChunk(pydantic.BaseModel):
             "repo_name": self.repo_name,
             "file_path": self.file_path,
             "index": self.index,
+            "file_type": file_type_from_path(self.file_path),
         }
 
     @property
     def full_content(self):
         if self.context:
-            return f"""
-            <context>
-            {self.context}
-            </context>
-            <chunk>
-            {self.content}
-            </chunk>
-            """
+            return f"<context>\n{self.context}\n</context>\n{self.content}"
         return self.content
 
     @property
@@ -44,3 +84,19 @@ class CodeChunk(pydantic.BaseModel):
             unembedded_content=self.full_content,
             metadata=self.metadata,
         )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, CodeChunk):
+            return NotImplemented
+        return (
+            self.start == other.start
+            and self.end == other.end
+            and self.context == other.context
+            and self.file_path == other.file_path
+            and self.repo_owner == other.repo_owner
+            and self.repo_name == other.repo_name
+            and self.content == other.content
+        )
+
+    def __repr__(self) -> str:
+        return f"CodeChunk(id={self.id!r}, end={self.end}, context={self.context!r})"
@@ -3,6 +3,9 @@ import pydantic
 from codemine.domain.model.code_chunk import CodeChunk
 from codemine.domain.value_objects import CodeDocumentContent
 
+# Fields a chunk is built from, validated before the chunks.
+DOCUMENT_FIELDS = frozenset({"content", "repo_owner", "repo_name", "file_path"})
+
 
 class CodeDocument(pydantic.BaseModel):
     content: CodeDocumentContent
@@ -13,4 +16,39 @@ class CodeDocument(pydantic.BaseModel):
 
 
 class ChunkedDocument(CodeDocument):
+    """
+    Chunks are offsets into content, and are serialised as their offsets and
+    context.
+    """
+
+    model_config = pydantic.ConfigDict(arbitrary_types_allowed=True)
+
     chunks: list[CodeChunk]
+
+    @pydantic.field_validator("chunks", mode="before")
+    @classmethod
+    def _chunks_from_offsets(cls, chunks, info: pydantic.ValidationInfo):
+        fields = info.data
+        if not fields.keys() >= DOCUMENT_FIELDS or not all(
+            isinstance(chunk, dict) for chunk in chunks
+        ):
+            return chunks
+        return [
+            CodeChunk(
+                fields["content"],
+                chunk["start"],
+                chunk["end"],
+                fields["repo_owner"],
+                fields["repo_name"],
+                fields["file_path"],
+                chunk.get("context"),
+            )
+            for chunk in chunks
+        ]
+
+    @pydantic.field_serializer("chunks")
+    def _chunks_to_offsets(self, chunks: list[CodeChunk]) -> list[dict]:
+        return [
+            {"start": chunk.start, "end": chunk.end, "context": chunk.context}
+            for chunk in chunks
+        ]
@@ -1,9 +1,27 @@
 from typing import Protocol
 
+import numpy as np
+
 from codemine.domain.value_objects import EmbeddedRecord, GenericRecord
 
 
 class EmbeddingClient(Protocol):
+    model: str
+    dimension: int
+
+    def embed_records(self, records: list[GenericRecord]) -> np.ndarray:
+        """
+        Embeds the records' unembedded content, returning a float32 array of
+        shape (len(records), dimension) in the same order as records.
+        """
+        ...
+
     def embed_generic_record(
         self, record: GenericRecord, *args, **kwargs
-    ) -> EmbeddedRecord: ...
+    ) -> EmbeddedRecord:
+        return EmbeddedRecord(
+            id=record.id,
+            unembedded_content=record.unembedded_content,
+            embedded_content=self.embed_records([record])[0].tolist(),
+            metadata=record.metadata,
+        )
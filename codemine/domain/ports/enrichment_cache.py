@@ -0,0 +1,13 @@
+from typing import Protocol
+
+
+class EnrichmentCache(Protocol):
+    hits: int
+    misses: int
+
+    def get(self, key: str) -> str | None: ...
+
+    def set(self, key: str, context: str) -> None: ...
+
+    def flush(self) -> None:
+        """Writes anything get deferred, such as access times, to storage."""
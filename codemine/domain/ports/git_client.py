@@ -1,27 +1,203 @@
+import os
+import shutil
 import tempfile
+import time
 from contextlib import contextmanager
-from typing import Protocol
+from typing import TYPE_CHECKING, Protocol
+from urllib.parse import urlsplit, urlunsplit
 
-import git
 import structlog
 
-from codemine.domain.value_objects import GitDirectory
+from codemine.domain.ports.telemetry import NullTelemetry, Telemetry
+from codemine.domain.value_objects import (
+    CloneStrategy,
+    GitDiff,
+    GitDirectory,
+    RepositoryRef,
+)
+
+# GitPython is imported where it is used, since importing it is slow and
+# searching never clones.
+if TYPE_CHECKING:
+    import git
 
 logger = structlog.get_logger()
 
 
 class GitClient(Protocol):
+    mirror_cache_dir: str | None = None
+    telemetry: Telemetry = NullTelemetry()
+
     def generate_url(self, owner: str, repo_name: str, *args, **kwargs) -> str: ...
 
+    def list_repositories(self, owner: str) -> list[RepositoryRef]:
+        """Lists every repository of a user or organisation."""
+        raise NotImplementedError(f"{self.__class__.__name__} cannot list repositories")
+
+    def describe_repository(self, owner: str, repo_name: str) -> RepositoryRef:
+        """Returns the repository with its size and last push time, if known."""
+        return RepositoryRef(owner=owner, name=repo_name)
+
     @contextmanager
     def temporary_clone(
-        self, owner: str, repo_name: str, *args, **kwargs
+        self,
+        owner: str,
+        repo_name: str,
+        *args,
+        strategy: CloneStrategy = "full",
+        sparse_extensions: list[str] | None = None,
+        **kwargs,
     ) -> GitDirectory:
+        """
+        Clones the repository into a temporary directory using one of:
+        - full: the complete history and every blob.
+        - shallow: only the HEAD commit (depth 1).
+        - partial: full history without blobs, checking out only files with
+          one of sparse_extensions. Blobs are fetched on demand.
+        - mirror: a persistent bare mirror under mirror_cache_dir that is
+          fetched incrementally and cloned locally with shared objects.
+        """
+        import git
+
         with tempfile.TemporaryDirectory() as temp_dir:
             url = self.generate_url(owner, repo_name, *args, **kwargs)
-            repo = git.Repo.clone_from(url, temp_dir)
-            repo_dir = repo.working_tree_dir
-            logger.bind(repo_dir=repo_dir, owner=owner, repo_name=repo_name).info(
-                "Cloned repository"
+            start = time.perf_counter()
+            with self.telemetry.span(
+                "clone", repository=f"{owner}/{repo_name}", strategy=strategy
+            ) as span:
+                match strategy:
+                    case "full":
+                        repo = git.Repo.clone_from(url, temp_dir)
+                    case "shallow":
+                        repo = git.Repo.clone_from(
+                            url, temp_dir, depth=1, single_branch=True
+                        )
+                    case "partial":
+                        repo = self._partial_clone(url, temp_dir, sparse_extensions)
+                    case "mirror":
+                        mirror_dir = self._update_mirror(url, owner, repo_name)
+                        repo = git.Repo.clone_from(mirror_dir, temp_dir, shared=True)
+                    case _:
+                        raise ValueError(f"Unknown clone strategy: {strategy}")
+                repo_dir = repo.working_tree_dir
+                size = _directory_size(os.path.join(repo_dir, ".git"))
+                span.set(bytes=size)
+            self.telemetry.increment("clone_bytes", size, strategy=strategy)
+            logger.bind(
+                repo_dir=repo_dir,
+                owner=owner,
+                repo_name=repo_name,
+                strategy=strategy,
+                seconds=round(time.perf_counter() - start, 3),
+                bytes=size,
+            ).info("Cloned repository")
+            yield GitDirectory(
+                path=repo_dir,
+                repo_owner=owner,
+                repo_name=repo_name,
+                commit_sha=repo.head.commit.hexsha,
             )
-            yield GitDirectory(path=repo_dir, repo_owner=owner, repo_name=repo_name)
+
+    def diff_files(self, git_directory: GitDirectory, base_commit: str) -> GitDiff:
+        """
+        Returns the files changed between base_commit and the checked out commit.
+        Raises ValueError if base_commit is not part of the cloned history and
+        cannot be fetched.
+        """
+        with self.telemetry.span("diff", base_commit=base_commit):
+            return self._diff_files(git_directory, base_commit)
+
+    def _diff_files(self, git_directory: GitDirectory, base_commit: str) -> GitDiff:
+        import git
+
+        repo = git.Repo(git_directory.path)
+        try:
+            base = repo.commit(base_commit)
+        except (git.BadName, ValueError):
+            # Shallow clones do not contain older commits; fetch just the one
+            # needed, since diffing two trees does not need the history between.
+            try:
+                repo.git.fetch("origin", base_commit, depth=1)
+                base = repo.commit(base_commit)
+            except (git.GitCommandError, git.BadName, ValueError) as e:
+                raise ValueError(f"Commit {base_commit} not found in repository") from e
+        diff = GitDiff()
+        for change in base.diff(repo.head.commit, M=True):
+            match change.change_type:
+                case "A":
+                    diff.added.append(change.b_path)
+                case "D":
+                    diff.deleted.append(change.a_path)
+                case "R":
+                    diff.renamed.append((change.a_path, change.b_path))
+                case _:
+                    diff.modified.append(change.b_path)
+        logger.bind(
+            base_commit=base_commit,
+            added=len(diff.added),
+            modified=len(diff.modified),
+            deleted=len(diff.deleted),
+            renamed=len(diff.renamed),
+        ).info("Computed repository diff")
+        return diff
+
+    def _partial_clone(
+        self, url: str, directory: str, sparse_extensions: list[str] | None
+    ) -> "git.Repo":
+        import git
+
+        repo = git.Repo.clone_from(url, directory, filter="blob:none", no_checkout=True)
+        if sparse_extensions is not None:
+            patterns = [f"*.{extension}" for extension in sparse_extensions]
+            repo.git.sparse_checkout("set", "--no-cone", *patterns)
+        repo.git.checkout(repo.active_branch.name)
+        return repo
+
+    def _update_mirror(self, url: str, owner: str, repo_name: str) -> str:
+        if self.mirror_cache_dir is None:
+            raise ValueError("The mirror clone strategy requires a mirror cache dir")
+        import git
+
+        mirror_dir = os.path.join(self.mirror_cache_dir, owner, f"{repo_name}.git")
+        if os.path.isdir(mirror_dir):
+            size_before = _directory_size(mirror_dir)
+            mirror = git.Repo(mirror_dir)
+            try:
+                # The URL is passed explicitly so credentials are never stored.
+                mirror.git.fetch(url, "+refs/*:refs/*", prune=True)
+            except git.GitCommandError:
+                logger.bind(mirror_dir=mirror_dir).warning(
+                    "Fetching mirror failed, recloning"
+                )
+                shutil.rmtree(mirror_dir)
+                return self._update_mirror(url, owner, repo_name)
+            logger.bind(
+                mirror_dir=mirror_dir,
+                fetched_bytes=_directory_size(mirror_dir) - size_before,
+            ).info("Updated repository mirror")
+        else:
+            mirror = git.Repo.clone_from(url, mirror_dir, mirror=True)
+            mirror.git.remote("set-url", "origin", _strip_credentials(url))
+            logger.bind(mirror_dir=mirror_dir).info("Created repository mirror")
+        return mirror_dir
+
+
+def _strip_credentials(url: str) -> str:
+    parts = urlsplit(url)
+    if parts.username is None and parts.password is None:
+        return url
+    netloc = parts.hostname or ""
+    if parts.port is not None:
+        netloc = f"{netloc}:{parts.port}"
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                continue
+    return total
@@ -0,0 +1,27 @@
+from typing import Protocol
+
+from codemine.domain.value_objects import GenericRecord
+
+# Scope of searches over the whole index, invalidated by any embed run.
+INDEX_SCOPE = "*"
+
+
+def repo_scope(repo_owner: str, repo_name: str) -> str:
+    return f"{repo_owner}/{repo_name}"
+
+
+class SearchCache(Protocol):
+    def get(self, key: str) -> list[GenericRecord] | None: ...
+
+    def set(self, key: str, records: list[GenericRecord]) -> None: ...
+
+    def generation(self, scope: str) -> int:
+        """
+        Returns a counter that changes whenever the scope is invalidated, so
+        keys built from it never match results cached before.
+        """
+        ...
+
+    def invalidate(self, *scopes: str) -> None: ...
+
+    def record_latency(self, hit: bool, seconds: float) -> None: ...
@@ -0,0 +1,40 @@
+from typing import Protocol
+
+
+class Span(Protocol):
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        return None
+
+    def set(self, **attributes) -> None:
+        """Adds attributes known only once the span has started."""
+
+
+class NullSpan(Span):
+    pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Telemetry(Protocol):
+    """
+    Records spans, counters and histograms. The defaults record nothing, so
+    instrumented code costs a method call when telemetry is off.
+    """
+
+    def span(self, name: str, **attributes) -> Span:
+        """Times the block as a span nested in the span that is current."""
+        return NULL_SPAN
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        """Adds value to a counter."""
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Records a value, usually in seconds, in a histogram."""
+
+
+class NullTelemetry(Telemetry):
+    pass
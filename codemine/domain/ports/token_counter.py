@@ -0,0 +1,16 @@
+import math
+from typing import Protocol
+
+# Rough characters per token for code. Deliberately low so estimates err
+# towards too many tokens.
+CHARACTERS_PER_TOKEN = 3
+
+
+class TokenCounter(Protocol):
+    def count_tokens(self, text: str) -> int:
+        """Estimates tokens from the length of the text."""
+        return math.ceil(len(text) / CHARACTERS_PER_TOKEN)
+
+
+class HeuristicTokenCounter(TokenCounter):
+    pass
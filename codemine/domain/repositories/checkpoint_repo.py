@@ -0,0 +1,39 @@
+from abc import ABC, abstractmethod
+
+from codemine.domain.model.code_document import ChunkedDocument
+from codemine.domain.value_objects import CheckpointStage, EmbedRunKey
+
+
+class CheckpointRepo(ABC):
+    """
+    Durable progress of an embed run, per file, so a failed run can resume
+    without redoing finished work. Enriched documents are kept until the run
+    completes, so LLM output survives a crash before it is upserted.
+    """
+
+    @abstractmethod
+    def get_progress(
+        self, key: EmbedRunKey
+    ) -> dict[str, tuple[CheckpointStage, ChunkedDocument | None]]:
+        """
+        Returns the stage reached by each file in the run, with its enriched
+        document once it has been enriched.
+        """
+        pass
+
+    @abstractmethod
+    def mark_chunked(self, key: EmbedRunKey, file_paths: list[str]) -> None:
+        pass
+
+    @abstractmethod
+    def save_enriched(self, key: EmbedRunKey, documents: list[ChunkedDocument]) -> None:
+        pass
+
+    @abstractmethod
+    def mark_upserted(self, key: EmbedRunKey, file_paths: list[str]) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self, index_name: str, repo_owner: str, repo_name: str) -> None:
+        """Removes the checkpoints of every run of the repo."""
+        pass
@@ -0,0 +1,65 @@
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+
+from codemine.domain.value_objects import ManifestEntry
+
+
+class ChunkManifestRepo(ABC):
+    """
+    Local record of every chunk embedded into each index, so that unchanged
+    chunks and deletions can be worked out without querying the vector store.
+    """
+
+    @abstractmethod
+    def get_content_hashes(
+        self, index_name: str, repo_owner: str, repo_name: str
+    ) -> dict[str, str]:
+        """Returns the content hash of every chunk of the repo, by chunk ID."""
+        pass
+
+    @abstractmethod
+    def get_chunk_ids_for_files(
+        self,
+        index_name: str,
+        repo_owner: str,
+        repo_name: str,
+        file_paths: Iterable[str],
+    ) -> list[str]:
+        pass
+
+    @abstractmethod
+    def upsert_chunks(
+        self,
+        index_name: str,
+        repo_owner: str,
+        repo_name: str,
+        entries: Iterable[ManifestEntry],
+        run_id: str | None = None,
+    ) -> None:
+        """Writes entries, noting the embed run that last wrote each."""
+        pass
+
+    @abstractmethod
+    def list_chunks_not_in_run(
+        self,
+        index_name: str,
+        repo_owner: str,
+        repo_name: str,
+        run_id: str,
+        file_paths: Iterable[str] | None = None,
+    ) -> Iterator[list[str]]:
+        """
+        Yields pages of the IDs of the repo's chunks that run_id did not
+        write, of every file or only of file_paths.
+        """
+        pass
+
+    @abstractmethod
+    def remove_chunks(
+        self,
+        index_name: str,
+        repo_owner: str,
+        repo_name: str,
+        chunk_ids: Iterable[str],
+    ) -> None:
+        pass
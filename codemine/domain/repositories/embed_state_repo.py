@@ -0,0 +1,24 @@
+from abc import ABC, abstractmethod
+
+
+class EmbedStateRepo(ABC):
+    """Local record of what has been embedded into each index."""
+
+    @abstractmethod
+    def get_last_embedded_commit(
+        self, index_name: str, repo_owner: str, repo_name: str
+    ) -> str | None:
+        pass
+
+    @abstractmethod
+    def get_last_embedded_at(
+        self, index_name: str, repo_owner: str, repo_name: str
+    ) -> float | None:
+        """Returns when the repo was last embedded, as a Unix timestamp."""
+        pass
+
+    @abstractmethod
+    def set_last_embedded_commit(
+        self, index_name: str, repo_owner: str, repo_name: str, commit_sha: str
+    ) -> None:
+        pass
@@ -0,0 +1,24 @@
+from abc import ABC, abstractmethod
+
+from codemine.domain.value_objects import BatchJob, RepositoryRef
+
+
+class JobStateRepo(ABC):
+    """Durable state of batch embed runs, so an interrupted batch can resume."""
+
+    @abstractmethod
+    def add_jobs(self, batch_name: str, repositories: list[RepositoryRef]) -> None:
+        """Adds a pending job for each repository not already in the batch."""
+        pass
+
+    @abstractmethod
+    def get_jobs(self, batch_name: str) -> list[BatchJob]:
+        pass
+
+    @abstractmethod
+    def save_job(self, batch_name: str, job: BatchJob) -> None:
+        pass
+
+    @abstractmethod
+    def clear_batch(self, batch_name: str) -> None:
+        pass
@@ -0,0 +1,58 @@
+from abc import ABC, abstractmethod
+from collections.abc import Iterable
+
+from codemine.domain.model.code_document import ChunkedDocument
+from codemine.domain.value_objects import GenericRecord, SearchFilter
+
+
+class LexicalIndexRepo(ABC):
+    """
+    Keyword index of chunks, to find exact identifiers and strings that dense
+    search misses. Changes are only searchable once committed.
+    """
+
+    @abstractmethod
+    def replace_documents(self, documents: list[ChunkedDocument]) -> None:
+        """Replaces every chunk of each document's file with its chunks."""
+        pass
+
+    @abstractmethod
+    def remove_files(
+        self, repo_owner: str, repo_name: str, file_paths: Iterable[str]
+    ) -> None:
+        pass
+
+    @abstractmethod
+    def retain_files(
+        self, repo_owner: str, repo_name: str, file_paths: Iterable[str]
+    ) -> int:
+        """Removes every file of the repo not in file_paths, returning how many."""
+        pass
+
+    @abstractmethod
+    def commit(self) -> None:
+        """Makes the changes since the last commit searchable."""
+        pass
+
+    @abstractmethod
+    def search(
+        self, query: str, top_k: int = 10, search_filter: SearchFilter | None = None
+    ) -> list[GenericRecord]:
+        pass
+
+    def search_batch(
+        self,
+        queries: list[str],
+        top_k: int = 10,
+        search_filter: SearchFilter | None = None,
+    ) -> list[list[GenericRecord]]:
+        """
+        Returns the results of each query. Indexes that can search many
+        queries at once should override this.
+        """
+        return [self.search(query, top_k, search_filter) for query in queries]
+
+    def sample_records(self, count: int, seed: int = 0) -> list[GenericRecord]:
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not implement sample_records"
+        )
@@ -1,11 +1,26 @@
+import time
 from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import batched
 
 import structlog
 
-from codemine.domain.value_objects import EmbeddedRecord, GenericRecord
+from codemine.domain.value_objects import (
+    EmbeddedRecord,
+    GenericRecord,
+    OutdatedVectorsReport,
+    SearchFilter,
+    file_path_from_chunk_id,
+)
 from codemine.infrastructure.settings import Settings
 
 logger = structlog.get_logger()
+DEFAULT_UPSERT_BATCH_SIZE = 50
+DEFAULT_DELETE_BATCH_SIZE = 1000
+DEFAULT_SEARCH_CONCURRENCY = 8
+PENDING_QUERIES_PER_WORKER = 4
 
 
 class VectorIndexRepo(ABC):
@@ -22,6 +37,15 @@ class VectorIndexRepo(ABC):
     def index(self) -> str:
         pass
 
+    @property
+    def model_version(self) -> str:
+        """Identifies the embedding model, so a model change re-embeds records."""
+        return ""
+
+    def warm_up(self) -> None:
+        """Connects to the index ahead of the first request."""
+        return None
+
     @abstractmethod
     def insert_vectors(self, records: list[EmbeddedRecord]):
         pass
@@ -36,10 +60,52 @@ class VectorIndexRepo(ABC):
     ) -> bool:
         pass
 
+    def list_record_ids(
+        self, repo_owner: str, repo_name: str, file_path: str | None = None
+    ) -> Iterable[list[str]]:
+        """
+        Yields pages of the IDs of every record embedded for the repo, or only
+        for IDs starting with the chunk ID prefix of file_path.
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not implement list_record_ids"
+        )
+
+    def remove_records_by_id(self, ids: list[str]) -> None:
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not implement remove_records_by_id"
+        )
+
     @abstractmethod
-    def search_vectors(self, query: str) -> list[GenericRecord]:
+    def search_vectors(
+        self, query: str, top_k: int = 10, search_filter: SearchFilter | None = None
+    ) -> list[GenericRecord]:
         pass
 
+    def search_vectors_batch(
+        self,
+        queries: Iterable[str],
+        top_k: int = 10,
+        search_filter: SearchFilter | None = None,
+        max_concurrency: int = DEFAULT_SEARCH_CONCURRENCY,
+    ) -> Iterator[list[GenericRecord]]:
+        """
+        Yields the results of each query in order, as soon as they and the
+        results before them are ready. Stores that can search many queries at
+        once should override this; by default queries are searched one by one
+        on max_concurrency threads.
+        """
+        pending: deque[Future] = deque()
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            for query in queries:
+                if len(pending) >= max_concurrency * PENDING_QUERIES_PER_WORKER:
+                    yield pending.popleft().result()
+                pending.append(
+                    executor.submit(self.search_vectors, query, top_k, search_filter)
+                )
+            while pending:
+                yield pending.popleft().result()
+
     def embed_and_insert_records(self, records: list[GenericRecord]):
         raise NotImplementedError(
             "This Vector Store : "
@@ -48,26 +114,85 @@ class VectorIndexRepo(ABC):
             "content directly into the vector store."
         )
 
+    def embed_and_insert_records_bulk(self, records: Iterable[GenericRecord]) -> int:
+        """
+        Embeds and inserts a stream of records, returning how many were inserted.
+        Stores that can upsert concurrently should override this.
+        """
+        count = 0
+        for batch in batched(records, DEFAULT_UPSERT_BATCH_SIZE):
+            self.embed_and_insert_records(list(batch))
+            count += len(batch)
+        return count
+
     def remove_outdated_vectors(
-        self, repo_owner: str, repo_name: str, new_files: list[str]
-    ):
-        outdated_vectors_count = 0
-        for file_path in self.get_current_files_embedded(repo_owner, repo_name):
-            if file_path not in new_files:
-                logger.bind(file_path=file_path).info(
-                    "Removing outdated vectors with file path"
-                )
-                self.remove_vectors_by_file_path(file_path, repo_owner, repo_name)
-                outdated_vectors_count += 1
-        if outdated_vectors_count > 0:
-            logger.bind(
-                repo_owner=repo_owner,
-                repo_name=repo_name,
-                outdated_vectors_count=outdated_vectors_count,
-            ).info("Removed outdated vectors")
-        else:
-            logger.bind(
-                repo_owner=repo_owner,
-                repo_name=repo_name,
-                outdated_vectors_count=outdated_vectors_count,
-            ).info("No outdated vectors found")
+        self,
+        repo_owner: str,
+        repo_name: str,
+        new_files: Iterable[str],
+        dry_run: bool = False,
+        delete_batch_size: int = DEFAULT_DELETE_BATCH_SIZE,
+    ) -> OutdatedVectorsReport:
+        """
+        Removes every record whose file is not in new_files. Record IDs are
+        streamed page by page and stale ones deleted in batches by ID, so
+        memory and requests scale with the number of stale records. With
+        dry_run nothing is deleted and the report counts what would be.
+        """
+        start = time.perf_counter()
+        new_files = set(new_files)
+        report = OutdatedVectorsReport(dry_run=dry_run)
+        outdated_files: set[str] = set()
+        pending: list[str] = []
+        for page in self.list_record_ids(repo_owner, repo_name):
+            report.scanned_vectors += len(page)
+            for record_id in page:
+                file_path = file_path_from_chunk_id(record_id, repo_owner, repo_name)
+                if file_path not in new_files:
+                    outdated_files.add(file_path)
+                    pending.append(record_id)
+            while len(pending) >= delete_batch_size:
+                self._remove_outdated_batch(pending[:delete_batch_size], dry_run)
+                report.outdated_vectors += delete_batch_size
+                pending = pending[delete_batch_size:]
+        if pending:
+            self._remove_outdated_batch(pending, dry_run)
+            report.outdated_vectors += len(pending)
+        report.outdated_files = len(outdated_files)
+        report.seconds = round(time.perf_counter() - start, 3)
+        logger.bind(
+            repo_owner=repo_owner,
+            repo_name=repo_name,
+            **report.model_dump(),
+        ).info("Removed outdated vectors")
+        return report
+
+    def remove_file_records(
+        self,
+        repo_owner: str,
+        repo_name: str,
+        file_path: str,
+        keep_ids: set[str],
+        delete_batch_size: int = DEFAULT_DELETE_BATCH_SIZE,
+    ) -> int:
+        """
+        Removes the records of file_path whose IDs are not in keep_ids, and
+        returns how many were removed. Errors listing or removing records are
+        raised, so the file is never taken for removed when it is not.
+        """
+        outdated = [
+            record_id
+            for page in self.list_record_ids(repo_owner, repo_name, file_path)
+            for record_id in page
+            if record_id not in keep_ids
+            and file_path_from_chunk_id(record_id, repo_owner, repo_name) == file_path
+        ]
+        for batch in batched(outdated, delete_batch_size):
+            self.remove_records_by_id(list(batch))
+        return len(outdated)
+
+    def _remove_outdated_batch(self, ids: list[str], dry_run: bool) -> None:
+        if dry_run:
+            return
+        logger.bind(ids=len(ids)).info("Removing outdated vectors by ID")
+        self.remove_records_by_id(ids)
@@ -0,0 +1,336 @@
+import hashlib
+import re
+import threading
+import zlib
+from collections import Counter, OrderedDict
+from collections.abc import Iterable
+
+import numpy as np
+import structlog
+
+from codemine.domain.model.code_document import ChunkedDocument
+from codemine.domain.ports.telemetry import NullTelemetry, Telemetry
+from codemine.domain.ports.token_counter import HeuristicTokenCounter, TokenCounter
+
+logger = structlog.get_logger()
+
+DEFAULT_NEAR_DUPLICATE_THRESHOLD = 0.9
+DEFAULT_MAX_SHARED_CONTEXTS = 100_000
+# Signatures kept for near-duplicate search, each taking about 2 KB.
+DEFAULT_MAX_NEAR_DUPLICATE_CHUNKS = 10_000
+# Signatures are split into bands of rows, and chunks sharing a band are
+# compared. 16 bands of 4 rows find most pairs more than half similar.
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+SHINGLE_TOKENS = 5
+# Shorter chunks have too few shingles to compare, so they are only
+# deduplicated exactly.
+MIN_NEAR_DUPLICATE_TOKENS = 20
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+TRAILING_WHITESPACE_PATTERN = re.compile(r"[ \t]+$", re.MULTILINE)
+
+# Fixed, so signatures of the same content always match.
+_permutation_rng = np.random.default_rng(0)
+_PERMUTATION_A = _permutation_rng.integers(
+    1, 1 << 31, MINHASH_PERMUTATIONS, dtype=np.uint64
+)
+_PERMUTATION_B = _permutation_rng.integers(
+    0, 1 << 31, MINHASH_PERMUTATIONS, dtype=np.uint64
+)
+
+
+class ChunkDeduplicationService:
+    """
+    Finds chunks whose content, with line endings and trailing whitespace
+    normalised, was already seen, so each unique chunk is enriched once and
+    its duplicates reuse its context.
+
+    Contexts are shared by every run of the service, so a chunk enriched for
+    one repository is not enriched again for another. Runs are given the
+    scope of the enrichment they deduplicate for, so a context is only
+    reused with the same model, prompts and strategy. At most
+    max_shared_contexts are kept, dropping the least recently used.
+    """
+
+    def __init__(
+        self,
+        near_duplicate_threshold: float = DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+        max_shared_contexts: int = DEFAULT_MAX_SHARED_CONTEXTS,
+        token_counter: TokenCounter | None = None,
+        telemetry: Telemetry | None = None,
+    ):
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.max_shared_contexts = max_shared_contexts
+        self.token_counter = token_counter or HeuristicTokenCounter()
+        self.telemetry = telemetry or NullTelemetry()
+        self._shared_contexts: OrderedDict[bytes, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start_run(
+        self, scope: str = "", near_duplicates: bool = False
+    ) -> "DeduplicationRun":
+        """
+        Only contexts shared by runs of the same scope, such as the
+        enrichment service's context_scope, are reused. With near_duplicates,
+        chunks whose MinHash estimate of similarity to an earlier chunk of the
+        run reaches near_duplicate_threshold also reuse its context, which
+        covers almost identical files.
+        """
+        return DeduplicationRun(
+            self,
+            scope,
+            _NearDuplicateIndex(self.near_duplicate_threshold)
+            if near_duplicates
+            else None,
+        )
+
+    @staticmethod
+    def content_key(content: str, scope: str = "") -> bytes:
+        normalised = TRAILING_WHITESPACE_PATTERN.sub(
+            "", content.replace("\r\n", "\n")
+        ).strip("\n")
+        hasher = hashlib.sha256(scope.encode("utf-8"))
+        hasher.update(b"\0")
+        hasher.update(normalised.encode("utf-8"))
+        return hasher.digest()
+
+    def get_shared_context(self, key: bytes) -> str | None:
+        with self._lock:
+            context = self._shared_contexts.get(key)
+            if context is not None:
+                self._shared_contexts.move_to_end(key)
+            return context
+
+    def share_context(self, key: bytes, context: str | None) -> None:
+        if context is None:
+            return
+        with self._lock:
+            self._shared_contexts[key] = context
+            self._shared_contexts.move_to_end(key)
+            while len(self._shared_contexts) > self.max_shared_contexts:
+                self._shared_contexts.popitem(last=False)
+
+
+class DeduplicationRun:
+    """
+    Deduplicates the chunks of one embed run. unique_chunks yields each
+    document with only the chunks to enrich, and with_duplicates puts back
+    the others, with the context of the chunk they duplicate, in batches of
+    the enriched documents, which must keep the order they were yielded in.
+
+    Duplicates keep their own offsets, path and repository, so they are still
+    upserted as records of their own. Exact duplicates have the same record
+    text as their original, so the client-side embedding cache embeds them
+    once, but Pinecone's integrated inference embeds every copy again.
+
+    The run only holds the keys and contexts of chunks of documents between
+    the two stages, so its memory is bounded like the pipeline's. Once
+    enriched, a chunk is found again through the service's shared contexts.
+    """
+
+    def __init__(
+        self,
+        service: ChunkDeduplicationService,
+        scope: str = "",
+        near_index: "_NearDuplicateIndex | None" = None,
+    ):
+        self.service = service
+        self.scope = scope
+        self.near_index = near_index
+        self.chunks = 0
+        self.duplicate_chunks = 0
+        self.near_duplicate_chunks = 0
+        self.saved_tokens = 0
+        # Chunks of pending documents that reuse the context of each key.
+        self._references: Counter[bytes] = Counter()
+        self._contexts: dict[bytes, str | None] = {}
+        self._pending: dict[str, tuple[ChunkedDocument, list[bytes], list[bool]]] = {}
+        # unique_chunks and with_duplicates run in different pipeline stages.
+        self._lock = threading.Lock()
+
+    @property
+    def ratio(self) -> float:
+        """Share of the chunks that were not enriched as they duplicate another."""
+        if not self.chunks:
+            return 0.0
+        return (self.duplicate_chunks + self.near_duplicate_chunks) / self.chunks
+
+    def unique_chunks(
+        self, documents: Iterable[ChunkedDocument]
+    ) -> Iterable[ChunkedDocument]:
+        for document in documents:
+            keys = []
+            unique = []
+            for chunk in document.chunks:
+                key, is_unique = self._original_key(chunk.content)
+                keys.append(key)
+                unique.append(is_unique)
+                if not is_unique:
+                    self.saved_tokens += self.service.token_counter.count_tokens(
+                        chunk.content
+                    )
+            self.chunks += len(keys)
+            self._pending[document.file_path] = (document, keys, unique)
+            yield document.model_copy(
+                update={
+                    "chunks": [
+                        chunk
+                        for chunk, is_unique in zip(
+                            document.chunks, unique, strict=True
+                        )
+                        if is_unique
+                    ]
+                }
+            )
+
+    def with_duplicates(
+        self, batches: Iterable[list[ChunkedDocument]]
+    ) -> Iterable[list[ChunkedDocument]]:
+        for batch in batches:
+            yield [self._with_duplicates(enriched) for enriched in batch]
+
+    def _with_duplicates(self, enriched: ChunkedDocument) -> ChunkedDocument:
+        document, keys, unique = self._pending.pop(enriched.file_path)
+        enriched_chunks = iter(enriched.chunks)
+        chunks = []
+        # The chunk a duplicate reuses comes before it, in this document or
+        # an earlier one, so its context is already known.
+        with self._lock:
+            for chunk, key, is_unique in zip(
+                document.chunks, keys, unique, strict=True
+            ):
+                if is_unique:
+                    context = next(enriched_chunks).context
+                    self._contexts[key] = context
+                    self.service.share_context(key, context)
+                chunks.append(chunk.with_context(self._contexts[key]))
+                self._references[key] -= 1
+                if not self._references[key]:
+                    del self._references[key]
+                    del self._contexts[key]
+        return document.model_copy(update={"chunks": chunks})
+
+    def report(self) -> None:
+        telemetry = self.service.telemetry
+        unique = self.chunks - self.duplicate_chunks - self.near_duplicate_chunks
+        telemetry.increment("dedup_chunks", unique, kind="unique")
+        telemetry.increment("dedup_chunks", self.duplicate_chunks, kind="duplicate")
+        telemetry.increment(
+            "dedup_chunks", self.near_duplicate_chunks, kind="near_duplicate"
+        )
+        telemetry.increment("dedup_saved_tokens", self.saved_tokens)
+        logger.bind(
+            chunks=self.chunks,
+            duplicate_chunks=self.duplicate_chunks,
+            near_duplicate_chunks=self.near_duplicate_chunks,
+            saved_tokens=self.saved_tokens,
+        ).info("Deduplicated chunks")
+
+    def _original_key(self, content: str) -> tuple[bytes, bool]:
+        """
+        Returns the key of the chunk whose context this chunk gets, and
+        whether that is the chunk itself, which must then be enriched.
+        """
+        key = self.service.content_key(content, self.scope)
+        signature = None
+        if self.near_index is not None:
+            signature = self.near_index.signature(content)
+        with self._lock:
+            if self._reuse(key):
+                self.duplicate_chunks += 1
+                return key, False
+            if signature is not None:
+                original = self.near_index.find(signature)
+                if original is not None and self._reuse(original):
+                    self.near_duplicate_chunks += 1
+                    return original, False
+                self.near_index.add(signature, key)
+            self._references[key] += 1
+            return key, True
+
+    def _reuse(self, key: bytes) -> bool:
+        """
+        Refers to the context of key if it is pending or shared, returning
+        whether it is.
+        """
+        if key not in self._references:
+            context = self.service.get_shared_context(key)
+            if context is None:
+                return False
+            self._contexts[key] = context
+        self._references[key] += 1
+        return True
+
+
+class _NearDuplicateIndex:
+    """
+    MinHash signatures of the chunks of a run, bucketed by band for locality
+    sensitive hashing. Only the first chunk of each bucket is kept, and only
+    the most recent max_entries chunks are indexed.
+    """
+
+    def __init__(
+        self, threshold: float, max_entries: int = DEFAULT_MAX_NEAR_DUPLICATE_CHUNKS
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._buckets: dict[bytes, int] = {}
+        self._entries: OrderedDict[int, tuple[np.ndarray, bytes, list[bytes]]] = (
+            OrderedDict()
+        )
+        self._next_entry = 0
+
+    @staticmethod
+    def signature(content: str) -> np.ndarray | None:
+        tokens = TOKEN_PATTERN.findall(content)
+        if len(tokens) < MIN_NEAR_DUPLICATE_TOKENS:
+            return None
+        return _minhash(tokens)
+
+    def find(self, signature: np.ndarray) -> bytes | None:
+        """
+        Returns the key of the most similar indexed chunk above the threshold.
+        """
+        best, best_similarity = None, self.threshold
+        for band in _bands(signature):
+            entry = self._buckets.get(band)
+            if entry is None:
+                continue
+            other, key, _ = self._entries[entry]
+            similarity = np.count_nonzero(other == signature) / MINHASH_PERMUTATIONS
+            if similarity >= best_similarity:
+                best, best_similarity = key, similarity
+        return best
+
+    def add(self, signature: np.ndarray, key: bytes) -> None:
+        entry = self._next_entry
+        self._next_entry += 1
+        bands = _bands(signature)
+        self._entries[entry] = (signature, key, bands)
+        for band in bands:
+            self._buckets.setdefault(band, entry)
+        if len(self._entries) > self.max_entries:
+            evicted, (_, _, evicted_bands) = self._entries.popitem(last=False)
+            for band in evicted_bands:
+                if self._buckets.get(band) == evicted:
+                    del self._buckets[band]
+
+
+def _bands(signature: np.ndarray) -> list[bytes]:
+    return [
+        bytes([band]) + rows.tobytes()
+        for band, rows in enumerate(np.split(signature, MINHASH_BANDS))
+    ]
+
+
+def _minhash(tokens: list[str]) -> np.ndarray:
+    shingles = np.fromiter(
+        {
+            zlib.crc32(" ".join(tokens[start : start + SHINGLE_TOKENS]).encode())
+            for start in range(len(tokens) - SHINGLE_TOKENS + 1)
+        },
+        dtype=np.uint64,
+    )
+    hashes = (shingles[:, None] * _PERMUTATION_A + _PERMUTATION_B) % MERSENNE_PRIME
+    return hashes.min(axis=0)
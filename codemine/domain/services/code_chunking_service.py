@@ -1,92 +1,180 @@
-import fnmatch
-import os
-from collections.abc import Generator
+import itertools
+import multiprocessing
+import time
+from collections import deque
+from collections.abc import Generator, Iterable
+from concurrent.futures import Future, ProcessPoolExecutor
 from typing import Literal
 
-import tree_sitter_hcl
-import tree_sitter_javascript
-import tree_sitter_markdown
-import tree_sitter_python
-import tree_sitter_rust
-import tree_sitter_typescript
-import tree_sitter_yaml
-from semantic_text_splitter import CodeSplitter, TextSplitter
 from structlog import get_logger
 
 from codemine.domain.model.code_chunk import CodeChunk
 from codemine.domain.model.code_document import ChunkedDocument, CodeDocument
+from codemine.domain.ports.telemetry import NullTelemetry, Telemetry
+from codemine.domain.services.code_splitting import (
+    LANGUAGE_LOADERS,
+    chunk_offsets,
+    chunk_offsets_batch,
+)
+from codemine.domain.services.file_discovery_service import FileDiscoveryService
 from codemine.domain.value_objects import GitDirectory
 
 logger = get_logger()
 
-CHUNK_SIZE_RANGE = (500, 5000)
+# Documents are sent to chunking workers in batches of about this many
+# characters, so each task outweighs the cost of sending it and its result.
+BATCH_CHARACTERS = 128 * 1024
+# Batches in flight per chunking worker. Bounds memory while keeping every
+# worker busy.
+PENDING_BATCHES_PER_WORKER = 2
+# Fewer documents are chunked in process, as starting the worker pool would
+# take longer than chunking them.
+MIN_PARALLEL_DOCUMENTS = 256
 
 
 class CodeChunkingService:
-    _langauge_registry = {
-        "py": tree_sitter_python.language(),
-        "tf": tree_sitter_hcl.language(),
-        "tsx": tree_sitter_typescript.language_tsx(),
-        "ts": tree_sitter_typescript.language_typescript(),
-        "js": tree_sitter_javascript.language(),
-        "jsx": tree_sitter_javascript.language(),
-        "md": tree_sitter_markdown.language(),
-        "rs": tree_sitter_rust.language(),
-        "yml": tree_sitter_yaml.language(),
-        "yaml": tree_sitter_yaml.language(),
-    }
-
-    def __init__(self, splitter: Literal["code", "text"] = "code"):
+    def __init__(
+        self,
+        splitter: Literal["code", "text"] = "code",
+        file_discovery: FileDiscoveryService | None = None,
+        telemetry: Telemetry | None = None,
+    ):
+        from semantic_text_splitter import CodeSplitter, TextSplitter
+
         if splitter == "code":
             self.splitter = CodeSplitter
         else:
             self.splitter = TextSplitter
+        self.file_discovery = file_discovery or FileDiscoveryService()
+        self.telemetry = telemetry or NullTelemetry()
+
+    @property
+    def supported_extensions(self) -> list[str]:
+        return list(LANGUAGE_LOADERS)
+
+    def is_supported_file(self, file_path: str) -> bool:
+        return file_path.split(".")[-1] in LANGUAGE_LOADERS
 
     def walk_directory(
         self,
         git_directory: GitDirectory,
         ignore_globs: list[str] | None = None,
     ) -> Generator[CodeDocument, None, None]:
-        ignore_globs = ignore_globs or []
-        for root, _, files in os.walk(git_directory.path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                if any(
-                    fnmatch.fnmatch(file_path, ignore_glob)
-                    for ignore_glob in ignore_globs
-                ):
-                    logger.bind(file=file).info("File is ignored by glob pattern")
-                    continue
-                logger.bind(file=file).info("Checking file")
-                if file.split(".")[-1] in self._langauge_registry:
-                    logger.bind(file=file).info("File is a code file")
-                    relative_path = os.path.relpath(file_path, git_directory.path)
-                    with open(file_path, encoding="utf-8") as f:
-                        code = f.read()
-                        file_extension = file.split(".")[-1]
-                        yield CodeDocument(
-                            content=code,
-                            file_path=relative_path,
-                            file_type=file_extension,
-                            repo_owner=git_directory.repo_owner,
-                            repo_name=git_directory.repo_name,
-                        )
+        for relative_path in self.file_discovery.discover(
+            git_directory.path, self.supported_extensions, ignore_globs or []
+        ):
+            document = self._load_document(git_directory, relative_path)
+            if document is not None:
+                yield document
+
+    def load_documents(
+        self,
+        git_directory: GitDirectory,
+        relative_paths: list[str],
+        ignore_globs: list[str] | None = None,
+    ) -> Generator[CodeDocument, None, None]:
+        """Loads only the given files, applying the same filters as a walk."""
+        for relative_path in self.file_discovery.filter_paths(
+            git_directory.path,
+            relative_paths,
+            self.supported_extensions,
+            ignore_globs or [],
+        ):
+            document = self._load_document(git_directory, relative_path)
+            if document is not None:
+                yield document
+
+    def _load_document(
+        self, git_directory: GitDirectory, relative_path: str
+    ) -> CodeDocument | None:
+        code = self.file_discovery.read(git_directory.path, relative_path)
+        if code is None:
+            return None
+        return CodeDocument(
+            content=code,
+            file_path=relative_path,
+            file_type=relative_path.split(".")[-1],
+            repo_owner=git_directory.repo_owner,
+            repo_name=git_directory.repo_name,
+        )
 
     def chunk_document(self, document: CodeDocument) -> ChunkedDocument:
-        splitter = CodeSplitter(
-            self._langauge_registry[document.file_type], CHUNK_SIZE_RANGE
+        start = time.perf_counter()
+        offsets = chunk_offsets(document.file_type, document.content)
+        self.telemetry.observe(
+            "chunk_seconds",
+            time.perf_counter() - start,
+            file_type=document.file_type,
         )
-        chunks = splitter.chunk_indices(document.content)
+        return self._build_chunked_document(document, offsets)
+
+    def chunk_documents_parallel(
+        self,
+        documents: Iterable[CodeDocument],
+        workers: int,
+    ) -> Generator[ChunkedDocument, None, None]:
+        """
+        Chunks documents in a pool of worker processes, yielding them in input
+        order. Documents are sent in batches of about BATCH_CHARACTERS, and at
+        most PENDING_BATCHES_PER_WORKER batches per worker are in flight, so
+        memory stays bounded however many documents are given. Fewer than
+        MIN_PARALLEL_DOCUMENTS documents are chunked in process.
+        """
+        documents = iter(documents)
+        head = list(itertools.islice(documents, MIN_PARALLEL_DOCUMENTS))
+        if len(head) < MIN_PARALLEL_DOCUMENTS:
+            for document in head:
+                yield self.chunk_document(document)
+            return
+        max_pending = workers * PENDING_BATCHES_PER_WORKER
+        pending: deque[tuple[list[CodeDocument], Future]] = deque()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            for batch in _batches(itertools.chain(head, documents)):
+                pending.append(
+                    (
+                        batch,
+                        executor.submit(
+                            chunk_offsets_batch,
+                            [
+                                (document.file_type, document.content)
+                                for document in batch
+                            ],
+                        ),
+                    )
+                )
+                if len(pending) >= max_pending:
+                    yield from self._build_from_future(*pending.popleft())
+            while pending:
+                yield from self._build_from_future(*pending.popleft())
+
+    def _build_from_future(
+        self, batch: list[CodeDocument], future: Future
+    ) -> Generator[ChunkedDocument, None, None]:
+        for document, (offsets, seconds) in zip(batch, future.result(), strict=True):
+            self.telemetry.observe(
+                "chunk_seconds", seconds, file_type=document.file_type
+            )
+            yield self._build_chunked_document(document, offsets)
+
+    def _build_chunked_document(
+        self, document: CodeDocument, offsets: list[tuple[int, int]]
+    ) -> ChunkedDocument:
         chunks = [
             CodeChunk(
-                index=index,
-                content=text,
-                file_path=document.file_path,
-                repo_owner=document.repo_owner,
-                repo_name=document.repo_name,
+                document.content,
+                start,
+                end,
+                document.repo_owner,
+                document.repo_name,
+                document.file_path,
             )
-            for index, text in chunks
+            for start, end in offsets
         ]
+        self.telemetry.increment("files_chunked")
+        self.telemetry.increment("chunks", len(chunks))
         return ChunkedDocument(
             content=document.content,
             file_path=document.file_path,
@@ -99,3 +187,19 @@ class CodeChunkingService:
     def chunk_repository(self, repository_path: str) -> list[ChunkedDocument]:
         for document in self.walk_directory(repository_path):
             yield self.chunk_document(document)
+
+
+def _batches(
+    documents: Iterable[CodeDocument],
+) -> Generator[list[CodeDocument], None, None]:
+    batch: list[CodeDocument] = []
+    characters = 0
+    for document in documents:
+        batch.append(document)
+        characters += len(document.content)
+        if characters >= BATCH_CHARACTERS:
+            yield batch
+            batch = []
+            characters = 0
+    if batch:
+        yield batch
@@ -0,0 +1,60 @@
+import importlib
+import time
+from functools import cache
+
+# Kept apart from CodeChunkingService, so chunking worker processes only
+# import the splitter and grammars.
+CHUNK_SIZE_RANGE = (500, 5000)
+
+# Module and function returning the tree-sitter grammar of each extension.
+# Grammars are only imported when a file with the extension is first chunked.
+LANGUAGE_LOADERS = {
+    "py": ("tree_sitter_python", "language"),
+    "tf": ("tree_sitter_hcl", "language"),
+    "tsx": ("tree_sitter_typescript", "language_tsx"),
+    "ts": ("tree_sitter_typescript", "language_typescript"),
+    "js": ("tree_sitter_javascript", "language"),
+    "jsx": ("tree_sitter_javascript", "language"),
+    "md": ("tree_sitter_markdown", "language"),
+    "rs": ("tree_sitter_rust", "language"),
+    "yml": ("tree_sitter_yaml", "language"),
+    "yaml": ("tree_sitter_yaml", "language"),
+}
+
+
+@cache
+def load_language(file_type: str):
+    module_name, function_name = LANGUAGE_LOADERS[file_type]
+    return getattr(importlib.import_module(module_name), function_name)()
+
+
+@cache
+def code_splitter(file_type: str):
+    from semantic_text_splitter import CodeSplitter
+
+    return CodeSplitter(load_language(file_type), CHUNK_SIZE_RANGE)
+
+
+def chunk_offsets(file_type: str, content: str) -> list[tuple[int, int]]:
+    """Returns the start and end character offsets of each chunk."""
+    return [
+        (start, start + len(text))
+        for start, text in code_splitter(file_type).chunk_indices(content)
+    ]
+
+
+def chunk_offsets_batch(
+    documents: list[tuple[str, str]],
+) -> list[tuple[list[tuple[int, int]], float]]:
+    """
+    Returns the chunk offsets of each (file_type, content) pair and the
+    seconds they took, for telemetry kept by the caller. Runs in chunking
+    worker processes, which only send offsets back, as the parent already
+    holds the content.
+    """
+    results = []
+    for file_type, content in documents:
+        start = time.perf_counter()
+        offsets = chunk_offsets(file_type, content)
+        results.append((offsets, time.perf_counter() - start))
+    return results
@@ -1,9 +1,22 @@
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, nullcontext
 from string import Template
 
+import openai
 import structlog
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
+from codemine.domain.model.code_chunk import CodeChunk
 from codemine.domain.model.code_document import ChunkedDocument
+from codemine.domain.ports.enrichment_cache import EnrichmentCache
+from codemine.domain.ports.telemetry import NullTelemetry, Telemetry
+from codemine.domain.ports.token_counter import HeuristicTokenCounter, TokenCounter
+from codemine.domain.value_objects import EnrichmentEstimate, EnrichmentStrategy
 
 logger = structlog.get_logger()
 CONTEXT_PROMPT = Template(
@@ -24,8 +37,110 @@ DOCUMENT_PROMPT = Template(
     "</document>\n"
 )
 
+GROUP_CONTEXT_PROMPT = Template(
+    "Here are the chunks we want to situate within the document given.\n"
+    "${chunks}"
+    "For each chunk, provide a short context to situate it within the overall "
+    "document to improve search retrieval of the chunk. Answer only with a "
+    'JSON object of the form {"contexts": [{"id": <chunk id>, "context": '
+    '"<succinct context>"}]} with one entry for every chunk.\n'
+)
+
+GROUP_CHUNK = Template('<chunk id="$id">\n$chunk\n</chunk>\n')
+
+DOCUMENT_EXCERPT_PROMPT = Template(
+    "Here is a summary of the document the user will chunk, followed by the "
+    "part of the document around the chunks. "
+    "Use them to generate the context for the chunks:\n"
+    "<summary>\n"
+    "$summary\n"
+    "</summary>\n"
+    "<excerpt>\n"
+    "$excerpt\n"
+    "</excerpt>\n"
+)
+
+SUMMARY_PROMPT = Template(
+    "Here is part $part of $parts of a document, with a summary of the parts "
+    "before it.\n"
+    "<summary>\n"
+    "$summary\n"
+    "</summary>\n"
+    "<part>\n"
+    "$text\n"
+    "</part>\n"
+    "Update the summary to also cover this part, keeping the purpose and "
+    "structure of the document and its main definitions. Answer only with the "
+    "updated summary.\n"
+)
+
+ENRICHMENT_MODEL = "google/gemini-2.5-flash-lite-preview-09-2025"
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_REQUEST_TIMEOUT = 60.0
+DEFAULT_MAX_RETRIES = 5
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+# How often a coroutine waiting for a shared request slot retries.
+REQUEST_SLOT_POLL_INTERVAL = 0.01
+# Chunk tokens sent in a single request by the document strategy.
+DEFAULT_GROUP_TOKEN_BUDGET = 4000
+# Bounds the size of the JSON response to a single request.
+MAX_CHUNKS_PER_GROUP = 25
+# Documents above this size are summarised, and each request is sent the
+# summary and an excerpt around its chunks instead of the whole document.
+DEFAULT_MAX_DOCUMENT_TOKENS = 32_000
+# Expected response sizes, only used for estimates.
+ESTIMATED_CONTEXT_TOKENS = 75
+ESTIMATED_JSON_TOKENS_PER_CHUNK = 15
+ESTIMATED_SUMMARY_TOKENS = 500
+# Per-message overhead of the chat format.
+MESSAGE_OVERHEAD_TOKENS = 4
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+)
+
 
 class ContextEnrichmentService:
+    """
+    The chunk strategy sends the whole document with every chunk. The document
+    strategy sends it once per group of chunks and reads their contexts from a
+    JSON response; chunks missing from the response get a request of their
+    own.
+    """
+
+    def __init__(
+        self,
+        model: str = ENRICHMENT_MODEL,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        cache: EnrichmentCache | None = None,
+        request_limiter: threading.Semaphore | None = None,
+        strategy: EnrichmentStrategy = "chunk",
+        group_token_budget: int = DEFAULT_GROUP_TOKEN_BUDGET,
+        max_document_tokens: int = DEFAULT_MAX_DOCUMENT_TOKENS,
+        token_counter: TokenCounter | None = None,
+        telemetry: Telemetry | None = None,
+    ):
+        """
+        request_limiter bounds the requests in flight across every thread and
+        event loop using this service, on top of any per-call concurrency.
+        Documents above max_document_tokens are summarised part by part, and
+        requests for them carry the summary and an excerpt around the chunks.
+        """
+        self.model = model
+        self.max_retries = max_retries
+        self.cache = cache
+        self.request_limiter = request_limiter
+        self.strategy = strategy
+        self.group_token_budget = group_token_budget
+        self.max_document_tokens = max_document_tokens
+        self.token_counter = token_counter or HeuristicTokenCounter()
+        self.telemetry = telemetry or NullTelemetry()
+
     def enrich_document(
         self, client: OpenAI, document: ChunkedDocument
     ) -> ChunkedDocument:
@@ -33,34 +148,542 @@ class ContextEnrichmentService:
         Enriches each chunk with context from the LLM.
         Returns a new ChunkedDocument with new chunks that have context set.
         """
+        with self._enrichment_span(document):
+            return self._enrich_document(client, document)
+
+    def _enrich_document(
+        self, client: OpenAI, document: ChunkedDocument
+    ) -> ChunkedDocument:
         logger.bind(document=document.file_path).info("Enriching document")
-        enriched_chunks = []
+        keys, contexts, pending = self._cached_contexts(document)
+        summary = None
+        if self.strategy == "document" and pending:
+            if self._is_large(document):
+                summary = self._summarise(client, document)
+            for group in self._group_positions(document, pending):
+                logger.bind(document=document.file_path, chunks=len(group)).info(
+                    "Enriching chunk group"
+                )
+                content = self._complete(
+                    client,
+                    self._build_group_messages(document, group, summary),
+                    response_format=JSON_RESPONSE_FORMAT,
+                )
+                self._assign_group_contexts(content, group, keys, contexts)
 
-        for chunk in document.chunks:
+        for position in pending:
+            if contexts[position] is not None:
+                continue
+            chunk = document.chunks[position]
             logger.bind(chunk=chunk.file_path, index=chunk.index).info(
                 "Enriching chunk"
             )
+            contexts[position] = self._complete(
+                client, self._build_messages(document, chunk, summary)
+            )
+            self._set_cached_context(keys[position], contexts[position])
+
+        return self._with_contexts(document, contexts)
+
+    async def enrich_documents_async(
+        self,
+        client: AsyncOpenAI,
+        documents: list[ChunkedDocument],
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+    ) -> list[ChunkedDocument]:
+        """
+        Enriches the chunks of every document concurrently, with at most
+        max_concurrency requests in flight. Documents and chunks are returned
+        in the order they were given.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        return await asyncio.gather(
+            *(
+                self.enrich_document_async(client, document, semaphore, request_timeout)
+                for document in documents
+            )
+        )
+
+    async def enrich_document_async(
+        self,
+        client: AsyncOpenAI,
+        document: ChunkedDocument,
+        semaphore: asyncio.Semaphore,
+        request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+    ) -> ChunkedDocument:
+        with self._enrichment_span(document):
+            return await self._enrich_document_async(
+                client, document, semaphore, request_timeout
+            )
+
+    async def _enrich_document_async(
+        self,
+        client: AsyncOpenAI,
+        document: ChunkedDocument,
+        semaphore: asyncio.Semaphore,
+        request_timeout: float,
+    ) -> ChunkedDocument:
+        logger.bind(document=document.file_path).info("Enriching document")
+        keys, contexts, pending = self._cached_contexts(document)
+        summary = None
+        if self.strategy == "document" and pending:
+            if self._is_large(document):
+                summary = await self._summarise_async(
+                    client, document, semaphore, request_timeout
+                )
+            groups = self._group_positions(document, pending)
+            responses = await asyncio.gather(
+                *(
+                    self._complete_async(
+                        client,
+                        self._build_group_messages(document, group, summary),
+                        semaphore,
+                        request_timeout,
+                        response_format=JSON_RESPONSE_FORMAT,
+                    )
+                    for group in groups
+                )
+            )
+            for group, content in zip(groups, responses, strict=True):
+                self._assign_group_contexts(content, group, keys, contexts)
+
+        missing = [position for position in pending if contexts[position] is None]
+        missing_contexts = await asyncio.gather(
+            *(
+                self._complete_async(
+                    client,
+                    self._build_messages(document, document.chunks[position], summary),
+                    semaphore,
+                    request_timeout,
+                )
+                for position in missing
+            )
+        )
+        for position, context in zip(missing, missing_contexts, strict=True):
+            contexts[position] = context
+            self._set_cached_context(keys[position], context)
+        return self._with_contexts(document, contexts)
+
+    def estimate_document(
+        self,
+        document: ChunkedDocument,
+        strategy: EnrichmentStrategy | None = None,
+    ) -> EnrichmentEstimate:
+        """
+        Estimates the requests and tokens needed to enrich the document with
+        an empty cache, from the prompts that would actually be sent.
+        """
+        strategy = strategy or self.strategy
+        estimate = EnrichmentEstimate()
+        if strategy == "chunk":
+            for chunk in document.chunks:
+                estimate += EnrichmentEstimate(
+                    requests=1,
+                    input_tokens=self._count_messages(
+                        self._build_messages(document, chunk)
+                    ),
+                    output_tokens=ESTIMATED_CONTEXT_TOKENS,
+                )
+            return estimate
+        if not document.chunks:
+            return estimate
+
+        summary = None
+        if self._is_large(document):
+            parts = self._split_document(document)
+            for number, part in enumerate(parts, start=1):
+                estimate += EnrichmentEstimate(
+                    requests=1,
+                    input_tokens=self._count_messages(
+                        self._build_summary_messages("", part, number, len(parts))
+                    )
+                    + ESTIMATED_SUMMARY_TOKENS,
+                    output_tokens=ESTIMATED_SUMMARY_TOKENS,
+                )
+            summary = ""
+        positions = list(range(len(document.chunks)))
+        for group in self._group_positions(document, positions):
+            input_tokens = self._count_messages(
+                self._build_group_messages(document, group, summary)
+            )
+            if summary is not None:
+                input_tokens += ESTIMATED_SUMMARY_TOKENS
+            estimate += EnrichmentEstimate(
+                requests=1,
+                input_tokens=input_tokens,
+                output_tokens=len(group)
+                * (ESTIMATED_CONTEXT_TOKENS + ESTIMATED_JSON_TOKENS_PER_CHUNK),
+            )
+        return estimate
+
+    def _enrichment_span(self, document: ChunkedDocument):
+        return self.telemetry.span(
+            "enrich_document",
+            file_path=document.file_path,
+            chunks=len(document.chunks),
+        )
+
+    def _complete(self, client: OpenAI, messages: list[dict], **kwargs) -> str | None:
+        with self.request_limiter or nullcontext():
+            start = time.perf_counter()
             response = client.chat.completions.create(
-                model="google/gemini-2.5-flash-lite-preview-09-2025",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": DOCUMENT_PROMPT.substitute(
-                            document=document.content
-                        ),
-                        "cache_control": {"type": "ephemeral"},
-                    },
-                    {
-                        "role": "user",
-                        "content": CONTEXT_PROMPT.substitute(chunk=chunk.content),
-                        "cache_control": {"type": "ephemeral"},
-                    },
-                ],
+                model=self.model, messages=messages, **kwargs
             )
+        self._record_response(response, time.perf_counter() - start)
+        return response.choices[0].message.content
 
-            enriched_chunk = chunk.model_copy(
-                update={"context": response.choices[0].message.content}
+    async def _complete_async(
+        self,
+        client: AsyncOpenAI,
+        messages: list[dict],
+        semaphore: asyncio.Semaphore,
+        request_timeout: float,
+        **kwargs,
+    ) -> str | None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore, self._request_slot():
+                    start = time.perf_counter()
+                    response = await client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        timeout=request_timeout,
+                        **kwargs,
+                    )
+                self._record_response(response, time.perf_counter() - start)
+                return response.choices[0].message.content
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    self.telemetry.increment(
+                        "enrichment_errors", error=type(e).__name__
+                    )
+                    raise
+                self.telemetry.increment("enrichment_retries", error=type(e).__name__)
+                delay = self._backoff_delay(attempt)
+                logger.bind(
+                    attempt=attempt + 1,
+                    delay=delay,
+                    error=type(e).__name__,
+                ).warning("Retrying enrichment request")
+                await asyncio.sleep(delay)
+
+    def _record_response(self, response, seconds: float) -> None:
+        self.telemetry.observe("enrichment_request_seconds", seconds)
+        self.telemetry.increment("enrichment_requests")
+        usage = response.usage
+        if usage is not None:
+            self.telemetry.increment("enrichment_input_tokens", usage.prompt_tokens)
+            self.telemetry.increment(
+                "enrichment_output_tokens", usage.completion_tokens
+            )
+
+    @asynccontextmanager
+    async def _request_slot(self):
+        if self.request_limiter is None:
+            yield
+            return
+        # Polling rather than acquiring in a worker thread, so a cancelled
+        # coroutine never leaves a slot acquired on its behalf.
+        while not self.request_limiter.acquire(blocking=False):
+            await asyncio.sleep(REQUEST_SLOT_POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            self.request_limiter.release()
+
+    def _summarise(self, client: OpenAI, document: ChunkedDocument) -> str:
+        cache_key = self._summary_cache_key(document)
+        summary = self._get_cached_context(cache_key)
+        if summary is not None:
+            return summary
+        summary = ""
+        parts = self._split_document(document)
+        for number, part in enumerate(parts, start=1):
+            logger.bind(document=document.file_path, part=number).info(
+                "Summarising document part"
+            )
+            messages = self._build_summary_messages(summary, part, number, len(parts))
+            summary = self._complete(client, messages) or ""
+        self._set_cached_context(cache_key, summary)
+        return summary
+
+    async def _summarise_async(
+        self,
+        client: AsyncOpenAI,
+        document: ChunkedDocument,
+        semaphore: asyncio.Semaphore,
+        request_timeout: float,
+    ) -> str:
+        cache_key = self._summary_cache_key(document)
+        summary = self._get_cached_context(cache_key)
+        if summary is not None:
+            return summary
+        summary = ""
+        parts = self._split_document(document)
+        for number, part in enumerate(parts, start=1):
+            logger.bind(document=document.file_path, part=number).info(
+                "Summarising document part"
+            )
+            messages = self._build_summary_messages(summary, part, number, len(parts))
+            summary = (
+                await self._complete_async(client, messages, semaphore, request_timeout)
+                or ""
             )
-            enriched_chunks.append(enriched_chunk)
+        self._set_cached_context(cache_key, summary)
+        return summary
+
+    def _cached_contexts(
+        self, document: ChunkedDocument
+    ) -> tuple[list[str], list[str | None], list[int]]:
+        """
+        Returns the cache key and cached context of every chunk, and the
+        positions of the chunks without one.
+        """
+        document_hash = self._document_hash(document)
+        keys = [self.cache_key(document_hash, chunk) for chunk in document.chunks]
+        contexts = [self._get_cached_context(key) for key in keys]
+        pending = [
+            position for position, context in enumerate(contexts) if context is None
+        ]
+        self.telemetry.increment(
+            "enrichment_chunks", len(keys) - len(pending), cached="true"
+        )
+        self.telemetry.increment("enrichment_chunks", len(pending), cached="false")
+        return keys, contexts, pending
 
+    def _group_positions(
+        self, document: ChunkedDocument, positions: list[int]
+    ) -> list[list[int]]:
+        """Groups chunk positions so each group stays within the token budget."""
+        groups = []
+        group = []
+        group_tokens = 0
+        for position in positions:
+            tokens = self.token_counter.count_tokens(document.chunks[position].content)
+            if group and (
+                group_tokens + tokens > self.group_token_budget
+                or len(group) >= MAX_CHUNKS_PER_GROUP
+            ):
+                groups.append(group)
+                group = []
+                group_tokens = 0
+            group.append(position)
+            group_tokens += tokens
+        if group:
+            groups.append(group)
+        return groups
+
+    def _assign_group_contexts(
+        self,
+        content: str | None,
+        group: list[int],
+        keys: list[str],
+        contexts: list[str | None],
+    ) -> None:
+        group_contexts = _parse_group_contexts(content, len(group))
+        for position, context in zip(group, group_contexts, strict=True):
+            if context is not None:
+                contexts[position] = context
+                self._set_cached_context(keys[position], context)
+
+    @staticmethod
+    def _with_contexts(
+        document: ChunkedDocument, contexts: list[str | None]
+    ) -> ChunkedDocument:
+        enriched_chunks = [
+            chunk.with_context(context)
+            for chunk, context in zip(document.chunks, contexts, strict=True)
+        ]
         return document.model_copy(update={"chunks": enriched_chunks})
+
+    def _is_large(self, document: ChunkedDocument) -> bool:
+        return (
+            self.token_counter.count_tokens(document.content) > self.max_document_tokens
+        )
+
+    def _window_characters(self, document: ChunkedDocument) -> int:
+        """Characters of the document that fit in max_document_tokens."""
+        tokens = max(self.token_counter.count_tokens(document.content), 1)
+        return max(1, len(document.content) * self.max_document_tokens // tokens)
+
+    def _split_document(self, document: ChunkedDocument) -> list[str]:
+        size = self._window_characters(document)
+        return [
+            document.content[start : start + size]
+            for start in range(0, len(document.content), size)
+        ]
+
+    def _excerpt(self, document: ChunkedDocument, chunks: list[CodeChunk]) -> str:
+        """
+        Returns the part of the document around the chunks, taking half of
+        max_document_tokens so the summary and chunks still fit.
+        """
+        content = document.content
+        span_start = min((chunk.start for chunk in chunks), default=0)
+        span_end = max((chunk.end for chunk in chunks), default=0)
+        padding = max(
+            0, (self._window_characters(document) // 2 - (span_end - span_start)) // 2
+        )
+        return content[max(0, span_start - padding) : span_end + padding]
+
+    @property
+    def context_scope(self) -> str:
+        """
+        Hash of what a chunk's context depends on besides its document and
+        content: the model, the strategy and its prompts.
+        """
+        return self._hash(self.strategy, *self._prompts())
+
+    def cache_key(self, document_hash: str, chunk: CodeChunk) -> str:
+        """
+        Content address of a chunk's context: any change to the model, the
+        prompts, the parent document or the chunk itself yields a new key.
+        """
+        return self._hash(*self._prompts(), document_hash, chunk.content)
+
+    def _prompts(self) -> list[str]:
+        prompts = [CONTEXT_PROMPT.template, DOCUMENT_PROMPT.template]
+        if self.strategy == "document":
+            prompts += [
+                GROUP_CONTEXT_PROMPT.template,
+                DOCUMENT_EXCERPT_PROMPT.template,
+                str(self.max_document_tokens),
+            ]
+        return prompts
+
+    def _summary_cache_key(self, document: ChunkedDocument) -> str:
+        return self._hash(
+            SUMMARY_PROMPT.template,
+            str(self.max_document_tokens),
+            self._document_hash(document),
+        )
+
+    def _hash(self, *parts: str) -> str:
+        hasher = hashlib.sha256()
+        for part in (self.model, *parts):
+            hasher.update(part.encode("utf-8"))
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+
+    def _get_cached_context(self, cache_key: str) -> str | None:
+        if self.cache is None:
+            return None
+        return self.cache.get(cache_key)
+
+    def _set_cached_context(self, cache_key: str, context: str | None) -> None:
+        if self.cache is not None and context is not None:
+            self.cache.set(cache_key, context)
+
+    def _count_messages(self, messages: list[dict]) -> int:
+        return sum(
+            self.token_counter.count_tokens(message["content"])
+            + MESSAGE_OVERHEAD_TOKENS
+            for message in messages
+        )
+
+    @staticmethod
+    def _document_hash(document: ChunkedDocument) -> str:
+        return hashlib.sha256(document.content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _backoff_delay(attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
+
+    def _document_message(
+        self,
+        document: ChunkedDocument,
+        chunks: list[CodeChunk],
+        summary: str | None,
+    ) -> dict:
+        if summary is None:
+            content = DOCUMENT_PROMPT.substitute(document=document.content)
+        else:
+            content = DOCUMENT_EXCERPT_PROMPT.substitute(
+                summary=summary, excerpt=self._excerpt(document, chunks)
+            )
+        return {
+            "role": "system",
+            "content": content,
+            "cache_control": {"type": "ephemeral"},
+        }
+
+    def _build_messages(
+        self,
+        document: ChunkedDocument,
+        chunk: CodeChunk,
+        summary: str | None = None,
+    ) -> list[dict]:
+        return [
+            self._document_message(document, [chunk], summary),
+            {
+                "role": "user",
+                "content": CONTEXT_PROMPT.substitute(chunk=chunk.content),
+                "cache_control": {"type": "ephemeral"},
+            },
+        ]
+
+    def _build_group_messages(
+        self,
+        document: ChunkedDocument,
+        positions: list[int],
+        summary: str | None = None,
+    ) -> list[dict]:
+        chunks = [document.chunks[position] for position in positions]
+        return [
+            self._document_message(document, chunks, summary),
+            {
+                "role": "user",
+                "content": GROUP_CONTEXT_PROMPT.substitute(
+                    chunks="".join(
+                        GROUP_CHUNK.substitute(id=number, chunk=chunk.content)
+                        for number, chunk in enumerate(chunks)
+                    )
+                ),
+            },
+        ]
+
+    @staticmethod
+    def _build_summary_messages(
+        summary: str, part: str, number: int, parts: int
+    ) -> list[dict]:
+        return [
+            {
+                "role": "user",
+                "content": SUMMARY_PROMPT.substitute(
+                    part=number, parts=parts, summary=summary, text=part
+                ),
+            }
+        ]
+
+
+def _parse_group_contexts(content: str | None, size: int) -> list[str | None]:
+    """
+    Reads the contexts of a group of size chunks from a JSON response, by
+    chunk id. Chunks without a usable context are left as None.
+    """
+    contexts: list[str | None] = [None] * size
+    if not content:
+        return contexts
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json")
+    try:
+        items = json.loads(text)["contexts"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        logger.bind(response=content[:200]).warning(
+            "Could not parse chunk group contexts"
+        )
+        return contexts
+    if not isinstance(items, list):
+        return contexts
+    for item in items:
+        try:
+            number = int(item["id"])
+            context = item["context"]
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 0 <= number < size and isinstance(context, str) and context:
+            contexts[number] = context
+    return contexts
@@ -0,0 +1,332 @@
+import fnmatch
+import os
+import re
+import stat
+import subprocess
+import time
+from collections.abc import Iterable, Iterator
+
+from structlog import get_logger
+
+from codemine.domain.ports.telemetry import NullTelemetry, Telemetry
+from codemine.domain.value_objects import FileSource
+
+logger = get_logger()
+
+# Directories that never hold code worth indexing: version control metadata,
+# dependencies, vendored trees, caches and virtual environments.
+PRUNED_DIRECTORIES = frozenset(
+    {
+        ".git",
+        ".hg",
+        ".svn",
+        "node_modules",
+        "bower_components",
+        "vendor",
+        "third_party",
+        "__pycache__",
+        ".venv",
+        "venv",
+        ".tox",
+        ".nox",
+        ".mypy_cache",
+        ".pytest_cache",
+        ".ruff_cache",
+    }
+)
+# Larger files are almost always generated code or data.
+MAX_FILE_BYTES = 1024 * 1024
+# Files with a NUL byte in their first bytes are treated as binary.
+BINARY_SNIFF_BYTES = 8192
+
+
+def compile_globs(globs: Iterable[str]) -> re.Pattern | None:
+    """Compiles fnmatch globs into one pattern matching any of them."""
+    patterns = [fnmatch.translate(glob) for glob in globs]
+    if not patterns:
+        return None
+    return re.compile("|".join(patterns))
+
+
+class GitignoreRules:
+    """The patterns of one .gitignore file, matched relative to its directory."""
+
+    def __init__(self, base: str, lines: Iterable[str]):
+        self.base = base
+        self.rules: list[tuple[re.Pattern, bool, bool]] = []
+        for line in lines:
+            rule = _parse_gitignore_line(line)
+            if rule is not None:
+                self.rules.append(rule)
+        # Most paths match no pattern, which one combined pattern rules out.
+        self._any = re.compile("|".join(rule.pattern for rule, _, _ in self.rules))
+
+    @classmethod
+    def from_file(cls, path: str, base: str) -> "GitignoreRules | None":
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                rules = cls(base, f)
+        except OSError:
+            return None
+        return rules if rules.rules else None
+
+    def match(self, relative_path: str, is_dir: bool) -> bool | None:
+        """
+        Returns whether the last pattern matching the path ignores it, or None
+        if no pattern matches.
+        """
+        path = relative_path[len(self.base) :]
+        if not self._any.match(path):
+            return None
+        for pattern, negated, dir_only in reversed(self.rules):
+            if (is_dir or not dir_only) and pattern.match(path):
+                return not negated
+        return None
+
+
+def _parse_gitignore_line(line: str) -> tuple[re.Pattern, bool, bool] | None:
+    line = line.rstrip("\r\n")
+    if not line.endswith("\\ "):
+        line = line.rstrip(" ")
+    if not line or line.startswith("#"):
+        return None
+    negated = line.startswith("!")
+    if negated:
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    # Patterns with a slash are relative to the .gitignore, others match at
+    # any depth.
+    prefix = "" if "/" in line else "(?:.*/)?"
+    return re.compile(prefix + _gitignore_regex(line.lstrip("/"))), negated, dir_only
+
+
+def _gitignore_regex(pattern: str) -> str:
+    parts = []
+    position = 0
+    while position < len(pattern):
+        char = pattern[position]
+        if pattern.startswith("**/", position):
+            parts.append("(?:.*/)?")
+            position += 3
+            continue
+        if pattern.startswith("**", position):
+            parts.append(".*")
+            position += 2
+            continue
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[" and (end := pattern.find("]", position + 2)) != -1:
+            body = pattern[position + 1 : end].replace("\\", "\\\\")
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            parts.append(f"[{body}]")
+            position = end + 1
+            continue
+        elif char == "\\" and position + 1 < len(pattern):
+            parts.append(re.escape(pattern[position + 1]))
+            position += 2
+            continue
+        else:
+            parts.append(re.escape(char))
+        position += 1
+    return "".join(parts) + r"\Z"
+
+
+def _is_gitignored(
+    rule_stack: tuple[GitignoreRules, ...], relative_path: str, is_dir: bool
+) -> bool:
+    # Deeper .gitignore files take precedence over the ones above them.
+    for rules in reversed(rule_stack):
+        ignored = rules.match(relative_path, is_dir)
+        if ignored is not None:
+            return ignored
+    return False
+
+
+class FileDiscoveryService:
+    """
+    Lists the files of a checkout to index. The "git" source lists the files
+    tracked by git from its index, which is much faster than walking the
+    directory. The "walk" source honours .gitignore files and never descends
+    into pruned or ignored directories. "auto" uses git for git checkouts.
+
+    Ignore globs are fnmatch patterns matched against the full file path.
+    """
+
+    def __init__(
+        self,
+        source: FileSource = "auto",
+        max_file_bytes: int = MAX_FILE_BYTES,
+        pruned_directories: frozenset[str] = PRUNED_DIRECTORIES,
+        telemetry: Telemetry | None = None,
+    ):
+        self.source = source
+        self.max_file_bytes = max_file_bytes
+        self.pruned_directories = pruned_directories
+        self.telemetry = telemetry or NullTelemetry()
+
+    def discover(
+        self,
+        root: str,
+        extensions: Iterable[str],
+        ignore_globs: Iterable[str] = (),
+    ) -> Iterator[str]:
+        """Yields the paths, relative to root, of files with one of extensions."""
+        start = time.perf_counter()
+        extensions = frozenset(extensions)
+        ignore_globs = list(ignore_globs)
+        source = self.source
+        if source == "auto":
+            source = "git" if os.path.exists(os.path.join(root, ".git")) else "walk"
+        paths = self._git_files(root) if source == "git" else None
+        if paths is None:
+            source = "walk"
+            paths = self._walk(root, extensions, ignore_globs)
+        else:
+            paths = self.filter_paths(root, paths, extensions, ignore_globs)
+        files = 0
+        for path in paths:
+            files += 1
+            yield path
+        self.telemetry.increment("files_discovered", files, source=source)
+        logger.bind(
+            root=root,
+            source=source,
+            files=files,
+            seconds=round(time.perf_counter() - start, 4),
+        ).info("Discovered files")
+
+    def filter_paths(
+        self,
+        root: str,
+        relative_paths: Iterable[str],
+        extensions: Iterable[str],
+        ignore_globs: Iterable[str] = (),
+    ) -> Iterator[str]:
+        """
+        Yields the paths with one of extensions that are not under a pruned
+        directory or matched by an ignore glob.
+        """
+        extensions = frozenset(extensions)
+        ignore_matcher = compile_globs(ignore_globs)
+        prefix = os.path.join(root, "")
+        for path in relative_paths:
+            if path.rpartition(".")[2] not in extensions:
+                continue
+            if not self.pruned_directories.isdisjoint(path.split("/")[:-1]):
+                continue
+            if ignore_matcher is not None and ignore_matcher.match(prefix + path):
+                continue
+            yield path
+
+    def read(self, root: str, relative_path: str) -> str | None:
+        """
+        Reads a regular file as text. Returns None for missing files, symlinks,
+        files larger than max_file_bytes and binary files. Bytes that are not
+        valid UTF-8 are replaced.
+        """
+        path = os.path.join(root, relative_path)
+        try:
+            info = os.lstat(path)
+            if not stat.S_ISREG(info.st_mode):
+                return None
+            if info.st_size > self.max_file_bytes:
+                logger.bind(file=path, size=info.st_size).info("Skipping large file")
+                self.telemetry.increment("files_skipped", reason="large")
+                return None
+            with open(path, "rb") as f:
+                data = f.read(self.max_file_bytes + 1)
+        except OSError:
+            return None
+        if b"\0" in data[:BINARY_SNIFF_BYTES]:
+            logger.bind(file=path).info("Skipping binary file")
+            self.telemetry.increment("files_skipped", reason="binary")
+            return None
+        self.telemetry.increment("source_bytes", len(data))
+        try:
+            return data.decode("utf-8")
+        except UnicodeDecodeError:
+            return data.decode("utf-8", errors="replace")
+
+    def _git_files(self, root: str) -> list[str] | None:
+        try:
+            result = subprocess.run(
+                [
+                    "git",
+                    "-C",
+                    root,
+                    "ls-files",
+                    "-z",
+                    "--cached",
+                ],
+                check=True,
+                capture_output=True,
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.bind(root=root, error=str(e)).warning(
+                "Could not list files with git, walking the directory instead"
+            )
+            return None
+        return [
+            path
+            for path in result.stdout.decode("utf-8", "surrogateescape").split("\0")
+            if path
+        ]
+
+    def _walk(
+        self, root: str, extensions: frozenset[str], ignore_globs: list[str]
+    ) -> Iterator[str]:
+        ignore_matcher = compile_globs(ignore_globs)
+        # A glob ending in "*" that matches a directory path with a trailing
+        # separator matches every path below it, so the directory is skipped.
+        prune_matcher = compile_globs(
+            glob for glob in ignore_globs if glob.endswith("*")
+        )
+        exclude = GitignoreRules.from_file(
+            os.path.join(root, ".git", "info", "exclude"), ""
+        )
+        stack: list[tuple[str, tuple[GitignoreRules, ...]]] = [
+            ("", (exclude,) if exclude is not None else ())
+        ]
+        while stack:
+            relative_dir, rule_stack = stack.pop()
+            try:
+                with os.scandir(os.path.join(root, relative_dir)) as iterator:
+                    entries = list(iterator)
+            except OSError as e:
+                logger.bind(directory=relative_dir, error=str(e)).warning(
+                    "Could not list directory"
+                )
+                continue
+            if any(entry.name == ".gitignore" for entry in entries):
+                rules = GitignoreRules.from_file(
+                    os.path.join(root, relative_dir, ".gitignore"), relative_dir
+                )
+                if rules is not None:
+                    rule_stack = (*rule_stack, rules)
+            for entry in entries:
+                name = entry.name
+                relative_path = relative_dir + name
+                if entry.is_dir(follow_symlinks=False):
+                    if (
+                        name in self.pruned_directories
+                        or _is_gitignored(rule_stack, relative_path, True)
+                        or (
+                            prune_matcher is not None
+                            and prune_matcher.match(entry.path + os.sep)
+                        )
+                    ):
+                        continue
+                    stack.append((relative_path + "/", rule_stack))
+                elif (
+                    name.rpartition(".")[2] in extensions
+                    and entry.is_file(follow_symlinks=False)
+                    and not _is_gitignored(rule_stack, relative_path, False)
+                    and (ignore_matcher is None or not ignore_matcher.match(entry.path))
+                ):
+                    yield relative_path
@@ -1,4 +1,4 @@
-from typing import Annotated
+from typing import Annotated, Literal
 
 import pydantic
 
@@ -8,6 +8,13 @@ CodeDocumentContent = Annotated[str, "The content of a code document"]
 
 ContextualizedContent = Annotated[str, "The content of a code chunk with context"]
 
+CloneStrategy = Literal["full", "shallow", "partial", "mirror"]
+BatchPriority = Literal["none", "size", "stale"]
+EnrichmentStrategy = Literal["chunk", "document"]
+SearchMode = Literal["vector", "lexical", "hybrid"]
+FileSource = Literal["auto", "git", "walk"]
+DeduplicationMode = Literal["off", "exact", "near"]
+
 
 class GenericRecord(pydantic.BaseModel):
     id: str
@@ -19,7 +26,164 @@ class EmbeddedRecord(GenericRecord):
     embedded_content: list[float]
 
 
+def chunk_id_prefix(
+    repo_owner: str, repo_name: str, file_path: str | None = None
+) -> str:
+    """
+    Prefix of the chunk IDs of a repo, or of one of its files. As file paths
+    can contain '#', a file's prefix can also match the IDs of other files.
+    """
+    if file_path is None:
+        return f"{repo_owner}#{repo_name}#"
+    return f"{repo_owner}#{repo_name}#{file_path}#"
+
+
+def file_path_from_chunk_id(chunk_id: str, repo_owner: str, repo_name: str) -> str:
+    """
+    Chunk IDs have the format owner#repo#file_path#index. Owner and repo names
+    cannot contain '#' but file paths can, so the path is what lies between the
+    known prefix and the last '#'.
+    """
+    prefix = chunk_id_prefix(repo_owner, repo_name)
+    if not chunk_id.startswith(prefix):
+        raise ValueError(f"Chunk ID {chunk_id} does not belong to {prefix}")
+    return chunk_id[len(prefix) :].rpartition("#")[0]
+
+
+class SearchFilter(pydantic.BaseModel):
+    """
+    Narrows a search to the chunks matching every field that is set.
+    path_prefix is a directory, so "src/api" matches src/api/routes.py but
+    not src/api_v2.py. file_types are file extensions without the dot.
+    """
+
+    repo_owner: str | None = None
+    repo_name: str | None = None
+    path_prefix: str | None = None
+    file_types: list[str] = []
+
+    @pydantic.field_validator("path_prefix")
+    @classmethod
+    def _strip_slashes(cls, path_prefix: str | None) -> str | None:
+        return path_prefix.strip("/") or None if path_prefix is not None else None
+
+    @property
+    def is_empty(self) -> bool:
+        return not (
+            self.repo_owner or self.repo_name or self.path_prefix or self.file_types
+        )
+
+
+def file_type_from_path(file_path: str) -> str:
+    return file_path.split(".")[-1]
+
+
+def file_directories(file_path: str) -> list[str]:
+    """Returns every directory containing the file, e.g. ["src", "src/api"]."""
+    parts = file_path.split("/")[:-1]
+    return ["/".join(parts[: depth + 1]) for depth in range(len(parts))]
+
+
+class OutdatedVectorsReport(pydantic.BaseModel):
+    scanned_vectors: int = 0
+    outdated_vectors: int = 0
+    outdated_files: int = 0
+    seconds: float = 0.0
+    dry_run: bool = False
+
+
+class ManifestEntry(pydantic.BaseModel):
+    chunk_id: str
+    file_path: str
+    content_hash: str
+    commit_sha: str | None = None
+    model_version: str
+
+
+class RepositoryRef(pydantic.BaseModel):
+    owner: str
+    name: str
+    size_kb: int | None = None
+    pushed_at: str | None = None
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.owner}/{self.name}"
+
+
+JobStatus = Literal["pending", "running", "succeeded", "failed"]
+
+
+class BatchJob(pydantic.BaseModel):
+    """State of one repository's embed run within a batch."""
+
+    repository: RepositoryRef
+    status: JobStatus = "pending"
+    attempts: int = 0
+    error: str | None = None
+    chunked_files: int = 0
+    total_chunks: int = 0
+    seconds: float = 0.0
+
+
+CheckpointStage = Literal["chunked", "enriched", "upserted"]
+
+
+class EmbedRunKey(pydantic.BaseModel):
+    """Identifies the embed run of one commit of a repo into an index."""
+
+    index_name: str
+    repo_owner: str
+    repo_name: str
+    commit_sha: str
+
+
+class EnrichmentEstimate(pydantic.BaseModel):
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    def __add__(self, other: "EnrichmentEstimate") -> "EnrichmentEstimate":
+        return EnrichmentEstimate(
+            requests=self.requests + other.requests,
+            input_tokens=self.input_tokens + other.input_tokens,
+            output_tokens=self.output_tokens + other.output_tokens,
+        )
+
+    def cost(
+        self, input_cost_per_million: float, output_cost_per_million: float
+    ) -> float:
+        return (
+            self.input_tokens * input_cost_per_million
+            + self.output_tokens * output_cost_per_million
+        ) / 1_000_000
+
+
 class GitDirectory(pydantic.BaseModel):
     path: str
     repo_owner: str
     repo_name: str
+    commit_sha: str | None = None
+
+
+class GitDiff(pydantic.BaseModel):
+    """File level changes between two commits, as paths relative to the repo."""
+
+    added: list[str] = []
+    modified: list[str] = []
+    deleted: list[str] = []
+    renamed: list[tuple[str, str]] = []
+
+    @property
+    def changed_paths(self) -> list[str]:
+        """Paths whose current content needs to be embedded."""
+        return self.added + self.modified + [new for _, new in self.renamed]
+
+    @property
+    def stale_paths(self) -> list[str]:
+        """Paths whose previously embedded vectors are no longer valid."""
+        return self.modified + self.deleted + [old for old, _ in self.renamed]
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.modified or self.deleted or self.renamed)
@@ -1,23 +1,159 @@
+import json
+import math
+import urllib.error
+import urllib.request
+from collections.abc import Callable
+from functools import cached_property
+from typing import TYPE_CHECKING
+
+import numpy as np
+import structlog
+
 from codemine.domain.ports.embedding_client import EmbeddingClient
 from codemine.domain.ports.git_client import GitClient
-from codemine.domain.value_objects import EmbeddedRecord, GenericRecord
+from codemine.domain.ports.telemetry import NullTelemetry, Telemetry
+from codemine.domain.ports.token_counter import CHARACTERS_PER_TOKEN, TokenCounter
+from codemine.domain.value_objects import GenericRecord, RepositoryRef
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+logger = structlog.get_logger()
+
+# Requests to the embeddings endpoint are limited to this many inputs.
+EMBEDDING_BATCH_MAX_INPUTS = 2048
+DEFAULT_EMBEDDING_BATCH_TOKENS = 100_000
+GITHUB_API_URL = "https://api.github.com"
+GITHUB_PAGE_SIZE = 100
+TIKTOKEN_ENCODING = "o200k_base"
 
 
 class GithubGitClient(GitClient):
-    def __init__(self, token: str):
+    def __init__(
+        self,
+        token: str,
+        mirror_cache_dir: str | None = None,
+        telemetry: Telemetry | None = None,
+    ):
         self.token = token
+        self.mirror_cache_dir = mirror_cache_dir
+        self.telemetry = telemetry or NullTelemetry()
 
     def generate_url(self, owner: str, repo_name: str, *args, **kwargs) -> str:
         return f"https://{self.token}@github.com/{owner}/{repo_name}.git"
 
+    def list_repositories(self, owner: str) -> list[RepositoryRef]:
+        try:
+            return self._list_repositories(f"/orgs/{owner}/repos")
+        except urllib.error.HTTPError as e:
+            if e.code != 404:
+                raise
+            # Not an organisation, so list the user's repositories instead.
+            return self._list_repositories(f"/users/{owner}/repos")
 
-class ConstantEmbeddingClient(EmbeddingClient):
-    def embed_generic_record(
-        self, record: GenericRecord, *args, **kwargs
-    ) -> EmbeddedRecord:
-        return EmbeddedRecord(
-            id=record.id,
-            unembedded_content=record.unembedded_content,
-            embedded_content=[0.5] * 1024,
-            metadata=record.metadata,
+    def describe_repository(self, owner: str, repo_name: str) -> RepositoryRef:
+        return self._repository_ref(self._github_api(f"/repos/{owner}/{repo_name}"))
+
+    def _list_repositories(self, path: str) -> list[RepositoryRef]:
+        repositories = []
+        page = 1
+        while True:
+            items = self._github_api(
+                f"{path}?per_page={GITHUB_PAGE_SIZE}&page={page}&type=all"
+            )
+            repositories.extend(self._repository_ref(item) for item in items)
+            if len(items) < GITHUB_PAGE_SIZE:
+                return repositories
+            page += 1
+
+    def _github_api(self, path: str):
+        request = urllib.request.Request(
+            GITHUB_API_URL + path,
+            headers={
+                "Authorization": f"Bearer {self.token}",
+                "Accept": "application/vnd.github+json",
+            },
         )
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+
+    @staticmethod
+    def _repository_ref(item: dict) -> RepositoryRef:
+        return RepositoryRef(
+            owner=item["owner"]["login"],
+            name=item["name"],
+            size_kb=item.get("size"),
+            pushed_at=item.get("pushed_at"),
+        )
+
+
+class TiktokenTokenCounter(TokenCounter):
+    """
+    Counts tokens with a tiktoken encoding. tiktoken is optional; install it
+    for exact counts with OpenAI models and close estimates with others.
+    """
+
+    def __init__(self, encoding: str = TIKTOKEN_ENCODING):
+        import tiktoken
+
+        self._encoding = tiktoken.get_encoding(encoding)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+class OpenAIEmbeddingClient(EmbeddingClient):
+    """
+    Embeds records with an OpenAI-compatible embeddings endpoint, packing as
+    many records into each request as the token budget allows. The client is
+    built by client_factory when the first records are embedded.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], "OpenAI"],
+        model: str,
+        dimension: int,
+        max_batch_tokens: int = DEFAULT_EMBEDDING_BATCH_TOKENS,
+    ):
+        self.client_factory = client_factory
+        self.model = model
+        self.dimension = dimension
+        self.max_batch_tokens = max_batch_tokens
+
+    @cached_property
+    def client(self) -> "OpenAI":
+        return self.client_factory()
+
+    def embed_records(self, records: list[GenericRecord]) -> np.ndarray:
+        vectors = np.empty((len(records), self.dimension), dtype=np.float32)
+        for start, end in self._pack(records):
+            response = self.client.embeddings.create(
+                model=self.model,
+                input=[record.unembedded_content for record in records[start:end]],
+            )
+            for item in response.data:
+                vectors[start + item.index] = item.embedding
+            logger.bind(inputs=end - start, model=self.model).info(
+                "Embedded records batch"
+            )
+        return vectors
+
+    def _pack(self, records: list[GenericRecord]) -> list[tuple[int, int]]:
+        """Splits records into [start, end) ranges within the request limits."""
+        ranges = []
+        start = 0
+        batch_tokens = 0
+        for position, record in enumerate(records):
+            tokens = math.ceil(len(record.unembedded_content) / CHARACTERS_PER_TOKEN)
+            if position > start and (
+                batch_tokens + tokens > self.max_batch_tokens
+                or position - start >= EMBEDDING_BATCH_MAX_INPUTS
+            ):
+                ranges.append((start, position))
+                start = position
+                batch_tokens = 0
+            batch_tokens += tokens
+        if start < len(records):
+            ranges.append((start, len(records)))
+        return ranges
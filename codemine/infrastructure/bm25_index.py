@@ -0,0 +1,605 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from collections.abc import Iterable
+from functools import lru_cache
+
+import numpy as np
+import structlog
+
+from codemine.domain.model.code_document import ChunkedDocument
+from codemine.domain.repositories.lexical_index_repo import LexicalIndexRepo
+from codemine.domain.value_objects import GenericRecord, SearchFilter
+from codemine.infrastructure.sql_filters import search_filter_clauses
+
+logger = structlog.get_logger()
+
+DOCUMENTS_FILE = "documents.sqlite"
+INDEX_INFO_FILE = "index.json"
+TERM_OFFSETS_FILE = "term_offsets.i64"
+POSTING_ROWS_FILE = "posting_rows.i32"
+POSTING_FREQUENCIES_FILE = "posting_frequencies.u16"
+LENGTHS_FILE = "lengths.i32"
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Fraction of removed documents above which a commit rebuilds the postings
+# and renumbers the documents instead of merging.
+COMPACTION_THRESHOLD = 0.25
+MAX_TERM_FREQUENCY = np.iinfo(np.uint16).max
+MIN_TOKEN_LENGTH = 2
+IDENTIFIER_CACHE_SIZE = 1 << 16
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z0-9_]+")
+SUBWORD_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Splits text into lowercase tokens for code search. Identifiers are kept
+    whole and also split at snake_case and camelCase boundaries, so
+    parseHTTPResponse yields parsehttpresponse, parse, http and response.
+    """
+    tokens = []
+    for identifier in IDENTIFIER_PATTERN.findall(text):
+        tokens.extend(_identifier_tokens(identifier))
+    return tokens
+
+
+# Identifiers repeat often within a codebase, so their splits are cached.
+@lru_cache(maxsize=IDENTIFIER_CACHE_SIZE)
+def _identifier_tokens(identifier: str) -> tuple[str, ...]:
+    parts = SUBWORD_PATTERN.findall(identifier)
+    tokens = [part.lower() for part in parts]
+    if len(parts) != 1 or parts[0] != identifier:
+        tokens.insert(0, identifier.lower())
+    return tuple(token for token in tokens if len(token) >= MIN_TOKEN_LENGTH)
+
+
+class Bm25Index(LexicalIndexRepo):
+    """
+    BM25 index of chunks kept on the local disk. Chunks are stored in a SQLite
+    sidecar keyed by row, and the inverted index in flat arrays that are
+    memory-mapped for search: the postings of term t are the rows and term
+    frequencies between term_offsets[t] and term_offsets[t + 1], sorted by
+    row. The vocabulary maps terms to IDs in SQLite, so a search only reads
+    the postings of its own terms.
+
+    Added chunks are tokenised on commit and merged into the postings with
+    numpy. Removed chunks are tombstoned until the next commit.
+    """
+
+    def __init__(self, directory: str, k1: float = BM25_K1, b: float = BM25_B):
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._connection: sqlite3.Connection | None = None
+        self._indexed_rows = 0
+        self._term_offsets = np.zeros(1, dtype=np.int64)
+        self._posting_rows = np.zeros(0, dtype=np.int32)
+        self._posting_frequencies = np.zeros(0, dtype=np.uint16)
+        self._lengths = np.zeros(0, dtype=np.int32)
+        self._deleted = np.zeros(0, dtype=bool)
+        self._average_length = 0.0
+        self._live_documents = 0
+        self._committed_deleted_rows = 0
+        self._loaded_version: int | None = None
+
+    def replace_documents(self, documents: list[ChunkedDocument]) -> None:
+        changed = []
+        with self._lock:
+            connection = self._get_connection()
+            for document in documents:
+                records = [chunk.generic_record for chunk in document.chunks]
+                content_hash = _records_hash(records)
+                row = connection.execute(
+                    "SELECT content_hash FROM files"
+                    " WHERE repo_owner = ? AND repo_name = ? AND file_path = ?",
+                    (document.repo_owner, document.repo_name, document.file_path),
+                ).fetchone()
+                if row is None or row[0] != content_hash:
+                    changed.append((document, records, content_hash))
+            if not changed:
+                return
+            next_row = self._next_row()
+            with connection:
+                for document, records, content_hash in changed:
+                    key = (document.repo_owner, document.repo_name, document.file_path)
+                    self._delete_file(*key)
+                    connection.execute(
+                        "INSERT INTO files"
+                        " (repo_owner, repo_name, file_path, content_hash)"
+                        " VALUES (?, ?, ?, ?)",
+                        (*key, content_hash),
+                    )
+                    connection.executemany(
+                        "INSERT INTO documents (row, id, repo_owner, repo_name,"
+                        " file_path, content, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [
+                            (
+                                next_row + offset,
+                                record.id,
+                                *key,
+                                record.unembedded_content,
+                                json.dumps(record.metadata),
+                            )
+                            for offset, record in enumerate(records)
+                        ],
+                    )
+                    next_row += len(records)
+            self._load_tombstones()
+
+    def remove_files(
+        self, repo_owner: str, repo_name: str, file_paths: Iterable[str]
+    ) -> None:
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                for file_path in file_paths:
+                    self._delete_file(repo_owner, repo_name, file_path)
+            self._load_tombstones()
+
+    def retain_files(
+        self, repo_owner: str, repo_name: str, file_paths: Iterable[str]
+    ) -> int:
+        keep = set(file_paths)
+        with self._lock:
+            stale = [
+                row[0]
+                for row in self._get_connection().execute(
+                    "SELECT file_path FROM files"
+                    " WHERE repo_owner = ? AND repo_name = ?",
+                    (repo_owner, repo_name),
+                )
+                if row[0] not in keep
+            ]
+            self.remove_files(repo_owner, repo_name, stale)
+        return len(stale)
+
+    def commit(self) -> None:
+        with self._lock:
+            connection = self._get_connection()
+            self._load()
+            total_rows = self._next_row()
+            deleted_rows = connection.execute(
+                "SELECT COUNT(*) FROM documents WHERE deleted = 1"
+            ).fetchone()[0]
+            if (
+                total_rows == self._indexed_rows
+                and deleted_rows == self._committed_deleted_rows
+            ):
+                return
+            if deleted_rows > COMPACTION_THRESHOLD * total_rows:
+                total_rows = self._compact()
+                deleted_rows = 0
+                term_ids, rows, frequencies = (np.zeros(0, dtype=np.int64),) * 3
+                lengths = np.zeros(0, dtype=np.int32)
+                first_new_row = 0
+            else:
+                # Postings of removed rows are dropped; their rows stay empty
+                # until the next compaction.
+                term_ids = np.repeat(
+                    np.arange(len(self._term_offsets) - 1), np.diff(self._term_offsets)
+                )
+                rows = np.asarray(self._posting_rows, dtype=np.int64)
+                frequencies = np.asarray(self._posting_frequencies, dtype=np.int64)
+                live = ~self._deleted[rows]
+                term_ids, rows, frequencies = (
+                    term_ids[live],
+                    rows[live],
+                    frequencies[live],
+                )
+                lengths = np.array(self._lengths, dtype=np.int32)
+                lengths[self._deleted] = 0
+                first_new_row = self._indexed_rows
+            new_term_ids, new_rows, new_frequencies, new_lengths = self._tokenize_rows(
+                first_new_row, total_rows
+            )
+            term_ids = np.concatenate([term_ids, new_term_ids])
+            rows = np.concatenate([rows, new_rows])
+            frequencies = np.concatenate([frequencies, new_frequencies])
+            lengths = np.concatenate([lengths, new_lengths])
+            term_count = connection.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+            order = np.lexsort((rows, term_ids))
+            term_offsets = np.zeros(term_count + 1, dtype=np.int64)
+            np.cumsum(np.bincount(term_ids, minlength=term_count), out=term_offsets[1:])
+            self._write_index(
+                term_offsets,
+                rows[order].astype(np.int32),
+                np.minimum(frequencies[order], MAX_TERM_FREQUENCY).astype(np.uint16),
+                lengths,
+                total_rows,
+                deleted_rows,
+            )
+            self._loaded_version = None
+            self._load()
+        logger.bind(
+            documents=self._live_documents,
+            terms=term_count,
+            postings=len(rows),
+        ).info("Committed lexical index")
+
+    def search(
+        self, query: str, top_k: int = 10, search_filter: SearchFilter | None = None
+    ) -> list[GenericRecord]:
+        return self.search_batch([query], top_k, search_filter)[0]
+
+    def search_batch(
+        self,
+        queries: list[str],
+        top_k: int = 10,
+        search_filter: SearchFilter | None = None,
+    ) -> list[list[GenericRecord]]:
+        """
+        Searches every query under one lock, looking up the terms of all of
+        them in one statement, filtering rows once and reading the records of
+        all results in one statement.
+        """
+        query_terms = [sorted(set(tokenize(query))) for query in queries]
+        if not any(query_terms) or not os.path.isdir(self.directory):
+            return [[] for _ in queries]
+        with self._lock:
+            connection = self._get_connection()
+            self._load()
+            if self._live_documents == 0:
+                return [[] for _ in queries]
+            terms = sorted(set().union(*query_terms))
+            placeholders = ",".join("?" * len(terms))
+            term_ids = {
+                term: term_id
+                for term, term_id in connection.execute(
+                    f"SELECT term, term_id FROM terms WHERE term IN ({placeholders})",
+                    terms,
+                )
+                if term_id < len(self._term_offsets) - 1
+            }
+            filtered_rows = None
+            if search_filter is not None and not search_filter.is_empty:
+                filtered_rows = self._filtered_rows(search_filter)
+            matches = [
+                self._top_rows(
+                    [term_ids[term] for term in terms if term in term_ids],
+                    top_k,
+                    filtered_rows,
+                )
+                for terms in query_terms
+            ]
+            records = iter(
+                self._records_for_rows(
+                    np.concatenate([rows for rows, _ in matches]),
+                    np.concatenate([scores for _, scores in matches]),
+                )
+            )
+        return [[next(records) for _ in rows] for rows, _ in matches]
+
+    def sample_records(self, count: int, seed: int = 0) -> list[GenericRecord]:
+        with self._lock:
+            self._load()
+            live_rows = np.flatnonzero(~self._deleted)
+            if len(live_rows) == 0:
+                return []
+            rows = np.random.default_rng(seed).choice(
+                live_rows, size=min(count, len(live_rows)), replace=False
+            )
+            return self._records_for_rows(rows, np.zeros(len(rows)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load()
+            size_bytes = (
+                sum(
+                    os.path.getsize(os.path.join(self.directory, name))
+                    for name in os.listdir(self.directory)
+                )
+                if os.path.isdir(self.directory)
+                else 0
+            )
+            return {
+                "directory": self.directory,
+                "documents": self._live_documents,
+                "terms": len(self._term_offsets) - 1,
+                "postings": len(self._posting_rows),
+                "pending_documents": self._next_row() - self._indexed_rows
+                if self._connection is not None
+                else 0,
+                "size_bytes": size_bytes,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self._path(DOCUMENTS_FILE), check_same_thread=False
+            )
+            self._connection.executescript(
+                """
+                PRAGMA journal_mode = WAL;
+                CREATE TABLE IF NOT EXISTS documents (
+                    row INTEGER PRIMARY KEY,
+                    id TEXT NOT NULL,
+                    repo_owner TEXT NOT NULL,
+                    repo_name TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    metadata TEXT NOT NULL,
+                    deleted INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS documents_file
+                    ON documents (repo_owner, repo_name, file_path);
+                CREATE TABLE IF NOT EXISTS files (
+                    repo_owner TEXT NOT NULL,
+                    repo_name TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    PRIMARY KEY (repo_owner, repo_name, file_path)
+                );
+                CREATE TABLE IF NOT EXISTS terms (
+                    term TEXT PRIMARY KEY,
+                    term_id INTEGER NOT NULL UNIQUE
+                );
+                """
+            )
+        return self._connection
+
+    def _next_row(self) -> int:
+        return self._connection.execute(
+            "SELECT COALESCE(MAX(row) + 1, 0) FROM documents"
+        ).fetchone()[0]
+
+    def _delete_file(self, repo_owner: str, repo_name: str, file_path: str) -> None:
+        key = (repo_owner, repo_name, file_path)
+        self._connection.execute(
+            "UPDATE documents SET deleted = 1 WHERE repo_owner = ? AND repo_name = ?"
+            " AND file_path = ? AND deleted = 0",
+            key,
+        )
+        self._connection.execute(
+            "DELETE FROM files"
+            " WHERE repo_owner = ? AND repo_name = ? AND file_path = ?",
+            key,
+        )
+
+    def _load(self) -> None:
+        """Loads the committed index, unless it is unchanged since last loaded."""
+        info_path = self._path(INDEX_INFO_FILE)
+        if not os.path.exists(info_path):
+            return
+        with open(info_path) as f:
+            info = json.load(f)
+        if info["version"] == self._loaded_version:
+            return
+        self._indexed_rows = info["indexed_rows"]
+        self._committed_deleted_rows = info["deleted_rows"]
+        self._term_offsets = np.fromfile(self._path(TERM_OFFSETS_FILE), np.int64)
+        self._posting_rows = self._map(POSTING_ROWS_FILE, np.int32)
+        self._posting_frequencies = self._map(POSTING_FREQUENCIES_FILE, np.uint16)
+        self._lengths = np.fromfile(self._path(LENGTHS_FILE), np.int32)
+        self._loaded_version = info["version"]
+        self._get_connection()
+        self._load_tombstones()
+
+    def _load_tombstones(self) -> None:
+        deleted = np.zeros(self._indexed_rows, dtype=bool)
+        rows = self._connection.execute(
+            "SELECT row FROM documents WHERE deleted = 1 AND row < ?",
+            (self._indexed_rows,),
+        ).fetchall()
+        if rows:
+            deleted[np.fromiter((row[0] for row in rows), dtype=np.int64)] = True
+        self._deleted = deleted
+        self._live_documents = int((~deleted).sum())
+        live_lengths = self._lengths[~deleted]
+        self._average_length = float(live_lengths.mean()) if len(live_lengths) else 0.0
+        # Empty documents would otherwise divide by zero.
+        self._average_length = max(self._average_length, 1.0)
+
+    def _tokenize_rows(
+        self, first_row: int, end_row: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Tokenises the live documents in [first_row, end_row), adding new terms
+        to the vocabulary, and returns their postings and lengths.
+        """
+        connection = self._connection
+        vocabulary = dict(connection.execute("SELECT term, term_id FROM terms"))
+        new_terms: list[tuple[str, int]] = []
+        term_ids: list[int] = []
+        rows: list[int] = []
+        frequencies: list[int] = []
+        lengths = np.zeros(end_row - first_row, dtype=np.int32)
+        for row, content in connection.execute(
+            "SELECT row, content FROM documents"
+            " WHERE row >= ? AND row < ? AND deleted = 0",
+            (first_row, end_row),
+        ):
+            tokens = tokenize(content)
+            lengths[row - first_row] = len(tokens)
+            for term, frequency in Counter(tokens).items():
+                term_id = vocabulary.get(term)
+                if term_id is None:
+                    term_id = vocabulary[term] = len(vocabulary)
+                    new_terms.append((term, term_id))
+                term_ids.append(term_id)
+                rows.append(row)
+                frequencies.append(frequency)
+        with connection:
+            connection.executemany(
+                "INSERT INTO terms (term, term_id) VALUES (?, ?)", new_terms
+            )
+        return (
+            np.asarray(term_ids, dtype=np.int64),
+            np.asarray(rows, dtype=np.int64),
+            np.asarray(frequencies, dtype=np.int64),
+            lengths,
+        )
+
+    def _compact(self) -> int:
+        """Drops removed documents and renumbers the rest. Returns the rows left."""
+        connection = self._connection
+        with connection:
+            connection.execute("DELETE FROM documents WHERE deleted = 1")
+            live_rows = [
+                row[0]
+                for row in connection.execute("SELECT row FROM documents ORDER BY row")
+            ]
+            # Rows only ever move down, so renumbering in ascending order
+            # never collides with a row that has not been moved yet.
+            connection.executemany(
+                "UPDATE documents SET row = ? WHERE row = ?",
+                [
+                    (new_row, old_row)
+                    for new_row, old_row in enumerate(live_rows)
+                    if new_row != old_row
+                ],
+            )
+        self._indexed_rows = 0
+        self._deleted = np.zeros(0, dtype=bool)
+        logger.bind(rows=len(live_rows)).info("Compacting lexical index")
+        return len(live_rows)
+
+    def _write_index(
+        self,
+        term_offsets: np.ndarray,
+        posting_rows: np.ndarray,
+        posting_frequencies: np.ndarray,
+        lengths: np.ndarray,
+        indexed_rows: int,
+        deleted_rows: int,
+    ) -> None:
+        # Each file is replaced atomically and index.json last, so readers in
+        # other processes reload once every file is written.
+        for file_name, array in (
+            (TERM_OFFSETS_FILE, term_offsets),
+            (POSTING_ROWS_FILE, posting_rows),
+            (POSTING_FREQUENCIES_FILE, posting_frequencies),
+            (LENGTHS_FILE, lengths),
+        ):
+            temporary_path = self._path(file_name + ".tmp")
+            array.tofile(temporary_path)
+            os.replace(temporary_path, self._path(file_name))
+        version = (self._loaded_version or 0) + 1
+        temporary_path = self._path(INDEX_INFO_FILE + ".tmp")
+        with open(temporary_path, "w") as f:
+            json.dump(
+                {
+                    "version": version,
+                    "indexed_rows": indexed_rows,
+                    "deleted_rows": deleted_rows,
+                },
+                f,
+            )
+        os.replace(temporary_path, self._path(INDEX_INFO_FILE))
+
+    def _map(self, file_name: str, dtype: type) -> np.ndarray:
+        path = self._path(file_name)
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r")
+
+    def _top_rows(
+        self, term_ids: list[int], top_k: int, filtered_rows: np.ndarray | None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the rows and BM25 scores of the top_k matches of term_ids."""
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        starts = self._term_offsets[term_ids]
+        document_frequencies = self._term_offsets[term_ids + 1] - starts
+        postings = int(document_frequencies.sum())
+        if postings == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        # The postings of every term are gathered with one index array rather
+        # than sliced term by term.
+        positions = np.arange(postings) + np.repeat(
+            starts - np.cumsum(document_frequencies) + document_frequencies,
+            document_frequencies,
+        )
+        matched_rows = self._posting_rows[positions].astype(np.int64)
+        frequencies = self._posting_frequencies[positions].astype(np.float32)
+        idf = np.log1p(
+            (self._live_documents - document_frequencies + 0.5)
+            / (document_frequencies + 0.5)
+        ).astype(np.float32)
+        normalised_lengths = self._lengths[matched_rows] / self._average_length
+        matched_scores = (
+            np.repeat(idf, document_frequencies)
+            * frequencies
+            * (self.k1 + 1)
+            / (frequencies + self.k1 * (1 - self.b + self.b * normalised_lengths))
+        )
+        # Rows are summed over terms through the positions of unique rows, so
+        # scoring touches only the rows that contain a query term.
+        rows, positions = np.unique(matched_rows, return_inverse=True)
+        scores = np.bincount(positions, weights=matched_scores)
+        keep = ~self._deleted[rows]
+        if filtered_rows is not None:
+            keep &= np.isin(rows, filtered_rows)
+        rows, scores = rows[keep], scores[keep]
+        top_k = min(top_k, len(rows))
+        if top_k == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        # Ties are broken by row so results do not depend on partitioning.
+        cutoff = np.partition(scores, len(scores) - top_k)[len(scores) - top_k]
+        top = np.flatnonzero(scores >= cutoff)
+        top = top[np.lexsort((rows[top], -scores[top]))][:top_k]
+        return rows[top], scores[top]
+
+    def _filtered_rows(self, search_filter: SearchFilter) -> np.ndarray:
+        clauses, parameters = search_filter_clauses(search_filter)
+        clauses.append("deleted = 0")
+        return np.fromiter(
+            (
+                row[0]
+                for row in self._connection.execute(
+                    f"SELECT row FROM documents WHERE {' AND '.join(clauses)}",
+                    parameters,
+                )
+            ),
+            dtype=np.int64,
+        )
+
+    def _records_for_rows(
+        self, rows: np.ndarray, scores: np.ndarray
+    ) -> list[GenericRecord]:
+        # Rows found by several queries of a batch are read and parsed once.
+        unique_rows = np.unique(rows).tolist()
+        placeholders = ",".join("?" * len(unique_rows))
+        found = {
+            row: (record_id, content, json.loads(metadata))
+            for row, record_id, content, metadata in self._connection.execute(
+                f"SELECT row, id, content, metadata FROM documents"
+                f" WHERE row IN ({placeholders})",
+                unique_rows,
+            )
+        }
+        records = []
+        for row, score in zip(rows.tolist(), scores.tolist(), strict=True):
+            record_id, content, metadata = found[row]
+            records.append(
+                GenericRecord(
+                    id=record_id,
+                    unembedded_content=content,
+                    metadata={**metadata, "score": score},
+                )
+            )
+        return records
+
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self.directory, file_name)
+
+
+def _records_hash(records: list[GenericRecord]) -> str:
+    hasher = hashlib.sha256()
+    for record in records:
+        for part in (record.id, record.unembedded_content):
+            hasher.update(part.encode("utf-8"))
+            hasher.update(b"\0")
+    return hasher.hexdigest()
@@ -0,0 +1,509 @@
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Iterable, Iterator
+from itertools import batched
+
+import numpy as np
+import structlog
+
+from codemine.domain.ports.embedding_client import EmbeddingClient
+from codemine.domain.repositories.vector_store_repo import (
+    DEFAULT_SEARCH_CONCURRENCY,
+    VectorIndexRepo,
+)
+from codemine.domain.value_objects import (
+    EmbeddedRecord,
+    GenericRecord,
+    SearchFilter,
+    chunk_id_prefix,
+)
+from codemine.infrastructure.ivf_index import DEFAULT_NPROBE, IvfFlatIndex
+from codemine.infrastructure.settings import Settings
+from codemine.infrastructure.sql_filters import search_filter_clauses
+
+logger = structlog.get_logger()
+
+VECTORS_FILE = "vectors.f32"
+METADATA_FILE = "metadata.sqlite"
+INDEX_INFO_FILE = "index.json"
+# Fraction of tombstoned rows above which an insert or removal compacts the
+# store.
+COMPACTION_THRESHOLD = 0.25
+# IDs tombstoned per statement, below SQLite's limit on bound parameters.
+TOMBSTONE_BATCH_SIZE = 500
+# Below this many rows exact search is fast enough that an IVF index does not
+# pay for its lost recall. Picked with DEFAULT_NPROBE from the benchmark's
+# recall sweep: below it, lists are small enough that keeping recall@10 at
+# 0.95 takes probing so many that IVF search is no faster than exact search.
+IVF_MIN_ROWS = 50_000
+LIST_PAGE_SIZE = 1000
+# Queries embedded and scored together by search_vectors_batch; the score
+# matrix of a batch holds this many floats per stored row.
+SEARCH_BATCH_SIZE = 64
+
+
+class LocalVectorStore(VectorIndexRepo):
+    """
+    Vector store kept on the local disk. Vectors are L2-normalised and stored
+    as a float32 matrix in a flat file that is memory-mapped for search, so
+    cosine similarity is a single matrix-vector product. IDs, content and
+    metadata live in a SQLite sidecar keyed by matrix row. Removed and
+    replaced rows are tombstoned, and dropped from the matrix by compact()
+    once they make up more than COMPACTION_THRESHOLD of it.
+
+    With use_ivf_index, large stores are searched approximately through an
+    IvfFlatIndex kept alongside the matrix; nprobe trades recall for latency.
+    """
+
+    def __init__(
+        self,
+        index_name: str,
+        settings: Settings,
+        embedding_client: EmbeddingClient,
+        use_ivf_index: bool = False,
+        ivf_n_lists: int | None = None,
+        ivf_nprobe: int = DEFAULT_NPROBE,
+    ):
+        super().__init__(index_name, settings)
+        self.embedding_client = embedding_client
+        self.directory = os.path.join(settings.local_vector_store_dir, index_name)
+        self._ivf_index = None
+        if use_ivf_index:
+            self._ivf_index = IvfFlatIndex(
+                self.directory, n_lists=ivf_n_lists, nprobe=ivf_nprobe
+            )
+        self._lock = threading.RLock()
+        self._connection: sqlite3.Connection | None = None
+        self._matrix: np.ndarray | None = None
+        self._deleted = np.zeros(0, dtype=bool)
+        self._tombstones = 0
+        self._dimension: int | None = None
+        self._row_count = 0
+        if os.path.isdir(self.directory):
+            self._open()
+
+    def create_index_if_not_exists(self):
+        with self._lock:
+            if self._connection is None:
+                logger.bind(directory=self.directory).info("Creating local index")
+                os.makedirs(self.directory, exist_ok=True)
+                self._open()
+
+    @property
+    def index(self) -> str:
+        return self.directory
+
+    @property
+    def model_version(self) -> str:
+        return f"{self.embedding_client.model}:{self.embedding_client.dimension}"
+
+    @property
+    def dimension(self) -> int | None:
+        return self._dimension
+
+    def insert_vectors(self, records: list[EmbeddedRecord]):
+        """Upserts records, replacing any existing vectors with the same ID."""
+        if len(records) == 0:
+            logger.info("No local records to insert")
+            return
+        self._insert(
+            records,
+            np.asarray([record.embedded_content for record in records], np.float32),
+        )
+
+    def embed_and_insert_records(self, records: list[GenericRecord]):
+        if len(records) == 0:
+            logger.info("No local records to insert")
+            return
+        self._insert(records, self.embedding_client.embed_records(records))
+
+    def _insert(self, records: list[GenericRecord], vectors: np.ndarray) -> None:
+        vectors = _normalise(vectors)
+        with self._lock:
+            self.create_index_if_not_exists()
+            if self._dimension is None:
+                self._set_dimension(vectors.shape[1])
+            if vectors.shape[1] != self._dimension:
+                raise ValueError(
+                    f"Expected vectors of dimension {self._dimension}, "
+                    f"got {vectors.shape[1]}"
+                )
+            first_row = self._row_count
+            # Vectors are appended before their metadata is committed; rows
+            # without metadata are truncated when the store is next opened.
+            with open(self._path(VECTORS_FILE), "ab") as f:
+                f.write(vectors.tobytes())
+            with self._connection:
+                replaced_rows = self._tombstone_ids([record.id for record in records])
+                self._connection.executemany(
+                    "INSERT INTO records"
+                    " (row, id, repo_owner, repo_name, file_path, content, metadata)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            first_row + offset,
+                            record.id,
+                            record.metadata.get("repo_owner"),
+                            record.metadata.get("repo_name"),
+                            record.metadata.get("file_path"),
+                            record.unembedded_content,
+                            json.dumps(record.metadata),
+                        )
+                        for offset, record in enumerate(records)
+                    ],
+                )
+            self._row_count += len(records)
+            self._deleted = np.concatenate(
+                [self._deleted, np.zeros(len(records), dtype=bool)]
+            )
+            self._mark_deleted(replaced_rows)
+            self._matrix = None
+            self._compact_if_needed()
+
+    def get_current_files_embedded(self, repo_owner: str, repo_name: str) -> list[str]:
+        if self._connection is None:
+            return []
+        prefix = chunk_id_prefix(repo_owner, repo_name)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT DISTINCT file_path FROM records"
+                " WHERE id >= ? AND id < ? AND deleted = 0",
+                (prefix, prefix + "\uffff"),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def remove_vectors_by_file_path(
+        self, file_path: str, repo_owner: str, repo_name: str
+    ) -> bool:
+        if self._connection is None:
+            return True
+        with self._lock:
+            with self._connection:
+                rows = self._connection.execute(
+                    "UPDATE records SET deleted = 1"
+                    " WHERE file_path = ? AND repo_owner = ? AND repo_name = ?"
+                    " AND deleted = 0 RETURNING row",
+                    (file_path, repo_owner, repo_name),
+                ).fetchall()
+            self._mark_deleted([row for (row,) in rows])
+            self._compact_if_needed()
+        return True
+
+    def list_record_ids(
+        self, repo_owner: str, repo_name: str, file_path: str | None = None
+    ) -> Iterable[list[str]]:
+        if self._connection is None:
+            return
+        prefix = chunk_id_prefix(repo_owner, repo_name, file_path)
+        last_id = prefix
+        # Keyset pagination, so removals between pages never skip IDs.
+        while True:
+            with self._lock:
+                page = [
+                    row[0]
+                    for row in self._connection.execute(
+                        "SELECT id FROM records"
+                        " WHERE id > ? AND id < ? AND deleted = 0"
+                        " ORDER BY id LIMIT ?",
+                        (last_id, prefix + "\uffff", LIST_PAGE_SIZE),
+                    )
+                ]
+            if not page:
+                return
+            yield page
+            last_id = page[-1]
+
+    def remove_records_by_id(self, ids: list[str]) -> None:
+        if self._connection is None:
+            return
+        with self._lock:
+            with self._connection:
+                rows = self._tombstone_ids(ids)
+            self._mark_deleted(rows)
+            self._compact_if_needed()
+
+    def _tombstone_ids(self, ids: list[str]) -> list[int]:
+        """Tombstones the live rows of ids, returning their row numbers."""
+        rows = []
+        for batch in batched(ids, TOMBSTONE_BATCH_SIZE):
+            rows.extend(
+                row
+                for (row,) in self._connection.execute(
+                    "UPDATE records SET deleted = 1"
+                    f" WHERE id IN ({','.join('?' * len(batch))}) AND deleted = 0"
+                    " RETURNING row",
+                    batch,
+                )
+            )
+        return rows
+
+    def _mark_deleted(self, rows: list[int]) -> None:
+        if rows:
+            self._deleted[np.asarray(rows, dtype=np.int64)] = True
+            self._tombstones += len(rows)
+
+    def _compact_if_needed(self) -> None:
+        if (
+            self._row_count
+            and self._tombstones / self._row_count > COMPACTION_THRESHOLD
+        ):
+            self.compact()
+
+    def warm_up(self) -> None:
+        with self._lock:
+            self._get_matrix()
+
+    def search_vectors(
+        self,
+        query: str,
+        top_k: int = 10,
+        search_filter: SearchFilter | None = None,
+        nprobe: int | None = None,
+    ) -> list[GenericRecord]:
+        return self._search([query], top_k, search_filter, nprobe)[0]
+
+    def search_vectors_batch(
+        self,
+        queries: Iterable[str],
+        top_k: int = 10,
+        search_filter: SearchFilter | None = None,
+        max_concurrency: int = DEFAULT_SEARCH_CONCURRENCY,
+    ) -> Iterator[list[GenericRecord]]:
+        """
+        Searches SEARCH_BATCH_SIZE queries at a time, embedding each batch in
+        one request and scoring it with one matrix product. Filters are
+        applied once per batch. max_concurrency is unused, since numpy
+        already uses every core for the product.
+        """
+        for batch in batched(queries, SEARCH_BATCH_SIZE):
+            yield from self._search(list(batch), top_k, search_filter)
+
+    def _search(
+        self,
+        queries: list[str],
+        top_k: int,
+        search_filter: SearchFilter | None,
+        nprobe: int | None = None,
+    ) -> list[list[GenericRecord]]:
+        query_vectors = _normalise(
+            self.embedding_client.embed_records(
+                [
+                    GenericRecord(id="query", unembedded_content=query, metadata={})
+                    for query in queries
+                ]
+            )
+        )
+        with self._lock:
+            matrix = self._get_matrix()
+            if matrix is None or len(matrix) == 0:
+                return [[] for _ in queries]
+            rows = None
+            excluded = self._deleted
+            if search_filter is not None and not search_filter.is_empty:
+                rows = self._filtered_rows(search_filter)
+                excluded = np.ones(len(matrix), dtype=bool)
+                excluded[rows] = False
+            candidates = len(matrix) if rows is None else len(rows)
+            if self._ivf_index is not None and candidates >= IVF_MIN_ROWS:
+                self._sync_ivf_index(matrix)
+                matches = [
+                    self._ivf_index.search(
+                        matrix, query_vector, top_k, excluded, nprobe=nprobe
+                    )
+                    for query_vector in query_vectors
+                ]
+            else:
+                matches = self._exact_search(matrix, query_vectors, top_k, rows)
+            return [
+                self._records_for_rows(top_rows, top_scores) if len(top_rows) else []
+                for top_rows, top_scores in matches
+            ]
+
+    def _exact_search(
+        self,
+        matrix: np.ndarray,
+        query_vectors: np.ndarray,
+        top_k: int,
+        rows: np.ndarray | None = None,
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        Scores every query against the given live rows, or every live row if
+        rows is None, and returns the rows and scores of each query's top_k.
+        """
+        if rows is None:
+            scores = query_vectors @ matrix.T
+            scores[:, self._deleted] = -np.inf
+            top_k = min(top_k, int((~self._deleted).sum()))
+        else:
+            scores = query_vectors @ np.asarray(matrix[rows]).T
+            top_k = min(top_k, len(rows))
+        if top_k <= 0:
+            empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+            return [empty] * len(query_vectors)
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        if rows is not None:
+            top = rows[top]
+        return list(zip(top, top_scores, strict=True))
+
+    def _filtered_rows(self, search_filter: SearchFilter) -> np.ndarray:
+        """Returns the live rows matching the filter, found through SQLite."""
+        clauses, parameters = search_filter_clauses(search_filter)
+        clauses.append("deleted = 0")
+        return np.fromiter(
+            (
+                row[0]
+                for row in self._connection.execute(
+                    f"SELECT row FROM records WHERE {' AND '.join(clauses)}",
+                    parameters,
+                )
+            ),
+            dtype=np.int64,
+        )
+
+    def _sync_ivf_index(self, matrix: np.ndarray) -> None:
+        if not self._ivf_index.is_trained or self._ivf_index.indexed_rows > len(matrix):
+            self._ivf_index.train(matrix)
+        else:
+            self._ivf_index.add(matrix)
+
+    def compact(self) -> int:
+        """Rewrites the matrix without tombstoned rows. Returns rows removed."""
+        with self._lock:
+            if self._connection is None:
+                return 0
+            live_rows = np.flatnonzero(~self._deleted)
+            removed = self._row_count - len(live_rows)
+            if removed == 0:
+                return 0
+            matrix = self._get_matrix()
+            if self._ivf_index is not None and self._ivf_index.is_trained:
+                # Rows inserted since the last search are not in the index
+                # yet, and it must cover every row before rows are renumbered.
+                self._sync_ivf_index(matrix)
+            temporary_path = self._path(VECTORS_FILE + ".tmp")
+            with open(temporary_path, "wb") as f:
+                f.write(np.ascontiguousarray(matrix[live_rows]).tobytes())
+            self._matrix = None
+            with self._connection:
+                self._connection.execute("DELETE FROM records WHERE deleted = 1")
+                # Rows only ever move down, so renumbering in ascending order
+                # never collides with a row that has not been moved yet.
+                self._connection.executemany(
+                    "UPDATE records SET row = ? WHERE row = ?",
+                    [
+                        (new_row, int(old_row))
+                        for new_row, old_row in enumerate(live_rows)
+                        if new_row != old_row
+                    ],
+                )
+                os.replace(temporary_path, self._path(VECTORS_FILE))
+            if self._ivf_index is not None:
+                self._ivf_index.compact(live_rows)
+            self._row_count = len(live_rows)
+            self._deleted = np.zeros(self._row_count, dtype=bool)
+            self._tombstones = 0
+        logger.bind(removed=removed, rows=self._row_count).info(
+            "Compacted local vector store"
+        )
+        return removed
+
+    def _open(self) -> None:
+        self._connection = sqlite3.connect(
+            self._path(METADATA_FILE), check_same_thread=False
+        )
+        self._connection.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS records (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                repo_owner TEXT,
+                repo_name TEXT,
+                file_path TEXT,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS records_id ON records (id);
+            CREATE INDEX IF NOT EXISTS records_file
+                ON records (repo_owner, repo_name, file_path);
+            """
+        )
+        if os.path.exists(self._path(INDEX_INFO_FILE)):
+            with open(self._path(INDEX_INFO_FILE)) as f:
+                self._dimension = json.load(f)["dimension"]
+        self._row_count = self._connection.execute(
+            "SELECT COALESCE(MAX(row) + 1, 0) FROM records"
+        ).fetchone()[0]
+        vectors_path = self._path(VECTORS_FILE)
+        if self._dimension is not None and os.path.exists(vectors_path):
+            expected_size = self._row_count * self._dimension * 4
+            if os.path.getsize(vectors_path) > expected_size:
+                os.truncate(vectors_path, expected_size)
+        self._load_tombstones()
+
+    def _set_dimension(self, dimension: int) -> None:
+        self._dimension = dimension
+        with open(self._path(INDEX_INFO_FILE), "w") as f:
+            json.dump({"dimension": dimension}, f)
+
+    def _load_tombstones(self) -> None:
+        deleted = np.zeros(self._row_count, dtype=bool)
+        rows = self._connection.execute(
+            "SELECT row FROM records WHERE deleted = 1"
+        ).fetchall()
+        if rows:
+            deleted[np.fromiter((row[0] for row in rows), dtype=np.int64)] = True
+        self._deleted = deleted
+        self._tombstones = len(rows)
+
+    def _get_matrix(self) -> np.ndarray | None:
+        if self._matrix is None and self._dimension and self._row_count:
+            self._matrix = np.memmap(
+                self._path(VECTORS_FILE),
+                dtype=np.float32,
+                mode="r",
+                shape=(self._row_count, self._dimension),
+            )
+        return self._matrix
+
+    def _records_for_rows(
+        self, rows: np.ndarray, scores: np.ndarray
+    ) -> list[GenericRecord]:
+        placeholders = ",".join("?" * len(rows))
+        found = {
+            row: (record_id, content, metadata)
+            for row, record_id, content, metadata in self._connection.execute(
+                f"SELECT row, id, content, metadata FROM records"
+                f" WHERE row IN ({placeholders})",
+                [int(row) for row in rows],
+            )
+        }
+        records = []
+        for row, score in zip(rows, scores, strict=True):
+            record_id, content, metadata = found[int(row)]
+            record_metadata = json.loads(metadata)
+            record_metadata["score"] = float(score)
+            records.append(
+                GenericRecord(
+                    id=record_id,
+                    unembedded_content=content,
+                    metadata=record_metadata,
+                )
+            )
+        return records
+
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self.directory, file_name)
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
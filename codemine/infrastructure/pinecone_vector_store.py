@@ -1,14 +1,64 @@
+import json
+import random
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from functools import cached_property
+from itertools import batched
 
+import numpy as np
 import structlog
-from pinecone import Pinecone
+from pinecone import Pinecone, ServerlessSpec
+from pinecone.exceptions import PineconeApiException
 
-from codemine.domain.repositories.vector_store_repo import VectorIndexRepo
-from codemine.domain.value_objects import EmbeddedRecord, GenericRecord
+from codemine.domain.ports.embedding_client import EmbeddingClient
+from codemine.domain.ports.telemetry import NullTelemetry, Telemetry
+from codemine.domain.repositories.vector_store_repo import (
+    DEFAULT_SEARCH_CONCURRENCY,
+    VectorIndexRepo,
+)
+from codemine.domain.value_objects import (
+    EmbeddedRecord,
+    GenericRecord,
+    SearchFilter,
+    chunk_id_prefix,
+    file_directories,
+    file_path_from_chunk_id,
+)
 from codemine.infrastructure.settings import Settings
 
 logger = structlog.get_logger()
 
+# Limits of a single upsert_records request for indexes with integrated
+# embedding.
+UPSERT_RECORDS_MAX_COUNT = 96
+UPSERT_MAX_PAYLOAD_BYTES = 2 * 1024 * 1024
+# Leaves room for the request envelope around the serialised records.
+UPSERT_PAYLOAD_HEADROOM = 0.9
+# Limit of a single delete request by ID.
+DELETE_MAX_IDS = 1000
+# Limit of a single upsert request of precomputed vectors.
+UPSERT_VECTORS_MAX_COUNT = 1000
+# Records embedded client-side per embeddings call; each batch is then
+# upserted in as many requests as the payload limit requires.
+CLIENT_EMBEDDING_BATCH_SIZE = 256
+DEFAULT_MAX_IN_FLIGHT_UPSERTS = 8
+UPSERT_MAX_RETRIES = 5
+UPSERT_RETRY_BASE_DELAY = 0.5
+UPSERT_RETRY_MAX_DELAY = 30.0
+SEARCH_FIELDS = [
+    "code_with_context",
+    "repo_owner",
+    "repo_name",
+    "file_path",
+    "index",
+    "file_type",
+]
+# Metadata field listing every directory of a record's file. Pinecone filters
+# cannot match string prefixes, so path prefix filters match this list.
+DIRECTORIES_FIELD = "directories"
+
 
 class PineconeVectorStore(VectorIndexRepo):
     def __init__(
@@ -17,17 +67,44 @@ class PineconeVectorStore(VectorIndexRepo):
         settings: Settings,
         embed_model: str = "llama-text-embed-v2",
         namespace: str = "default",
+        max_in_flight_upserts: int = DEFAULT_MAX_IN_FLIGHT_UPSERTS,
+        embedding_client: EmbeddingClient | None = None,
+        telemetry: Telemetry | None = None,
     ):
+        """
+        Without an embedding_client, records are embedded by Pinecone's
+        integrated inference with embed_model. With one, records are embedded
+        client-side and upserted as dense vectors.
+        """
         super().__init__(index_name, settings)
         self.pc = Pinecone(api_key=self.settings.pinecone_api_key)
         self.embed_model = embed_model
+        self.embedding_client = embedding_client
         self.namespace = namespace
-        self._has_index = self.pc.has_index(self.index_name)
+        self.max_in_flight_upserts = max_in_flight_upserts
+        self.telemetry = telemetry or NullTelemetry()
+        # Shared by every bulk insert, so concurrent embed runs using this
+        # store stay within max_in_flight_upserts requests in total.
+        self._request_slots = threading.BoundedSemaphore(max_in_flight_upserts)
+
+    @cached_property
+    def _has_index(self) -> bool:
+        # Only checked when creating the index, so searches make no extra call.
+        return self.pc.has_index(self.index_name)
 
     def create_index_if_not_exists(self):
         """Create Pinecone index if it doesn't exist (from embedder.py lines 16-27)"""
         if not self._has_index:
             logger.bind(index_name=self.index_name).info("Creating Pinecone index")
+            if self.embedding_client is not None:
+                self.pc.create_index(
+                    name=self.index_name,
+                    dimension=self.embedding_client.dimension,
+                    metric="cosine",
+                    spec=ServerlessSpec(cloud="aws", region="us-east-1"),
+                )
+                self._has_index = True
+                return
             self.pc.create_index_for_model(
                 name=self.index_name,
                 cloud="aws",
@@ -39,9 +116,20 @@ class PineconeVectorStore(VectorIndexRepo):
             )
             self._has_index = True
 
+    @property
+    def model_version(self) -> str:
+        if self.embedding_client is not None:
+            return f"{self.embedding_client.model}:{self.embedding_client.dimension}"
+        return self.embed_model
+
     @property
     def index_host(self) -> str:
-        """Get the host of the index."""
+        """
+        Get the host of the index, from PINECONE_INDEX_HOST if set to skip the
+        describe_index call.
+        """
+        if self.settings.pinecone_index_host is not None:
+            return self.settings.pinecone_index_host
         describe_index_response = self.pc.describe_index(name=self.index_name)
         if describe_index_response.get("host") is not None:
             return describe_index_response["host"]
@@ -53,7 +141,13 @@ class PineconeVectorStore(VectorIndexRepo):
     def index(self) -> str:
         """Lazy-load index, creating if necessary."""
         index_host = self.index_host
-        return self.pc.Index(host=index_host)
+        # Concurrent upserts share this index's connection pool.
+        return self.pc.Index(
+            host=index_host, connection_pool_maxsize=self.max_in_flight_upserts
+        )
+
+    def warm_up(self) -> None:
+        logger.bind(index_host=self.index.config.host).info("Connected to index")
 
     def insert_vectors(self, records: list[EmbeddedRecord]):
         """Insert already-embedded vectors into Pinecone"""
@@ -68,44 +162,147 @@ class PineconeVectorStore(VectorIndexRepo):
         """
         Pinecone can embed content directly using its inference API
         """
+        self.embed_and_insert_records_bulk(records)
 
-        # Convert GenericRecord to Pinecone format for upsert_records
-        pinecone_records = self.convert_generic_records_to_pinecone_records(records)
-
-        if len(pinecone_records) == 0:
+    def embed_and_insert_records_bulk(self, records: Iterable[GenericRecord]) -> int:
+        """
+        Streams records into Pinecone in batches packed up to the request
+        limits, with at most max_in_flight_upserts requests in flight. With an
+        embedding_client, each batch is embedded in the worker that upserts it.
+        """
+        if self.embedding_client is None:
+            batches = self._pack_pinecone_records(records)
+            upsert: Callable[[Iterable], int] = self._upsert_records_with_retry
+        else:
+            batches = batched(records, CLIENT_EMBEDDING_BATCH_SIZE)
+            upsert = self._embed_and_upsert_vectors
+        inserted = 0
+        in_flight: set[Future] = set()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight_upserts) as executor:
+            for batch in batches:
+                if len(in_flight) >= self.max_in_flight_upserts:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    inserted += sum(future.result() for future in done)
+                in_flight.add(executor.submit(upsert, batch))
+            inserted += sum(future.result() for future in in_flight)
+        if inserted == 0:
             logger.info("No pinecone records to insert")
-            return
+        return inserted
 
+    def _pack_pinecone_records(
+        self, records: Iterable[GenericRecord]
+    ) -> Iterable[list[dict]]:
+        return _pack_by_payload(
+            (
+                self.convert_generic_records_to_pinecone_records([record])[0]
+                for record in records
+            ),
+            UPSERT_RECORDS_MAX_COUNT,
+            self.telemetry,
+        )
+
+    def _embed_and_upsert_vectors(self, records: tuple[GenericRecord, ...]) -> int:
+        start = time.perf_counter()
+        vectors = self.embedding_client.embed_records(list(records))
+        self.telemetry.observe("embedding_seconds", time.perf_counter() - start)
+        pinecone_vectors = [
+            {
+                "id": record.id,
+                "values": vector.tolist(),
+                "metadata": {
+                    **_with_directories(record.metadata),
+                    "code_with_context": record.unembedded_content,
+                },
+            }
+            for record, vector in zip(records, vectors, strict=True)
+        ]
+        for batch in _pack_by_payload(
+            pinecone_vectors, UPSERT_VECTORS_MAX_COUNT, self.telemetry
+        ):
+            logger.bind(pinecone_vectors=len(batch)).info("Inserting pinecone vectors")
+            self._with_retry(
+                lambda batch=batch: self.index.upsert(
+                    namespace=self.namespace, vectors=batch
+                ),
+                operation="upsert",
+            )
+            self.telemetry.increment("upserted_records", len(batch))
+        return len(pinecone_vectors)
+
+    def _upsert_records_with_retry(self, pinecone_records: list[dict]) -> int:
         logger.bind(pinecone_records=len(pinecone_records)).info(
             "Inserting pinecone records"
         )
         # Pinecone will automatically embed using the configured model
-        self.index.upsert_records(namespace=self.namespace, records=pinecone_records)
+        self._with_retry(
+            lambda: self.index.upsert_records(
+                namespace=self.namespace, records=pinecone_records
+            ),
+            operation="upsert",
+        )
+        self.telemetry.increment("upserted_records", len(pinecone_records))
+        return len(pinecone_records)
+
+    def _with_retry(self, request: Callable[[], object], operation: str) -> None:
+        for attempt in range(UPSERT_MAX_RETRIES + 1):
+            try:
+                with self._request_slots:
+                    start = time.perf_counter()
+                    request()
+                self.telemetry.observe(
+                    "pinecone_request_seconds",
+                    time.perf_counter() - start,
+                    operation=operation,
+                )
+                return
+            except PineconeApiException as e:
+                retryable = e.status == 429 or (e.status or 0) >= 500
+                if not retryable or attempt == UPSERT_MAX_RETRIES:
+                    self.telemetry.increment(
+                        "pinecone_errors", operation=operation, status=str(e.status)
+                    )
+                    raise
+                self.telemetry.increment(
+                    "pinecone_retries", operation=operation, status=str(e.status)
+                )
+                delay = random.uniform(
+                    0,
+                    min(UPSERT_RETRY_MAX_DELAY, UPSERT_RETRY_BASE_DELAY * 2**attempt),
+                )
+                logger.bind(status=e.status, attempt=attempt + 1, delay=delay).warning(
+                    "Retrying pinecone request"
+                )
+                time.sleep(delay)
 
     def get_current_files_embedded(self, repo_owner: str, repo_name: str) -> list[str]:
         """
         Get list of all file paths currently embedded for this repo
         """
-        current_files = []
-        chunks = []
+        current_files: dict[str, None] = {}
+        for chunk_id_page in self.list_record_ids(repo_owner, repo_name):
+            for chunk_id in chunk_id_page:
+                current_files[
+                    file_path_from_chunk_id(chunk_id, repo_owner, repo_name)
+                ] = None
+        return list(current_files)
 
-        # List all chunk IDs for this repo
-        current_repo_chunk_ids = self.index.list(
-            prefix=f"{repo_owner}#{repo_name}#", namespace=self.namespace
+    def list_record_ids(
+        self, repo_owner: str, repo_name: str, file_path: str | None = None
+    ) -> Iterable[list[str]]:
+        # Pages of at most 100 IDs, listed server-side by prefix
+        return self.index.list(
+            prefix=chunk_id_prefix(repo_owner, repo_name, file_path),
+            namespace=self.namespace,
         )
 
-        # Collect all chunk IDs from paginated results
-        for chunk_id_page in current_repo_chunk_ids:
-            chunks.extend(chunk_id_page)
-
-        # Extract unique file paths from chunk IDs
-        # ID format: owner#repo#file_path#index
-        for chunk_id in chunks:
-            file_path = chunk_id.split("#")[-2]
-            if file_path not in current_files:
-                current_files.append(file_path)
-
-        return current_files
+    def remove_records_by_id(self, ids: list[str]) -> None:
+        for batch in batched(ids, DELETE_MAX_IDS):
+            self._with_retry(
+                lambda batch=batch: self.index.delete(
+                    ids=list(batch), namespace=self.namespace
+                ),
+                operation="delete",
+            )
 
     def remove_vectors_by_file_path(
         self, file_path: str, repo_owner: str, repo_name: str
@@ -113,27 +310,38 @@ class PineconeVectorStore(VectorIndexRepo):
         """
         Remove all chunks for a specific file
         """
-        try:
-            self.index.delete(
+        self._with_retry(
+            lambda: self.index.delete(
                 namespace=self.namespace,
                 filter={
                     "file_path": {"$eq": file_path},
                     "repo_owner": {"$eq": repo_owner},
                     "repo_name": {"$eq": repo_name},
                 },
-            )
-            return True
-        except Exception as e:
-            print(f"Error removing chunks for {file_path}: {e}")
-            return False
+            ),
+            operation="delete",
+        )
+        return True
 
-    def search_vectors(self, query: str, top_k: int = 10) -> list[GenericRecord]:
+    def search_vectors(
+        self, query: str, top_k: int = 10, search_filter: SearchFilter | None = None
+    ) -> list[GenericRecord]:
         """Search for relevant code chunks"""
+        if self.embedding_client is not None:
+            query_vector = self.embedding_client.embed_records(
+                [GenericRecord(id="query", unembedded_content=query, metadata={})]
+            )[0]
+            return self._query_vector(query_vector, top_k, search_filter)
+
         # Query the index with Pinecone's inference API using the new format
+        search_query = {"inputs": {"text": query}, "top_k": top_k}
+        pinecone_filter = _pinecone_filter(search_filter)
+        if pinecone_filter is not None:
+            search_query["filter"] = pinecone_filter
         results = self.index.search(
             namespace=self.namespace,
-            query={"inputs": {"text": query}, "top_k": top_k},
-            fields=["code_with_context", "repo_owner", "repo_name"],
+            query=search_query,
+            fields=SEARCH_FIELDS,
         )
 
         # Convert Pinecone search results to GenericRecord format
@@ -142,13 +350,60 @@ class PineconeVectorStore(VectorIndexRepo):
 
         return generic_records
 
+    def search_vectors_batch(
+        self,
+        queries: Iterable[str],
+        top_k: int = 10,
+        search_filter: SearchFilter | None = None,
+        max_concurrency: int = DEFAULT_SEARCH_CONCURRENCY,
+    ) -> Iterator[list[GenericRecord]]:
+        """
+        With an embedding_client, queries are embedded CLIENT_EMBEDDING_BATCH_SIZE
+        at a time before being sent concurrently. Pinecone has no multi-query
+        request, so each query is still one request.
+        """
+        if self.embedding_client is None:
+            yield from super().search_vectors_batch(
+                queries, top_k, search_filter, max_concurrency
+            )
+            return
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            for batch in batched(queries, CLIENT_EMBEDDING_BATCH_SIZE):
+                query_vectors = self.embedding_client.embed_records(
+                    [
+                        GenericRecord(id="query", unembedded_content=query, metadata={})
+                        for query in batch
+                    ]
+                )
+                yield from executor.map(
+                    lambda query_vector: self._query_vector(
+                        query_vector, top_k, search_filter
+                    ),
+                    query_vectors,
+                )
+
+    def _query_vector(
+        self,
+        query_vector: np.ndarray,
+        top_k: int,
+        search_filter: SearchFilter | None,
+    ) -> list[GenericRecord]:
+        results = self.index.query(
+            namespace=self.namespace,
+            vector=query_vector.tolist(),
+            top_k=top_k,
+            filter=_pinecone_filter(search_filter),
+            include_metadata=True,
+        )
+        return self.convert_pinecone_query_matches_to_generic_records(results.matches)
+
     def convert_embedded_records_to_pinecone_vectors(
         self, records: list[EmbeddedRecord]
     ) -> list[dict]:
         return [
             {
                 "id": record.id,
-                "metadata": record.metadata,
+                "metadata": _with_directories(record.metadata),
                 "values": record.embedded_content,
             }
             for record in records
@@ -185,6 +440,7 @@ class PineconeVectorStore(VectorIndexRepo):
                 "repo_name": fields.get("repo_name", ""),
                 "file_path": fields.get("file_path", ""),
                 "index": fields.get("index", ""),
+                "file_type": fields.get("file_type", ""),
             }
 
             # Include score if available
@@ -201,14 +457,77 @@ class PineconeVectorStore(VectorIndexRepo):
 
         return generic_records
 
+    def convert_pinecone_query_matches_to_generic_records(
+        self, matches: list
+    ) -> list[GenericRecord]:
+        """Convert Pinecone query matches of client-side embedded vectors"""
+        generic_records = []
+        for match in matches:
+            metadata = dict(match.metadata or {})
+            unembedded_content = metadata.pop("code_with_context", "")
+            metadata.pop(DIRECTORIES_FIELD, None)
+            metadata["score"] = match.score
+            generic_records.append(
+                GenericRecord(
+                    id=match.id,
+                    unembedded_content=unembedded_content,
+                    metadata=metadata,
+                )
+            )
+        return generic_records
+
     def convert_generic_records_to_pinecone_records(
         self, records: list[GenericRecord]
     ) -> list[dict]:
         return [
             {
                 "id": record.id,
-                **record.metadata,
+                **_with_directories(record.metadata),
                 "code_with_context": record.unembedded_content,
             }
             for record in records
         ]
+
+
+def _pack_by_payload(
+    items: Iterable[dict], max_count: int, telemetry: Telemetry
+) -> Iterable[list[dict]]:
+    """Groups items into batches within the count and payload size limits."""
+    max_payload_bytes = UPSERT_MAX_PAYLOAD_BYTES * UPSERT_PAYLOAD_HEADROOM
+    batch: list[dict] = []
+    batch_bytes = 0
+    for item in items:
+        item_bytes = len(json.dumps(item).encode("utf-8"))
+        if batch and (
+            len(batch) >= max_count or batch_bytes + item_bytes > max_payload_bytes
+        ):
+            telemetry.increment("upsert_bytes", batch_bytes)
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(item)
+        batch_bytes += item_bytes
+    if batch:
+        telemetry.increment("upsert_bytes", batch_bytes)
+        yield batch
+
+
+def _with_directories(metadata: dict) -> dict:
+    if "file_path" not in metadata:
+        return metadata
+    return {**metadata, DIRECTORIES_FIELD: file_directories(metadata["file_path"])}
+
+
+def _pinecone_filter(search_filter: SearchFilter | None) -> dict | None:
+    if search_filter is None or search_filter.is_empty:
+        return None
+    pinecone_filter = {}
+    for field in ("repo_owner", "repo_name"):
+        value = getattr(search_filter, field)
+        if value is not None:
+            pinecone_filter[field] = {"$eq": value}
+    if search_filter.path_prefix is not None:
+        pinecone_filter[DIRECTORIES_FIELD] = {"$in": [search_filter.path_prefix]}
+    if search_filter.file_types:
+        pinecone_filter["file_type"] = {"$in": search_filter.file_types}
+    return pinecone_filter
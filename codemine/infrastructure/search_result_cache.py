@@ -0,0 +1,244 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import structlog
+
+from codemine.domain.ports.search_cache import SearchCache
+from codemine.domain.value_objects import GenericRecord
+
+logger = structlog.get_logger()
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_DISK_ENTRIES = 100_000
+DEFAULT_TTL_SECONDS = 3600.0
+# Eviction trims the disk cache to this fraction of the maximum so that it
+# does not run on every insert once the cache is full.
+EVICTION_LOW_WATER_MARK = 0.9
+STAT_NAMES = ("memory_hits", "disk_hits", "misses", "hit_seconds", "miss_seconds")
+
+
+class SearchResultCache(SearchCache):
+    """
+    Two-level cache of search results: an in-process LRU of max_entries
+    entries, backed by an optional SQLite cache at path that survives
+    restarts. Entries expire after ttl_seconds. Scope generations are kept in
+    SQLite when a path is given, so an embed run in another process
+    invalidates this process's entries too.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        path: str | None = None,
+        max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, list[GenericRecord]]] = (
+            OrderedDict()
+        )
+        self._generations: dict[str, int] = {}
+        self._stats = dict.fromkeys(STAT_NAMES, 0.0)
+        self._connection = None
+        if path is None:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self._connection.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS search_cache (
+                key TEXT PRIMARY KEY,
+                records TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS search_cache_last_used
+                ON search_cache (last_used);
+            CREATE TABLE IF NOT EXISTS generations (
+                scope TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+            """
+        )
+        self._connection.executemany(
+            "INSERT OR IGNORE INTO cache_stats (name, value) VALUES (?, 0)",
+            [(name,) for name in STAT_NAMES],
+        )
+        self._disk_entries = self._connection.execute(
+            "SELECT COUNT(*) FROM search_cache"
+        ).fetchone()[0]
+
+    def get(self, key: str) -> list[GenericRecord] | None:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._increment_stat("memory_hits")
+                return list(entry[1])
+            if entry is not None:
+                del self._entries[key]
+            if self._connection is not None:
+                row = self._connection.execute(
+                    "SELECT records, expires_at FROM search_cache WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    self._connection.execute(
+                        "UPDATE search_cache SET last_used = ? WHERE key = ?",
+                        (now, key),
+                    )
+                    records = [
+                        GenericRecord.model_validate(record)
+                        for record in json.loads(row[0])
+                    ]
+                    self._remember(key, row[1], records)
+                    self._increment_stat("disk_hits")
+                    return list(records)
+            self._increment_stat("misses")
+            return None
+
+    def set(self, key: str, records: list[GenericRecord]) -> None:
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, list(records))
+            if self._connection is None:
+                return
+            with self._connection:
+                self._connection.execute("BEGIN")
+                self._disk_entries -= self._connection.execute(
+                    "DELETE FROM search_cache WHERE key = ?", (key,)
+                ).rowcount
+                self._connection.execute(
+                    "INSERT INTO search_cache"
+                    " (key, records, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                    (
+                        key,
+                        json.dumps([record.model_dump() for record in records]),
+                        expires_at,
+                        now,
+                    ),
+                )
+            self._disk_entries += 1
+            if self._disk_entries > self.max_disk_entries:
+                self._evict(int(self.max_disk_entries * EVICTION_LOW_WATER_MARK))
+
+    def generation(self, scope: str) -> int:
+        with self._lock:
+            if self._connection is None:
+                return self._generations.get(scope, 0)
+            row = self._connection.execute(
+                "SELECT generation FROM generations WHERE scope = ?", (scope,)
+            ).fetchone()
+            return row[0] if row is not None else 0
+
+    def invalidate(self, *scopes: str) -> None:
+        with self._lock:
+            for scope in scopes:
+                self._generations[scope] = self._generations.get(scope, 0) + 1
+            # Entries of other scopes may still be valid, but the in-process
+            # level is small enough to refill.
+            self._entries.clear()
+            if self._connection is not None:
+                self._connection.executemany(
+                    "INSERT INTO generations (scope, generation) VALUES (?, 1)"
+                    " ON CONFLICT (scope) DO UPDATE SET generation = generation + 1",
+                    [(scope,) for scope in scopes],
+                )
+        logger.bind(scopes=list(scopes)).info("Invalidated search cache")
+
+    def record_latency(self, hit: bool, seconds: float) -> None:
+        with self._lock:
+            self._increment_stat("hit_seconds" if hit else "miss_seconds", seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            totals = dict(self._stats)
+            disk_entries = 0
+            if self._connection is not None:
+                totals.update(
+                    self._connection.execute("SELECT name, value FROM cache_stats")
+                )
+                disk_entries = self._disk_entries
+            memory_entries = len(self._entries)
+        hits = int(totals["memory_hits"] + totals["disk_hits"])
+        misses = int(totals["misses"])
+        return {
+            "path": self.path,
+            "memory_entries": memory_entries,
+            "disk_entries": disk_entries,
+            "memory_hits": int(totals["memory_hits"]),
+            "disk_hits": int(totals["disk_hits"]),
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "mean_hit_ms": 1000 * totals["hit_seconds"] / hits if hits else 0.0,
+            "mean_miss_ms": 1000 * totals["miss_seconds"] / misses if misses else 0.0,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._stats = dict.fromkeys(STAT_NAMES, 0.0)
+            if self._connection is not None:
+                self._connection.execute("DELETE FROM search_cache")
+                self._connection.execute("UPDATE cache_stats SET value = 0")
+                self._connection.execute("VACUUM")
+                self._disk_entries = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+
+    def _remember(
+        self, key: str, expires_at: float, records: list[GenericRecord]
+    ) -> None:
+        self._entries[key] = (expires_at, records)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _increment_stat(self, name: str, amount: float = 1) -> None:
+        self._stats[name] += amount
+        if self._connection is not None:
+            self._connection.execute(
+                "UPDATE cache_stats SET value = value + ? WHERE name = ?",
+                (amount, name),
+            )
+
+    def _evict(self, target_entries: int) -> None:
+        now = time.time()
+        expired = self._connection.execute(
+            "DELETE FROM search_cache WHERE expires_at <= ?", (now,)
+        ).rowcount
+        self._disk_entries -= expired
+        excess = self._disk_entries - target_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM search_cache WHERE key IN"
+                " (SELECT key FROM search_cache ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            self._disk_entries -= excess
+        logger.bind(expired=expired, evicted=max(excess, 0)).info(
+            "Evicted search cache entries"
+        )
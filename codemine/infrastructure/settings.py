@@ -1,11 +1,52 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
-    pinecone_api_key: str
+    pinecone_api_key: str | None = None
+    pinecone_index_host: str | None = None
     github_token: str
     openai_api_key: str
     openai_base_url: str = "https://openrouter.ai/api/v1"
+    enrichment_cache_path: str = ".codemine/enrichment_cache.sqlite"
+    enrichment_cache_max_bytes: int = 512 * 1024 * 1024
+    enrichment_strategy: Literal["chunk", "document"] = "chunk"
+    enrichment_group_token_budget: int = 4000
+    enrichment_max_document_tokens: int = 32_000
+    # USD per million tokens, used for enrichment cost estimates.
+    enrichment_input_cost_per_million: float = 0.10
+    enrichment_output_cost_per_million: float = 0.40
+    # Estimated similarity from which --deduplication near reuses a context.
+    deduplication_near_threshold: float = 0.9
+    # Chunk contexts kept in memory for reuse by later runs of the process.
+    deduplication_max_shared_contexts: int = 100_000
+    embed_state_path: str = ".codemine/embed_state.sqlite"
+    chunk_manifest_path: str = ".codemine/manifest.sqlite"
+    job_state_path: str = ".codemine/jobs.sqlite"
+    checkpoint_path: str = ".codemine/checkpoints.sqlite"
+    search_cache_entries: int = 1024
+    search_cache_ttl_seconds: float = 3600.0
+    # Set to an empty string to only cache search results in memory.
+    search_cache_path: str = ".codemine/search_cache.sqlite"
+    # Set to an empty string to not build a lexical index.
+    lexical_index_dir: str = ".codemine/lexical"
+    git_mirror_cache_dir: str = ".codemine/mirrors"
+    # "auto" lists files with git ls-files in git checkouts and walks others.
+    file_discovery_source: Literal["auto", "git", "walk"] = "auto"
+    max_file_bytes: int = 1024 * 1024
+    pinecone_upsert_concurrency: int = 8
+    vector_store_backend: Literal["pinecone", "local"] = "pinecone"
+    local_vector_store_dir: str = ".codemine/vectors"
+    local_vector_index: Literal["exact", "ivf"] = "exact"
+    ivf_n_lists: int | None = None
+    ivf_nprobe: int = 32
+    embedding_model: str | None = None
+    embedding_base_url: str = "https://api.openai.com/v1"
+    embedding_api_key: str | None = None
+    embedding_dimension: int = 1536
+    embedding_batch_tokens: int = 100_000
+    embedding_cache_path: str = ".codemine/embedding_cache.sqlite"
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,30 @@
+from codemine.domain.value_objects import SearchFilter
+
+
+def search_filter_clauses(search_filter: SearchFilter) -> tuple[list[str], list[str]]:
+    """
+    Returns SQL conditions and their parameters matching the filter, for
+    tables with repo_owner, repo_name and file_path columns.
+    """
+    clauses: list[str] = []
+    parameters: list[str] = []
+    for column in ("repo_owner", "repo_name"):
+        value = getattr(search_filter, column)
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            parameters.append(value)
+    if search_filter.path_prefix is not None:
+        # A range rather than LIKE, so the file index is used.
+        clauses.append("file_path >= ? AND file_path < ?")
+        parameters += [
+            search_filter.path_prefix + "/",
+            search_filter.path_prefix + "/\uffff",
+        ]
+    if search_filter.file_types:
+        clauses.append(
+            "("
+            + " OR ".join(["file_path GLOB ?"] * len(search_filter.file_types))
+            + ")"
+        )
+        parameters += [f"*.{file_type}" for file_type in search_filter.file_types]
+    return clauses, parameters
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import threading
+import time
+
+from codemine.domain.model.code_document import ChunkedDocument
+from codemine.domain.repositories.checkpoint_repo import CheckpointRepo
+from codemine.domain.value_objects import CheckpointStage, EmbedRunKey
+
+
+class SqliteCheckpointRepo(CheckpointRepo):
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self._connection.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS checkpoint_files (
+                index_name TEXT NOT NULL,
+                repo_owner TEXT NOT NULL,
+                repo_name TEXT NOT NULL,
+                commit_sha TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                document TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (index_name, repo_owner, repo_name, commit_sha, file_path)
+            );
+            """
+        )
+
+    def get_progress(
+        self, key: EmbedRunKey
+    ) -> dict[str, tuple[CheckpointStage, ChunkedDocument | None]]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT file_path, stage, document FROM checkpoint_files"
+                " WHERE index_name = ? AND repo_owner = ? AND repo_name = ?"
+                " AND commit_sha = ?",
+                self._key_params(key),
+            ).fetchall()
+        return {
+            file_path: (
+                stage,
+                ChunkedDocument.model_validate_json(document) if document else None,
+            )
+            for file_path, stage, document in rows
+        }
+
+    def mark_chunked(self, key: EmbedRunKey, file_paths: list[str]) -> None:
+        self._write(
+            "INSERT OR IGNORE INTO checkpoint_files"
+            " (index_name, repo_owner, repo_name, commit_sha, file_path, stage,"
+            " updated_at) VALUES (?, ?, ?, ?, ?, 'chunked', ?)",
+            [(*self._key_params(key), path, time.time()) for path in file_paths],
+        )
+
+    def save_enriched(self, key: EmbedRunKey, documents: list[ChunkedDocument]) -> None:
+        self._write(
+            "INSERT OR REPLACE INTO checkpoint_files"
+            " (index_name, repo_owner, repo_name, commit_sha, file_path, stage,"
+            " document, updated_at) VALUES (?, ?, ?, ?, ?, 'enriched', ?, ?)",
+            [
+                (
+                    *self._key_params(key),
+                    document.file_path,
+                    document.model_dump_json(),
+                    time.time(),
+                )
+                for document in documents
+            ],
+        )
+
+    def mark_upserted(self, key: EmbedRunKey, file_paths: list[str]) -> None:
+        self._write(
+            "UPDATE checkpoint_files SET stage = 'upserted', updated_at = ?"
+            " WHERE index_name = ? AND repo_owner = ? AND repo_name = ?"
+            " AND commit_sha = ? AND file_path = ?",
+            [(time.time(), *self._key_params(key), path) for path in file_paths],
+        )
+
+    def clear(self, index_name: str, repo_owner: str, repo_name: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM checkpoint_files"
+                " WHERE index_name = ? AND repo_owner = ? AND repo_name = ?",
+                (index_name, repo_owner, repo_name),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _write(self, statement: str, params: list[tuple]) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(statement, params)
+
+    @staticmethod
+    def _key_params(key: EmbedRunKey) -> tuple[str, str, str, str]:
+        return (key.index_name, key.repo_owner, key.repo_name, key.commit_sha)
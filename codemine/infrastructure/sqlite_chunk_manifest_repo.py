@@ -0,0 +1,195 @@
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from itertools import batched
+
+from codemine.domain.repositories.chunk_manifest_repo import ChunkManifestRepo
+from codemine.domain.value_objects import ManifestEntry
+
+# SQLite limits the number of parameters in a single statement.
+LOOKUP_BATCH_SIZE = 500
+LIST_PAGE_SIZE = 1000
+
+
+class SqliteChunkManifestRepo(ChunkManifestRepo):
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self._connection.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS chunks (
+                index_name TEXT NOT NULL,
+                repo_owner TEXT NOT NULL,
+                repo_name TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                commit_sha TEXT,
+                model_version TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                run_id TEXT,
+                PRIMARY KEY (index_name, repo_owner, repo_name, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS chunks_file
+                ON chunks (index_name, repo_owner, repo_name, file_path);
+            """
+        )
+
+    def get_content_hashes(
+        self, index_name: str, repo_owner: str, repo_name: str
+    ) -> dict[str, str]:
+        with self._lock:
+            return dict(
+                self._connection.execute(
+                    "SELECT chunk_id, content_hash FROM chunks"
+                    " WHERE index_name = ? AND repo_owner = ? AND repo_name = ?",
+                    (index_name, repo_owner, repo_name),
+                ).fetchall()
+            )
+
+    def get_chunk_ids_for_files(
+        self,
+        index_name: str,
+        repo_owner: str,
+        repo_name: str,
+        file_paths: Iterable[str],
+    ) -> list[str]:
+        chunk_ids = []
+        with self._lock:
+            for batch in batched(set(file_paths), LOOKUP_BATCH_SIZE):
+                placeholders = ",".join("?" * len(batch))
+                chunk_ids.extend(
+                    row[0]
+                    for row in self._connection.execute(
+                        "SELECT chunk_id FROM chunks"
+                        " WHERE index_name = ? AND repo_owner = ? AND repo_name = ?"
+                        f" AND file_path IN ({placeholders})",
+                        (index_name, repo_owner, repo_name, *batch),
+                    )
+                )
+        return chunk_ids
+
+    def upsert_chunks(
+        self,
+        index_name: str,
+        repo_owner: str,
+        repo_name: str,
+        entries: Iterable[ManifestEntry],
+        run_id: str | None = None,
+    ) -> None:
+        updated_at = time.time()
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO chunks"
+                " (index_name, repo_owner, repo_name, chunk_id, file_path,"
+                " content_hash, commit_sha, model_version, updated_at, run_id)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        index_name,
+                        repo_owner,
+                        repo_name,
+                        entry.chunk_id,
+                        entry.file_path,
+                        entry.content_hash,
+                        entry.commit_sha,
+                        entry.model_version,
+                        updated_at,
+                        run_id,
+                    )
+                    for entry in entries
+                ),
+            )
+
+    def list_chunks_not_in_run(
+        self,
+        index_name: str,
+        repo_owner: str,
+        repo_name: str,
+        run_id: str,
+        file_paths: Iterable[str] | None = None,
+    ) -> Iterator[list[str]]:
+        if file_paths is None:
+            yield from self._pages_not_in_run(
+                index_name, repo_owner, repo_name, run_id, "", ()
+            )
+            return
+        for batch in batched(set(file_paths), LOOKUP_BATCH_SIZE):
+            yield from self._pages_not_in_run(
+                index_name,
+                repo_owner,
+                repo_name,
+                run_id,
+                f" AND file_path IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+
+    def _pages_not_in_run(
+        self,
+        index_name: str,
+        repo_owner: str,
+        repo_name: str,
+        run_id: str,
+        file_clause: str,
+        file_paths: tuple[str, ...],
+    ) -> Iterator[list[str]]:
+        last_id = ""
+        # Keyset pagination, so removals between pages never skip IDs.
+        while True:
+            with self._lock:
+                page = [
+                    row[0]
+                    for row in self._connection.execute(
+                        "SELECT chunk_id FROM chunks"
+                        " WHERE index_name = ? AND repo_owner = ? AND repo_name = ?"
+                        " AND run_id IS NOT ? AND chunk_id > ?"
+                        f"{file_clause} ORDER BY chunk_id LIMIT ?",
+                        (
+                            index_name,
+                            repo_owner,
+                            repo_name,
+                            run_id,
+                            last_id,
+                            *file_paths,
+                            LIST_PAGE_SIZE,
+                        ),
+                    )
+                ]
+            if not page:
+                return
+            yield page
+            last_id = page[-1]
+
+    def remove_chunks(
+        self,
+        index_name: str,
+        repo_owner: str,
+        repo_name: str,
+        chunk_ids: Iterable[str],
+    ) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "DELETE FROM chunks"
+                " WHERE index_name = ? AND repo_owner = ? AND repo_name = ?"
+                " AND chunk_id = ?",
+                (
+                    (index_name, repo_owner, repo_name, chunk_id)
+                    for chunk_id in chunk_ids
+                ),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,68 @@
+import os
+import sqlite3
+import threading
+import time
+
+from codemine.domain.repositories.embed_state_repo import EmbedStateRepo
+
+
+class SqliteEmbedStateRepo(EmbedStateRepo):
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self._connection.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS embedded_commits (
+                index_name TEXT NOT NULL,
+                repo_owner TEXT NOT NULL,
+                repo_name TEXT NOT NULL,
+                commit_sha TEXT NOT NULL,
+                embedded_at REAL NOT NULL,
+                PRIMARY KEY (index_name, repo_owner, repo_name)
+            );
+            """
+        )
+
+    def get_last_embedded_commit(
+        self, index_name: str, repo_owner: str, repo_name: str
+    ) -> str | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT commit_sha FROM embedded_commits"
+                " WHERE index_name = ? AND repo_owner = ? AND repo_name = ?",
+                (index_name, repo_owner, repo_name),
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_last_embedded_at(
+        self, index_name: str, repo_owner: str, repo_name: str
+    ) -> float | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT embedded_at FROM embedded_commits"
+                " WHERE index_name = ? AND repo_owner = ? AND repo_name = ?",
+                (index_name, repo_owner, repo_name),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_last_embedded_commit(
+        self, index_name: str, repo_owner: str, repo_name: str, commit_sha: str
+    ) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO embedded_commits"
+                " (index_name, repo_owner, repo_name, commit_sha, embedded_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (index_name, repo_owner, repo_name, commit_sha, time.time()),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
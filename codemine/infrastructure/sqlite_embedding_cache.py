@@ -0,0 +1,112 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import structlog
+
+from codemine.domain.ports.embedding_client import EmbeddingClient
+from codemine.domain.value_objects import GenericRecord
+
+logger = structlog.get_logger()
+
+# SQLite limits the number of parameters in a single statement.
+LOOKUP_BATCH_SIZE = 500
+
+
+class CachingEmbeddingClient(EmbeddingClient):
+    """
+    Wraps an EmbeddingClient with a persistent SQLite cache keyed by a hash of
+    the model, the dimension and the record content, so identical content is
+    only ever embedded once per model.
+    """
+
+    def __init__(self, client: EmbeddingClient, path: str):
+        self.client = client
+        self.model = client.model
+        self.dimension = client.dimension
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self._connection.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL
+            );
+            """
+        )
+
+    def embed_records(self, records: list[GenericRecord]) -> np.ndarray:
+        keys = [self.cache_key(record.unembedded_content) for record in records]
+        vectors = np.empty((len(records), self.dimension), dtype=np.float32)
+        cached = self._get_many(keys)
+        missing = [position for position, key in enumerate(keys) if key not in cached]
+        for position, key in enumerate(keys):
+            if key in cached:
+                vectors[position] = np.frombuffer(cached[key], dtype=np.float32)
+        self.hits += len(records) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            # Records repeating content, such as duplicated chunks, are
+            # embedded once.
+            unique_positions = {keys[position]: position for position in missing}
+            embedded = self.client.embed_records(
+                [records[position] for position in unique_positions.values()]
+            )
+            offsets = {key: offset for offset, key in enumerate(unique_positions)}
+            vectors[missing] = embedded[
+                [offsets[keys[position]] for position in missing]
+            ]
+            self._set_many(
+                [(key, embedded[offsets[key]].tobytes()) for key in unique_positions]
+            )
+        logger.bind(hits=len(records) - len(missing), misses=len(missing)).info(
+            "Embedding cache lookup"
+        )
+        return vectors
+
+    def cache_key(self, content: str) -> str:
+        hasher = hashlib.sha256()
+        for part in (self.model, str(self.dimension), content):
+            hasher.update(part.encode("utf-8"))
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _get_many(self, keys: list[str]) -> dict[str, bytes]:
+        found: dict[str, bytes] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique_keys), LOOKUP_BATCH_SIZE):
+                batch = unique_keys[start : start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                found.update(
+                    self._connection.execute(
+                        "SELECT key, vector FROM embedding_cache"
+                        f" WHERE key IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+                )
+        return found
+
+    def _set_many(self, entries: list[tuple[str, bytes]]) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (key, vector) VALUES (?, ?)",
+                entries,
+            )
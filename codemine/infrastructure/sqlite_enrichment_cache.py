@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import threading
+import time
+
+import structlog
+
+from codemine.domain.ports.enrichment_cache import EnrichmentCache
+
+logger = structlog.get_logger()
+
+DEFAULT_MAX_SIZE_BYTES = 512 * 1024 * 1024
+# Eviction trims the cache to this fraction of the maximum so that it does not
+# run on every insert once the cache is full.
+EVICTION_LOW_WATER_MARK = 0.9
+# Lookups whose access times and hit and miss counts are kept in memory
+# before they are written in one transaction.
+LOOKUP_FLUSH_INTERVAL = 1000
+
+
+class SqliteEnrichmentCache(EnrichmentCache):
+    """
+    Persistent, size-bounded LRU cache of chunk contexts stored in SQLite.
+    Lookups only read; the access times of hits and the hit and miss counts
+    are written every LOOKUP_FLUSH_INTERVAL lookups, on flush and on close.
+    """
+
+    def __init__(self, path: str, max_size_bytes: int = DEFAULT_MAX_SIZE_BYTES):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._touched: dict[str, float] = {}
+        self._unwritten_hits = 0
+        self._unwritten_misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self._connection.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS enrichment_cache (
+                key TEXT PRIMARY KEY,
+                context TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS enrichment_cache_last_used
+                ON enrichment_cache (last_used);
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO cache_stats (name, value)
+                VALUES ('hits', 0), ('misses', 0);
+            """
+        )
+        self._size_bytes = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM enrichment_cache"
+        ).fetchone()[0]
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT context FROM enrichment_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                self._unwritten_misses += 1
+            else:
+                self.hits += 1
+                self._unwritten_hits += 1
+                self._touched[key] = time.time()
+            if self._unwritten_hits + self._unwritten_misses >= LOOKUP_FLUSH_INTERVAL:
+                self._flush()
+            return row[0] if row is not None else None
+
+    def set(self, key: str, context: str) -> None:
+        size = len(context.encode("utf-8"))
+        with self._lock:
+            self._touched.pop(key, None)
+            previous = self._connection.execute(
+                "SELECT size FROM enrichment_cache WHERE key = ?", (key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO enrichment_cache"
+                " (key, context, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, context, size, time.time()),
+            )
+            self._size_bytes += size - (previous[0] if previous else 0)
+            if self._size_bytes > self.max_size_bytes:
+                self._flush()
+                self._evict(int(self.max_size_bytes * EVICTION_LOW_WATER_MARK))
+
+    def flush(self) -> None:
+        """Writes the access times and counts of lookups since the last flush."""
+        with self._lock:
+            self._flush()
+
+    def prune(
+        self,
+        max_size_bytes: int | None = None,
+        older_than_seconds: float | None = None,
+    ) -> int:
+        """
+        Removes entries not used within older_than_seconds, then evicts least
+        recently used entries until the cache fits in max_size_bytes.
+        Returns the number of entries removed.
+        """
+        removed = 0
+        with self._lock:
+            self._flush()
+            if older_than_seconds is not None:
+                cursor = self._connection.execute(
+                    "DELETE FROM enrichment_cache WHERE last_used < ?",
+                    (time.time() - older_than_seconds,),
+                )
+                removed += cursor.rowcount
+                self._size_bytes = self._connection.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM enrichment_cache"
+                ).fetchone()[0]
+            if max_size_bytes is not None:
+                removed += self._evict(max_size_bytes)
+            self._connection.execute("VACUUM")
+        logger.bind(removed=removed).info("Pruned enrichment cache")
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._touched.clear()
+            self._unwritten_hits = 0
+            self._unwritten_misses = 0
+            self._connection.execute("DELETE FROM enrichment_cache")
+            self._connection.execute("UPDATE cache_stats SET value = 0")
+            self._connection.execute("VACUUM")
+            self._size_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._flush()
+            entries = self._connection.execute(
+                "SELECT COUNT(*) FROM enrichment_cache"
+            ).fetchone()[0]
+            totals = dict(
+                self._connection.execute("SELECT name, value FROM cache_stats")
+            )
+        return {
+            "path": self.path,
+            "entries": entries,
+            "size_bytes": self._size_bytes,
+            "max_size_bytes": self.max_size_bytes,
+            "total_hits": totals.get("hits", 0),
+            "total_misses": totals.get("misses", 0),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._connection.close()
+
+    def _flush(self) -> None:
+        if not (self._unwritten_hits or self._unwritten_misses):
+            return
+        with self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "UPDATE enrichment_cache SET last_used = ? WHERE key = ?",
+                [(last_used, key) for key, last_used in self._touched.items()],
+            )
+            self._connection.executemany(
+                "UPDATE cache_stats SET value = value + ? WHERE name = ?",
+                [(self._unwritten_hits, "hits"), (self._unwritten_misses, "misses")],
+            )
+        self._touched.clear()
+        self._unwritten_hits = 0
+        self._unwritten_misses = 0
+
+    def _evict(self, target_size_bytes: int) -> int:
+        removed = 0
+        rows = self._connection.execute(
+            "SELECT key, size FROM enrichment_cache ORDER BY last_used"
+        )
+        keys_to_remove = []
+        for key, size in rows:
+            if self._size_bytes <= target_size_bytes:
+                break
+            keys_to_remove.append((key,))
+            self._size_bytes -= size
+            removed += 1
+        rows.close()
+        self._connection.executemany(
+            "DELETE FROM enrichment_cache WHERE key = ?", keys_to_remove
+        )
+        if removed:
+            logger.bind(removed=removed, size_bytes=self._size_bytes).info(
+                "Evicted enrichment cache entries"
+            )
+        return removed
@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import threading
+import time
+
+from codemine.domain.repositories.job_state_repo import JobStateRepo
+from codemine.domain.value_objects import BatchJob, RepositoryRef
+
+
+class SqliteJobStateRepo(JobStateRepo):
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self._connection.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS batch_jobs (
+                batch_name TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                repo_owner TEXT NOT NULL,
+                repo_name TEXT NOT NULL,
+                size_kb INTEGER,
+                pushed_at TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                chunked_files INTEGER NOT NULL DEFAULT 0,
+                total_chunks INTEGER NOT NULL DEFAULT 0,
+                seconds REAL NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (batch_name, repo_owner, repo_name)
+            );
+            """
+        )
+
+    def add_jobs(self, batch_name: str, repositories: list[RepositoryRef]) -> None:
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO batch_jobs"
+                " (batch_name, position, repo_owner, repo_name, size_kb,"
+                " pushed_at, status, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, 'pending', ?)",
+                [
+                    (
+                        batch_name,
+                        position,
+                        repository.owner,
+                        repository.name,
+                        repository.size_kb,
+                        repository.pushed_at,
+                        now,
+                    )
+                    for position, repository in enumerate(repositories)
+                ],
+            )
+
+    def get_jobs(self, batch_name: str) -> list[BatchJob]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT repo_owner, repo_name, size_kb, pushed_at, status, attempts,"
+                " error, chunked_files, total_chunks, seconds"
+                " FROM batch_jobs WHERE batch_name = ? ORDER BY position",
+                (batch_name,),
+            ).fetchall()
+        return [
+            BatchJob(
+                repository=RepositoryRef(
+                    owner=owner, name=name, size_kb=size_kb, pushed_at=pushed_at
+                ),
+                status=status,
+                attempts=attempts,
+                error=error,
+                chunked_files=chunked_files,
+                total_chunks=total_chunks,
+                seconds=seconds,
+            )
+            for (
+                owner,
+                name,
+                size_kb,
+                pushed_at,
+                status,
+                attempts,
+                error,
+                chunked_files,
+                total_chunks,
+                seconds,
+            ) in rows
+        ]
+
+    def save_job(self, batch_name: str, job: BatchJob) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE batch_jobs SET status = ?, attempts = ?, error = ?,"
+                " chunked_files = ?, total_chunks = ?, seconds = ?, updated_at = ?"
+                " WHERE batch_name = ? AND repo_owner = ? AND repo_name = ?",
+                (
+                    job.status,
+                    job.attempts,
+                    job.error,
+                    job.chunked_files,
+                    job.total_chunks,
+                    job.seconds,
+                    time.time(),
+                    batch_name,
+                    job.repository.owner,
+                    job.repository.name,
+                ),
+            )
+
+    def clear_batch(self, batch_name: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM batch_jobs WHERE batch_name = ?", (batch_name,)
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,295 @@
+import json
+import os
+import secrets
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from codemine.domain.ports.telemetry import NULL_SPAN, Span, Telemetry
+
+# Upper bounds in seconds of the histogram buckets, as in Prometheus.
+HISTOGRAM_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+)
+# Finished spans kept for export; later spans are only counted in histograms.
+DEFAULT_MAX_SPANS = 100_000
+METRIC_PREFIX = "codemine_"
+SERVICE_NAME = "codemine"
+# Histogram of the duration of every span, labelled by span name.
+SPAN_HISTOGRAM = "span_seconds"
+# OpenTelemetry span kind and status codes.
+SPAN_KIND_INTERNAL = 1
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span: ContextVar["RecordedSpan | None"] = ContextVar(
+    "codemine_current_span", default=None
+)
+
+type Labels = tuple[tuple[str, str], ...]
+
+
+class RecordedSpan(Span):
+    def __init__(self, telemetry: "RecordingTelemetry", name: str, attributes: dict):
+        self.telemetry = telemetry
+        self.name = name
+        self.attributes = attributes
+        self.error: str | None = None
+
+    def __enter__(self) -> "RecordedSpan":
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = secrets.token_hex(8)
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.seconds = time.perf_counter() - self._start
+        self.end_ns = self.start_ns + int(self.seconds * 1e9)
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.telemetry._finish(self)
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+
+class RecordingTelemetry(Telemetry):
+    """
+    Keeps spans, counters and histograms in memory for export as Prometheus
+    text, OpenTelemetry (OTLP JSON) spans and a summary report. While not
+    enabled it records nothing.
+
+    Spans nest through a context variable, so spans opened in threads and
+    tasks started from a span's context become its children.
+    """
+
+    def __init__(self, enabled: bool = True, max_spans: int = DEFAULT_MAX_SPANS):
+        self.enabled = enabled
+        self.max_spans = max_spans
+        self._lock = threading.Lock()
+        self._spans: list[RecordedSpan] = []
+        self._dropped_spans = 0
+        self._counters: dict[tuple[str, Labels], float] = {}
+        # Bucket counts, then the sum, count and maximum of the values.
+        self._histograms: dict[tuple[str, Labels], list] = {}
+
+    def span(self, name: str, **attributes) -> Span:
+        if not self.enabled:
+            return NULL_SPAN
+        return RecordedSpan(self, name, attributes)
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._observe(key, value)
+
+    def _observe(self, key: tuple[str, Labels], value: float) -> None:
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = [
+                [0] * (len(HISTOGRAM_BUCKETS) + 1),
+                0.0,
+                0,
+                value,
+            ]
+        histogram[0][bisect_left(HISTOGRAM_BUCKETS, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+        histogram[3] = max(histogram[3], value)
+
+    def _finish(self, span: RecordedSpan) -> None:
+        with self._lock:
+            if len(self._spans) < self.max_spans:
+                self._spans.append(span)
+            else:
+                self._dropped_spans += 1
+            self._observe((SPAN_HISTOGRAM, (("span", span.name),)), span.seconds)
+
+    def report(self) -> dict:
+        """Summarises spans by name, counters and histograms."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(value) for key, value in self._histograms.items()}
+            dropped_spans = self._dropped_spans
+        report = {"spans": {}, "counters": {}, "histograms": {}}
+        for (name, labels), (buckets, total, count, maximum) in histograms.items():
+            summary = {
+                "count": count,
+                "sum": round(total, 6),
+                "mean": round(total / count, 6),
+                "p50": round(_quantile(buckets, count, maximum, 0.5), 6),
+                "p99": round(_quantile(buckets, count, maximum, 0.99), 6),
+                "max": round(maximum, 6),
+            }
+            if name == SPAN_HISTOGRAM:
+                report["spans"][dict(labels)["span"]] = summary
+            else:
+                report["histograms"][_series_name(name, labels)] = summary
+        for (name, labels), value in counters.items():
+            report["counters"][_series_name(name, labels)] = value
+        if dropped_spans:
+            report["dropped_spans"] = dropped_spans
+        return report
+
+    def prometheus_text(self) -> str:
+        """Renders counters and histograms in the Prometheus text format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, list(value)) for key, value in self._histograms.items()
+            )
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{METRIC_PREFIX}{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_prometheus_labels(labels)} {value}")
+        for (name, labels), (buckets, total, count, _) in histograms:
+            metric = f"{METRIC_PREFIX}{name}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket in zip(
+                (*HISTOGRAM_BUCKETS, "+Inf"), buckets, strict=True
+            ):
+                cumulative += bucket
+                bucket_labels = _prometheus_labels((*labels, ("le", str(bound))))
+                lines.append(f"{metric}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{metric}_sum{_prometheus_labels(labels)} {total}")
+            lines.append(f"{metric}_count{_prometheus_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def otlp_spans(self) -> dict:
+        """Returns the finished spans as an OTLP JSON trace export request."""
+        with self._lock:
+            spans = list(self._spans)
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": _otlp_attributes({"service.name": SERVICE_NAME})
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": SERVICE_NAME},
+                            "spans": [_otlp_span(span) for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def write_prometheus(self, path: str) -> None:
+        _write_atomically(path, self.prometheus_text())
+
+    def write_spans(self, path: str) -> None:
+        _write_atomically(path, json.dumps(self.otlp_spans()))
+
+
+def _quantile(buckets: list[int], count: int, maximum: float, q: float) -> float:
+    """Estimates a quantile by interpolating within its bucket."""
+    rank = q * count
+    cumulative = 0
+    lower = 0.0
+    for bound, bucket in zip((*HISTOGRAM_BUCKETS, maximum), buckets, strict=True):
+        upper = min(bound, maximum)
+        if bucket and cumulative + bucket >= rank:
+            return lower + (upper - lower) * (rank - cumulative) / bucket
+        cumulative += bucket
+        lower = upper
+    return maximum
+
+
+def _series_name(name: str, labels: Labels) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{key}={value}" for key, value in labels) + "}"
+
+
+def _prometheus_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _otlp_span(span: RecordedSpan) -> dict:
+    otlp_span = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": SPAN_KIND_INTERNAL,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": _otlp_attributes(span.attributes),
+        "status": (
+            {"code": STATUS_ERROR, "message": span.error}
+            if span.error is not None
+            else {"code": STATUS_OK}
+        ),
+    }
+    if span.parent_id is not None:
+        otlp_span["parentSpanId"] = span.parent_id
+    return otlp_span
+
+
+def _otlp_attributes(attributes: dict) -> list[dict]:
+    values = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            otlp_value = {"boolValue": value}
+        elif isinstance(value, int):
+            otlp_value = {"intValue": str(value)}
+        elif isinstance(value, float):
+            otlp_value = {"doubleValue": value}
+        else:
+            otlp_value = {"stringValue": str(value)}
+        values.append({"key": key, "value": otlp_value})
+    return values
+
+
+def _write_atomically(path: str, content: str) -> None:
+    # Scrapers such as the node exporter textfile collector must never read
+    # a partly written file.
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as f:
+        f.write(content)
+    os.replace(temporary_path, path)
@@ -1,21 +1,70 @@
-from openai import OpenAI
+from __future__ import annotations
 
-from codemine.application.use_cases.embed_git_repo import EmbedGitRepoUseCase
-from codemine.application.use_cases.search_chunks import SearchChunksUseCase
-from codemine.domain.ports.git_client import GitClient
-from codemine.domain.repositories.vector_store_repo import VectorIndexRepo
-from codemine.domain.services.code_chunking_service import CodeChunkingService
-from codemine.domain.services.context_enrichment_service import ContextEnrichmentService
-from codemine.infrastructure.adapters import GithubGitClient
-from codemine.infrastructure.pinecone_vector_store import PineconeVectorStore
-from codemine.infrastructure.settings import Settings
+import threading
+from functools import cache
+from typing import TYPE_CHECKING
 
+import click
 
+# Imports are deferred to the getters so each command only imports the
+# clients it uses, which keeps CLI startup fast.
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+    from codemine.application.use_cases.embed_git_repo import EmbedGitRepoUseCase
+    from codemine.application.use_cases.embed_many_repos import EmbedManyReposUseCase
+    from codemine.application.use_cases.estimate_enrichment import (
+        EstimateEnrichmentUseCase,
+    )
+    from codemine.application.use_cases.reconcile_manifest import (
+        ReconcileManifestUseCase,
+    )
+    from codemine.application.use_cases.search_chunks import SearchChunksUseCase
+    from codemine.domain.ports.embedding_client import EmbeddingClient
+    from codemine.domain.ports.git_client import GitClient
+    from codemine.domain.ports.token_counter import TokenCounter
+    from codemine.domain.repositories.checkpoint_repo import CheckpointRepo
+    from codemine.domain.repositories.chunk_manifest_repo import ChunkManifestRepo
+    from codemine.domain.repositories.embed_state_repo import EmbedStateRepo
+    from codemine.domain.repositories.job_state_repo import JobStateRepo
+    from codemine.domain.repositories.lexical_index_repo import LexicalIndexRepo
+    from codemine.domain.repositories.vector_store_repo import VectorIndexRepo
+    from codemine.domain.services.chunk_deduplication_service import (
+        ChunkDeduplicationService,
+    )
+    from codemine.domain.services.code_chunking_service import CodeChunkingService
+    from codemine.domain.services.context_enrichment_service import (
+        ContextEnrichmentService,
+    )
+    from codemine.domain.value_objects import EnrichmentStrategy
+    from codemine.infrastructure.search_result_cache import SearchResultCache
+    from codemine.infrastructure.settings import Settings
+    from codemine.infrastructure.sqlite_enrichment_cache import SqliteEnrichmentCache
+    from codemine.infrastructure.telemetry import RecordingTelemetry
+
+
+# Clients and stores are built once per process and shared by every use case,
+# so concurrent embed runs share their connection pools and limits.
+@cache
 def get_settings() -> Settings:
+    from codemine.infrastructure.settings import Settings
+
     return Settings()
 
 
+# Shared by every client and disabled, so it records nothing, until a command
+# enables it to export telemetry.
+@cache
+def get_telemetry() -> RecordingTelemetry:
+    from codemine.infrastructure.telemetry import RecordingTelemetry
+
+    return RecordingTelemetry(enabled=False)
+
+
+@cache
 def get_openai_client() -> OpenAI:
+    from openai import OpenAI
+
     settings = get_settings()
     return OpenAI(
         base_url=settings.openai_base_url,
@@ -23,40 +72,319 @@ def get_openai_client() -> OpenAI:
     )
 
 
+def get_async_openai_client() -> AsyncOpenAI:
+    from openai import AsyncOpenAI
+
+    settings = get_settings()
+    # Retries are handled by ContextEnrichmentService with jittered backoff.
+    return AsyncOpenAI(
+        base_url=settings.openai_base_url,
+        api_key=settings.openai_api_key,
+        max_retries=0,
+    )
+
+
+@cache
 def get_git_client() -> GitClient:
+    from codemine.infrastructure.adapters import GithubGitClient
+
     settings = get_settings()
     return GithubGitClient(
         token=settings.github_token,
+        mirror_cache_dir=settings.git_mirror_cache_dir,
+        telemetry=get_telemetry(),
+    )
+
+
+@cache
+def get_embedding_openai_client() -> OpenAI:
+    from openai import OpenAI
+
+    settings = get_settings()
+    return OpenAI(
+        base_url=settings.embedding_base_url,
+        api_key=settings.embedding_api_key or settings.openai_api_key,
     )
 
 
+@cache
+def get_embedding_client() -> EmbeddingClient:
+    from codemine.infrastructure.adapters import OpenAIEmbeddingClient
+    from codemine.infrastructure.sqlite_embedding_cache import CachingEmbeddingClient
+
+    settings = get_settings()
+    if settings.embedding_model is None:
+        raise click.UsageError("EMBEDDING_MODEL is not set")
+    # The OpenAI client is only built once something is embedded, so lexical
+    # searches of a local store do not import it.
+    client = OpenAIEmbeddingClient(
+        client_factory=get_embedding_openai_client,
+        model=settings.embedding_model,
+        dimension=settings.embedding_dimension,
+        max_batch_tokens=settings.embedding_batch_tokens,
+    )
+    return CachingEmbeddingClient(client, path=settings.embedding_cache_path)
+
+
+@cache
 def get_vector_store() -> VectorIndexRepo:
     settings = get_settings()
+    if settings.vector_store_backend == "local":
+        from codemine.infrastructure.local_vector_store import LocalVectorStore
+
+        # Without a model there is nothing to embed the local store's vectors
+        # and queries with.
+        if settings.embedding_model is None:
+            raise click.UsageError(
+                "EMBEDDING_MODEL must be set when VECTOR_STORE_BACKEND is local"
+            )
+
+        return LocalVectorStore(
+            index_name="code-chunks",
+            settings=settings,
+            embedding_client=get_embedding_client(),
+            use_ivf_index=settings.local_vector_index == "ivf",
+            ivf_n_lists=settings.ivf_n_lists,
+            ivf_nprobe=settings.ivf_nprobe,
+        )
+    from codemine.infrastructure.pinecone_vector_store import PineconeVectorStore
+
     return PineconeVectorStore(
         index_name="code-chunks",
         settings=settings,
+        max_in_flight_upserts=settings.pinecone_upsert_concurrency,
+        # Without an embedding model Pinecone embeds records itself.
+        embedding_client=(
+            get_embedding_client() if settings.embedding_model is not None else None
+        ),
+        telemetry=get_telemetry(),
+    )
+
+
+@cache
+def get_embed_state_repo() -> EmbedStateRepo:
+    from codemine.infrastructure.sqlite_embed_state_repo import SqliteEmbedStateRepo
+
+    settings = get_settings()
+    return SqliteEmbedStateRepo(path=settings.embed_state_path)
+
+
+@cache
+def get_chunk_manifest_repo() -> ChunkManifestRepo:
+    from codemine.infrastructure.sqlite_chunk_manifest_repo import (
+        SqliteChunkManifestRepo,
     )
 
+    settings = get_settings()
+    return SqliteChunkManifestRepo(path=settings.chunk_manifest_path)
+
 
+@cache
 def get_code_chunking_service() -> CodeChunkingService:
-    return CodeChunkingService()
+    from codemine.domain.services.code_chunking_service import CodeChunkingService
+    from codemine.domain.services.file_discovery_service import (
+        FileDiscoveryService,
+    )
+
+    settings = get_settings()
+    return CodeChunkingService(
+        file_discovery=FileDiscoveryService(
+            source=settings.file_discovery_source,
+            max_file_bytes=settings.max_file_bytes,
+            telemetry=get_telemetry(),
+        ),
+        telemetry=get_telemetry(),
+    )
+
+
+@cache
+def get_chunk_deduplication_service() -> ChunkDeduplicationService:
+    from codemine.domain.services.chunk_deduplication_service import (
+        ChunkDeduplicationService,
+    )
+
+    settings = get_settings()
+    return ChunkDeduplicationService(
+        near_duplicate_threshold=settings.deduplication_near_threshold,
+        max_shared_contexts=settings.deduplication_max_shared_contexts,
+        token_counter=get_token_counter(),
+        telemetry=get_telemetry(),
+    )
+
+
+@cache
+def get_enrichment_cache() -> SqliteEnrichmentCache:
+    from codemine.infrastructure.sqlite_enrichment_cache import SqliteEnrichmentCache
+
+    settings = get_settings()
+    return SqliteEnrichmentCache(
+        path=settings.enrichment_cache_path,
+        max_size_bytes=settings.enrichment_cache_max_bytes,
+    )
+
+
+@cache
+def get_search_cache() -> SearchResultCache:
+    from codemine.infrastructure.search_result_cache import SearchResultCache
+
+    settings = get_settings()
+    return SearchResultCache(
+        max_entries=settings.search_cache_entries,
+        ttl_seconds=settings.search_cache_ttl_seconds,
+        path=settings.search_cache_path or None,
+    )
+
+
+@cache
+def get_lexical_index() -> LexicalIndexRepo | None:
+    import os
+
+    from codemine.infrastructure.bm25_index import Bm25Index
+
+    settings = get_settings()
+    if not settings.lexical_index_dir:
+        return None
+    return Bm25Index(os.path.join(settings.lexical_index_dir, "code-chunks"))
+
+
+@cache
+def get_checkpoint_repo() -> CheckpointRepo:
+    from codemine.infrastructure.sqlite_checkpoint_repo import SqliteCheckpointRepo
+
+    settings = get_settings()
+    return SqliteCheckpointRepo(path=settings.checkpoint_path)
+
+
+@cache
+def get_job_state_repo() -> JobStateRepo:
+    from codemine.infrastructure.sqlite_job_state_repo import SqliteJobStateRepo
+
+    settings = get_settings()
+    return SqliteJobStateRepo(path=settings.job_state_path)
+
+
+@cache
+def get_token_counter() -> TokenCounter:
+    from codemine.domain.ports.token_counter import HeuristicTokenCounter
+    from codemine.infrastructure.adapters import TiktokenTokenCounter
 
+    try:
+        return TiktokenTokenCounter()
+    except ImportError:
+        return HeuristicTokenCounter()
 
-def get_context_enrichment_service() -> ContextEnrichmentService:
-    return ContextEnrichmentService()
 
+def get_context_enrichment_service(
+    use_cache: bool = True,
+    max_concurrent_requests: int | None = None,
+    strategy: EnrichmentStrategy | None = None,
+) -> ContextEnrichmentService:
+    from codemine.domain.services.context_enrichment_service import (
+        ContextEnrichmentService,
+    )
+
+    settings = get_settings()
+    return ContextEnrichmentService(
+        cache=get_enrichment_cache() if use_cache else None,
+        request_limiter=(
+            threading.BoundedSemaphore(max_concurrent_requests)
+            if max_concurrent_requests is not None
+            else None
+        ),
+        strategy=strategy or settings.enrichment_strategy,
+        group_token_budget=settings.enrichment_group_token_budget,
+        max_document_tokens=settings.enrichment_max_document_tokens,
+        token_counter=get_token_counter(),
+        telemetry=get_telemetry(),
+    )
+
+
+def get_embed_git_repo_use_case(
+    use_enrichment_cache: bool = True,
+    max_concurrent_clones: int | None = None,
+    max_concurrent_enrichments: int | None = None,
+    enrichment_strategy: EnrichmentStrategy | None = None,
+) -> EmbedGitRepoUseCase:
+    from codemine.application.use_cases.embed_git_repo import EmbedGitRepoUseCase
 
-def get_embed_git_repo_use_case() -> EmbedGitRepoUseCase:
     return EmbedGitRepoUseCase(
         git_client=get_git_client(),
         code_chunking_service=get_code_chunking_service(),
-        context_enrichment_service=get_context_enrichment_service(),
+        context_enrichment_service=get_context_enrichment_service(
+            use_cache=use_enrichment_cache,
+            max_concurrent_requests=max_concurrent_enrichments,
+            strategy=enrichment_strategy,
+        ),
         vector_store=get_vector_store(),
         openai_client=get_openai_client(),
+        async_openai_client=get_async_openai_client(),
+        embed_state_repo=get_embed_state_repo(),
+        chunk_manifest_repo=get_chunk_manifest_repo(),
+        checkpoint_repo=get_checkpoint_repo(),
+        search_cache=get_search_cache(),
+        lexical_index=get_lexical_index(),
+        telemetry=get_telemetry(),
+        chunk_deduplication_service=get_chunk_deduplication_service(),
+        clone_limiter=(
+            threading.BoundedSemaphore(max_concurrent_clones)
+            if max_concurrent_clones is not None
+            else None
+        ),
+    )
+
+
+def get_embed_many_repos_use_case(
+    use_enrichment_cache: bool = True,
+    max_concurrent_clones: int | None = None,
+    max_concurrent_enrichments: int | None = None,
+    enrichment_strategy: EnrichmentStrategy | None = None,
+) -> EmbedManyReposUseCase:
+    from codemine.application.use_cases.embed_many_repos import EmbedManyReposUseCase
+
+    return EmbedManyReposUseCase(
+        embed_git_repo_use_case=get_embed_git_repo_use_case(
+            use_enrichment_cache=use_enrichment_cache,
+            max_concurrent_clones=max_concurrent_clones,
+            max_concurrent_enrichments=max_concurrent_enrichments,
+            enrichment_strategy=enrichment_strategy,
+        ),
+        job_state_repo=get_job_state_repo(),
+        git_client=get_git_client(),
+        embed_state_repo=get_embed_state_repo(),
+    )
+
+
+def get_estimate_enrichment_use_case() -> EstimateEnrichmentUseCase:
+    from codemine.application.use_cases.estimate_enrichment import (
+        EstimateEnrichmentUseCase,
     )
 
+    settings = get_settings()
+    return EstimateEnrichmentUseCase(
+        git_client=get_git_client(),
+        code_chunking_service=get_code_chunking_service(),
+        context_enrichment_service=get_context_enrichment_service(use_cache=False),
+        input_cost_per_million=settings.enrichment_input_cost_per_million,
+        output_cost_per_million=settings.enrichment_output_cost_per_million,
+    )
+
+
+def get_search_chunks_use_case(use_cache: bool = True) -> SearchChunksUseCase:
+    from codemine.application.use_cases.search_chunks import SearchChunksUseCase
 
-def get_search_chunks_use_case() -> SearchChunksUseCase:
     return SearchChunksUseCase(
         vector_store=get_vector_store(),
+        search_cache=get_search_cache() if use_cache else None,
+        lexical_index=get_lexical_index(),
+    )
+
+
+def get_reconcile_manifest_use_case() -> ReconcileManifestUseCase:
+    from codemine.application.use_cases.reconcile_manifest import (
+        ReconcileManifestUseCase,
+    )
+
+    return ReconcileManifestUseCase(
+        vector_store=get_vector_store(),
+        chunk_manifest_repo=get_chunk_manifest_repo(),
     )
@@ -1,35 +1,118 @@
+import contextlib
 import logging
+import os
+from typing import TYPE_CHECKING
 
 import click
-import structlog
-from rich.console import Console
 
-from codemine.application.commands import ProcessRepoCommand
-from codemine.application.queries import SearchEmbeddingsQuery
-from codemine.presentation.cli.containers import (
-    get_embed_git_repo_use_case,
-    get_search_chunks_use_case,
-)
+if TYPE_CHECKING:
+    from codemine.domain.value_objects import RepositoryRef, SearchFilter
 
-structlog.configure(
-    wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING)
-)
-logger = structlog.get_logger()
+# Commands import their dependencies when they run, so that `--help` and
+# commands that only need a few clients start quickly.
 
 
 @click.group()
-def cli(): ...
+def cli():
+    import structlog
+
+    structlog.configure(
+        wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING)
+    )
 
 
 @cli.command()
 @click.option("--repo-owner", type=str, required=True)
 @click.option("--repo-name", type=str, required=True)
 @click.option("--remove-outdated-chunks", is_flag=True, default=False)
+@click.option("--outdated-chunks-dry-run", is_flag=True, default=False)
 @click.option("--ignore-glob", type=str, multiple=True, default=[])
 @click.option("--create-index", is_flag=True, default=False)
+@click.option(
+    "--async-enrichment",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--enrichment-concurrency",
+    type=click.IntRange(min=1),
+    default=16,
+)
+@click.option(
+    "--enrichment-timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    default=60.0,
+)
+@click.option("--no-enrichment-cache", is_flag=True, default=False)
+@click.option("--incremental", is_flag=True, default=False)
+@click.option(
+    "--clone-strategy",
+    type=click.Choice(["full", "shallow", "partial", "mirror"]),
+    default="full",
+)
+@click.option("--chunking-workers", type=click.IntRange(min=1), default=1)
+@click.option("--resume", is_flag=True, default=False)
+@click.option(
+    "--enrichment-strategy",
+    type=click.Choice(["chunk", "document"]),
+    default=None,
+    help="Defaults to the enrichment_strategy setting.",
+)
+@click.option(
+    "--deduplication",
+    type=click.Choice(["off", "exact", "near"]),
+    default="off",
+    help="Enrich repeated chunks once; near also reuses contexts of almost "
+    "identical chunks. Copies are still upserted, and embedded again by "
+    "Pinecone's integrated inference.",
+)
+@click.option(
+    "--stats",
+    "print_stats",
+    is_flag=True,
+    default=False,
+    help="Print span timings, counters and histograms as JSON.",
+)
+@click.option(
+    "--metrics-file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write metrics to this file in the Prometheus text format.",
+)
+@click.option(
+    "--trace-file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write spans to this file as OpenTelemetry (OTLP) JSON.",
+)
 def embed_repo(
-    repo_owner, repo_name, remove_outdated_chunks, create_index, ignore_glob
+    repo_owner,
+    repo_name,
+    remove_outdated_chunks,
+    outdated_chunks_dry_run,
+    create_index,
+    ignore_glob,
+    async_enrichment,
+    enrichment_concurrency,
+    enrichment_timeout,
+    no_enrichment_cache,
+    incremental,
+    clone_strategy,
+    chunking_workers,
+    resume,
+    enrichment_strategy,
+    deduplication,
+    print_stats,
+    metrics_file,
+    trace_file,
 ):
+    import structlog
+    from rich.console import Console
+
+    from codemine.application.commands import ProcessRepoCommand
+    from codemine.presentation.cli.containers import get_embed_git_repo_use_case
+
+    logger = structlog.get_logger()
     logger.info(
         "Embedding repository",
         repo_owner=repo_owner,
@@ -37,35 +120,754 @@ def embed_repo(
         remove_outdated_chunks=remove_outdated_chunks,
         create_index=create_index,
         ignore_glob=ignore_glob,
+        async_enrichment=async_enrichment,
+        incremental=incremental,
+        clone_strategy=clone_strategy,
+        enrichment_strategy=enrichment_strategy,
+        deduplication=deduplication,
+    )
+    use_case = get_embed_git_repo_use_case(
+        use_enrichment_cache=not no_enrichment_cache,
+        enrichment_strategy=enrichment_strategy,
     )
-    use_case = get_embed_git_repo_use_case()
     console = Console()
-    with console.status("Embedding repository...", spinner="squareCorners"):
+    with (
+        _exported_telemetry(print_stats, metrics_file, trace_file),
+        console.status("Embedding repository...", spinner="squareCorners"),
+    ):
         results = use_case.execute(
             ProcessRepoCommand(
                 repo_owner=repo_owner,
                 repo_name=repo_name,
                 remove_outdated_chunks=remove_outdated_chunks,
+                outdated_chunks_dry_run=outdated_chunks_dry_run,
                 create_index=create_index,
                 ignore_globs=ignore_glob,
+                async_enrichment=async_enrichment,
+                enrichment_concurrency=enrichment_concurrency,
+                enrichment_timeout=enrichment_timeout,
+                incremental=incremental,
+                clone_strategy=clone_strategy,
+                chunking_workers=chunking_workers,
+                resume=resume,
+                deduplication=deduplication,
             )
         )
         console.print(f"Repository {repo_owner}/{repo_name} embedded successfully")
+        if "resumed_files" in results:
+            console.print(f"Resumed files: {results['resumed_files']}")
         console.print(f"Total chunks: {results['total_chunks']}")
         console.print(f"Chunked files: {results['chunked_files']}")
+        if "removed_files" in results:
+            console.print(f"Removed files: {results['removed_files']}")
+        for file_path in results.get("failed_removals", []):
+            console.print(f"Could not remove the vectors of {file_path}")
+        if "dedup_ratio" in results:
+            console.print(
+                "Deduplicated chunks: "
+                f"{results['duplicate_chunks']} duplicates, "
+                f"{results['near_duplicate_chunks']} near duplicates "
+                f"({results['dedup_ratio']:.1%} of chunks, "
+                f"about {results['dedup_saved_tokens']} tokens not enriched)"
+            )
+        if "skipped_chunks" in results:
+            console.print(f"Unchanged chunks skipped: {results['skipped_chunks']}")
+        if "outdated_vectors" in results:
+            verb = "Would remove" if results["outdated_dry_run"] else "Removed"
+            console.print(
+                f"{verb} {results['outdated_vectors']} outdated chunks "
+                f"from {results['outdated_files']} files"
+            )
         console.print(f"Index name: {results['index_name']}")
+        if "enrichment_cache_hits" in results:
+            console.print(
+                "Enrichment cache: "
+                f"{results['enrichment_cache_hits']} hits, "
+                f"{results['enrichment_cache_misses']} misses"
+            )
+        if "failed_removals" in results:
+            raise SystemExit(1)
+
+
+@cli.command()
+@click.option("--repos-file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--org", type=str, multiple=True, default=[])
+@click.option("--batch-name", type=str, default=None)
+@click.option("--restart", is_flag=True, default=False)
+@click.option(
+    "--priority",
+    type=click.Choice(["none", "size", "stale"]),
+    default="none",
+)
+@click.option("--max-parallel-repos", type=click.IntRange(min=1), default=4)
+@click.option("--max-concurrent-clones", type=click.IntRange(min=1), default=2)
+@click.option("--max-concurrent-enrichments", type=click.IntRange(min=1), default=32)
+@click.option("--remove-outdated-chunks", is_flag=True, default=False)
+@click.option("--outdated-chunks-dry-run", is_flag=True, default=False)
+@click.option("--ignore-glob", type=str, multiple=True, default=[])
+@click.option("--create-index", is_flag=True, default=False)
+@click.option("--async-enrichment", is_flag=True, default=False)
+@click.option(
+    "--enrichment-concurrency",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Enrichment requests in flight per repository. Defaults to "
+    "--max-concurrent-enrichments.",
+)
+@click.option(
+    "--enrichment-timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    default=60.0,
+)
+@click.option("--no-enrichment-cache", is_flag=True, default=False)
+@click.option("--incremental", is_flag=True, default=False)
+@click.option(
+    "--clone-strategy",
+    type=click.Choice(["full", "shallow", "partial", "mirror"]),
+    default="full",
+)
+@click.option("--chunking-workers", type=click.IntRange(min=1), default=1)
+@click.option(
+    "--enrichment-strategy",
+    type=click.Choice(["chunk", "document"]),
+    default=None,
+    help="Defaults to the enrichment_strategy setting.",
+)
+@click.option(
+    "--deduplication",
+    type=click.Choice(["off", "exact", "near"]),
+    default="off",
+    help="Enrich repeated chunks once; near also reuses contexts of almost "
+    "identical chunks. Copies are still upserted, and embedded again by "
+    "Pinecone's integrated inference.",
+)
+@click.option(
+    "--stats",
+    "print_stats",
+    is_flag=True,
+    default=False,
+    help="Print span timings, counters and histograms as JSON.",
+)
+@click.option(
+    "--metrics-file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write metrics to this file in the Prometheus text format.",
+)
+@click.option(
+    "--trace-file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write spans to this file as OpenTelemetry (OTLP) JSON.",
+)
+def embed_many(
+    repos_file,
+    org,
+    batch_name,
+    restart,
+    priority,
+    max_parallel_repos,
+    max_concurrent_clones,
+    max_concurrent_enrichments,
+    remove_outdated_chunks,
+    outdated_chunks_dry_run,
+    ignore_glob,
+    create_index,
+    async_enrichment,
+    enrichment_concurrency,
+    enrichment_timeout,
+    no_enrichment_cache,
+    incremental,
+    clone_strategy,
+    chunking_workers,
+    enrichment_strategy,
+    deduplication,
+    print_stats,
+    metrics_file,
+    trace_file,
+):
+    """
+    Embeds every repository listed in --repos-file (one owner/name per line)
+    and every repository of each --org. Rerunning the same batch resumes it.
+    """
+    from rich.console import Console
+    from rich.table import Table
+
+    from codemine.application.commands import EmbedManyReposCommand
+    from codemine.presentation.cli.containers import (
+        get_embed_many_repos_use_case,
+        get_git_client,
+    )
+
+    if repos_file is None and not org:
+        raise click.UsageError("Pass --repos-file or at least one --org")
+    repositories = []
+    if repos_file is not None:
+        repositories.extend(_read_repos_file(repos_file))
+    for owner in org:
+        repositories.extend(get_git_client().list_repositories(owner))
+    repositories = list(
+        {repository.full_name: repository for repository in repositories}.values()
+    )
+    if batch_name is None:
+        sources = [os.path.abspath(repos_file)] if repos_file else []
+        batch_name = ",".join(sources + [f"org:{owner}" for owner in org])
+    use_case = get_embed_many_repos_use_case(
+        use_enrichment_cache=not no_enrichment_cache,
+        max_concurrent_clones=max_concurrent_clones,
+        max_concurrent_enrichments=max_concurrent_enrichments,
+        enrichment_strategy=enrichment_strategy,
+    )
+    console = Console()
+    with (
+        _exported_telemetry(print_stats, metrics_file, trace_file),
+        console.status(
+            f"Embedding {len(repositories)} repositories...", spinner="squareCorners"
+        ),
+    ):
+        jobs = use_case.execute(
+            EmbedManyReposCommand(
+                batch_name=batch_name,
+                repositories=repositories,
+                priority=priority,
+                max_parallel_repos=max_parallel_repos,
+                restart=restart,
+                create_index=create_index,
+                embed_options={
+                    "remove_outdated_chunks": remove_outdated_chunks,
+                    "outdated_chunks_dry_run": outdated_chunks_dry_run,
+                    "ignore_globs": ignore_glob,
+                    "async_enrichment": async_enrichment,
+                    "enrichment_concurrency": (
+                        enrichment_concurrency or max_concurrent_enrichments
+                    ),
+                    "enrichment_timeout": enrichment_timeout,
+                    "incremental": incremental,
+                    "clone_strategy": clone_strategy,
+                    "chunking_workers": chunking_workers,
+                    "deduplication": deduplication,
+                },
+            )
+        )
+    table = Table(title=f"Batch {batch_name}")
+    for column in ("Repository", "Status", "Files", "Chunks", "Seconds", "Chunks/s"):
+        table.add_column(column)
+    for job in jobs:
+        throughput = job.total_chunks / job.seconds if job.seconds else 0.0
+        table.add_row(
+            job.repository.full_name,
+            job.status if job.error is None else f"{job.status}: {job.error}",
+            str(job.chunked_files),
+            str(job.total_chunks),
+            f"{job.seconds:.1f}",
+            f"{throughput:.1f}",
+        )
+    console.print(table)
+    failed = sum(job.status == "failed" for job in jobs)
+    console.print(
+        f"{len(jobs) - failed} of {len(jobs)} repositories embedded, {failed} failed"
+    )
+    if failed:
+        raise SystemExit(1)
+
+
+@contextlib.contextmanager
+def _exported_telemetry(
+    print_stats: bool, metrics_file: str | None, trace_file: str | None
+):
+    """
+    Records telemetry while the block runs if any export was asked for, and
+    exports it when the block exits, even if it failed.
+    """
+    if not (print_stats or metrics_file or trace_file):
+        yield
+        return
+    import json
+
+    from codemine.presentation.cli.containers import get_telemetry
+
+    telemetry = get_telemetry()
+    telemetry.enabled = True
+    try:
+        yield
+    finally:
+        if metrics_file is not None:
+            telemetry.write_prometheus(metrics_file)
+        if trace_file is not None:
+            telemetry.write_spans(trace_file)
+        if print_stats:
+            click.echo(json.dumps(telemetry.report(), indent=2))
+
+
+def _read_repos_file(path: str) -> list["RepositoryRef"]:
+    from codemine.domain.value_objects import RepositoryRef
+
+    repositories = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            owner, _, name = line.partition("/")
+            if not owner or not name:
+                raise click.BadParameter(
+                    f"Expected owner/name, got {line!r}", param_hint="--repos-file"
+                )
+            repositories.append(RepositoryRef(owner=owner, name=name))
+    return repositories
+
+
+@cli.command()
+@click.option("--repo-owner", type=str, required=True)
+@click.option("--repo-name", type=str, required=True)
+@click.option("--ignore-glob", type=str, multiple=True, default=[])
+@click.option(
+    "--clone-strategy",
+    type=click.Choice(["full", "shallow", "partial", "mirror"]),
+    default="shallow",
+)
+def estimate_enrichment(repo_owner, repo_name, ignore_glob, clone_strategy):
+    """
+    Estimates the LLM requests, tokens and cost of enriching a repository
+    with each enrichment strategy, without calling the LLM.
+    """
+    from rich.console import Console
+    from rich.table import Table
+
+    from codemine.application.commands import EstimateEnrichmentCommand
+    from codemine.presentation.cli.containers import get_estimate_enrichment_use_case
+
+    console = Console()
+    with console.status("Estimating enrichment...", spinner="arc"):
+        use_case = get_estimate_enrichment_use_case()
+        results = use_case.execute(
+            EstimateEnrichmentCommand(
+                repo_owner=repo_owner,
+                repo_name=repo_name,
+                ignore_globs=ignore_glob,
+                clone_strategy=clone_strategy,
+            )
+        )
+    table = Table(
+        title=f"{repo_owner}/{repo_name}: "
+        f"{results['documents']} files, {results['chunks']} chunks"
+    )
+    for column in ("Strategy", "Requests", "Input tokens", "Output tokens", "Cost"):
+        table.add_column(column)
+    for strategy, estimate in results["strategies"].items():
+        table.add_row(
+            strategy,
+            str(estimate["requests"]),
+            str(estimate["input_tokens"]),
+            str(estimate["output_tokens"]),
+            f"${estimate['cost']:.4f}",
+        )
+    console.print(table)
 
 
 @cli.command()
 @click.option("--query", type=str, required=True)
-def search_chunks(query):
+@click.option("--top-k", type=click.IntRange(min=1), default=10)
+@click.option("--repo-owner", type=str, default=None)
+@click.option("--repo-name", type=str, default=None)
+@click.option(
+    "--path-prefix",
+    type=str,
+    default=None,
+    help="Only search files under this directory.",
+)
+@click.option(
+    "--file-type",
+    type=str,
+    multiple=True,
+    help="Only search files with this extension, e.g. py (can be repeated).",
+)
+@click.option(
+    "--mode",
+    "search_mode",
+    type=click.Choice(["vector", "lexical", "hybrid"]),
+    default="hybrid",
+    help="hybrid fuses vector and keyword (BM25) results.",
+)
+@click.option("--no-search-cache", is_flag=True, default=False)
+@click.option(
+    "--server",
+    type=str,
+    default=None,
+    help="Search through a running `codemine serve`, e.g. http://127.0.0.1:8765 "
+    "or unix:///tmp/codemine.sock.",
+)
+def search_chunks(
+    query,
+    top_k,
+    repo_owner,
+    repo_name,
+    path_prefix,
+    file_type,
+    search_mode,
+    no_search_cache,
+    server,
+):
+    from rich.console import Console
+
+    from codemine.application.queries import SearchEmbeddingsQuery
+    from codemine.presentation.cli.containers import get_search_chunks_use_case
+    from codemine.presentation.server.search_client import SearchClient
+
+    search_filter = _search_filter(repo_owner, repo_name, path_prefix, file_type)
     console = Console()
+    if server is not None:
+        client = SearchClient(server)
+        for result in client.search(
+            query, top_k=top_k, search_filter=search_filter, search_mode=search_mode
+        ):
+            console.print(f"Found chunk: {result.id}")
+        client.close()
+        return
     with console.status("Searching for chunks...", spinner="arc"):
-        use_case = get_search_chunks_use_case()
+        use_case = get_search_chunks_use_case(use_cache=not no_search_cache)
         results = use_case.execute(
             SearchEmbeddingsQuery(
                 query=query,
+                top_k=top_k,
+                search_filter=search_filter,
+                search_mode=search_mode,
             )
         )
         for result in results:
             console.print(f"Found chunk: {result.id}")
+
+
+@cli.command()
+@click.option(
+    "--queries-file",
+    type=click.File("r"),
+    required=True,
+    help="File with one query per line, or - for standard input.",
+)
+@click.option("--top-k", type=click.IntRange(min=1), default=10)
+@click.option("--repo-owner", type=str, default=None)
+@click.option("--repo-name", type=str, default=None)
+@click.option("--path-prefix", type=str, default=None)
+@click.option("--file-type", type=str, multiple=True)
+@click.option(
+    "--mode",
+    "search_mode",
+    type=click.Choice(["vector", "lexical", "hybrid"]),
+    default="hybrid",
+    help="hybrid fuses vector and keyword (BM25) results.",
+)
+@click.option("--concurrency", type=click.IntRange(min=1), default=8)
+@click.option("--no-search-cache", is_flag=True, default=False)
+def search_batch(
+    queries_file,
+    top_k,
+    repo_owner,
+    repo_name,
+    path_prefix,
+    file_type,
+    search_mode,
+    concurrency,
+    no_search_cache,
+):
+    """
+    Searches every query of a file and writes one JSON line per query, in
+    order, as soon as its results are ready.
+    """
+    import json
+
+    from codemine.application.queries import BatchSearchEmbeddingsQuery
+    from codemine.presentation.cli.containers import get_search_chunks_use_case
+
+    queries = [line.strip() for line in queries_file if line.strip()]
+    use_case = get_search_chunks_use_case(use_cache=not no_search_cache)
+    results = use_case.execute_batch(
+        BatchSearchEmbeddingsQuery(
+            queries=queries,
+            top_k=top_k,
+            search_filter=_search_filter(repo_owner, repo_name, path_prefix, file_type),
+            search_mode=search_mode,
+            max_concurrency=concurrency,
+        )
+    )
+    for query, records in zip(queries, results, strict=True):
+        click.echo(
+            json.dumps(
+                {"query": query, "results": [record.model_dump() for record in records]}
+            )
+        )
+
+
+@cli.command()
+@click.option("--query", type=str, multiple=True, required=True)
+@click.option("--queries", "query_count", type=click.IntRange(min=1), default=1000)
+@click.option("--top-k", type=click.IntRange(min=1), default=10)
+@click.option("--repo-owner", type=str, default=None)
+@click.option("--repo-name", type=str, default=None)
+@click.option("--path-prefix", type=str, default=None)
+@click.option("--file-type", type=str, multiple=True)
+@click.option("--concurrency", type=click.IntRange(min=1), default=8)
+def bench_search(
+    query,
+    query_count,
+    top_k,
+    repo_owner,
+    repo_name,
+    path_prefix,
+    file_type,
+    concurrency,
+):
+    """
+    Measures the queries per second of the configured vector store, searching
+    one query at a time and in batch. The search cache is not used.
+    """
+    from rich.console import Console
+
+    from codemine.presentation.cli.containers import get_vector_store
+    from codemine.presentation.cli.search_benchmark import run_search_benchmark
+
+    results = run_search_benchmark(
+        get_vector_store(),
+        list(query),
+        query_count=query_count,
+        top_k=top_k,
+        search_filter=_search_filter(repo_owner, repo_name, path_prefix, file_type),
+        max_concurrency=concurrency,
+    )
+    console = Console()
+    for name, value in results.items():
+        console.print(
+            f"{name}: {value:.2f}" if isinstance(value, float) else f"{name}: {value}"
+        )
+
+
+@cli.command()
+@click.option("--samples", type=click.IntRange(min=1), default=200)
+@click.option("--top-k", type=click.IntRange(min=1), default=10)
+@click.option("--seed", type=int, default=0)
+def bench_retrieval(samples, top_k, seed):
+    """
+    Measures the latency and recall@k of vector, lexical and hybrid search
+    for identifiers sampled from the lexical index.
+    """
+    from rich.console import Console
+    from rich.table import Table
+
+    from codemine.presentation.cli.containers import (
+        get_lexical_index,
+        get_search_chunks_use_case,
+    )
+    from codemine.presentation.cli.search_benchmark import run_retrieval_benchmark
+
+    lexical_index = get_lexical_index()
+    if lexical_index is None:
+        raise click.UsageError("LEXICAL_INDEX_DIR is not set")
+    results = run_retrieval_benchmark(
+        get_search_chunks_use_case(use_cache=False),
+        lexical_index,
+        samples=samples,
+        top_k=top_k,
+        seed=seed,
+    )
+    table = Table(title=f"{results.pop('queries')} identifier queries")
+    for column in ("Mode", "p50 ms", "p99 ms", f"Recall@{top_k}"):
+        table.add_column(column)
+    for mode, result in results.items():
+        table.add_row(
+            mode,
+            f"{result['p50_ms']:.2f}",
+            f"{result['p99_ms']:.2f}",
+            f"{result[f'recall_at_{top_k}']:.2%}",
+        )
+    Console().print(table)
+
+
+def _search_filter(
+    repo_owner: str | None,
+    repo_name: str | None,
+    path_prefix: str | None,
+    file_types: tuple[str, ...],
+) -> "SearchFilter | None":
+    from codemine.domain.value_objects import SearchFilter
+
+    search_filter = SearchFilter(
+        repo_owner=repo_owner,
+        repo_name=repo_name,
+        path_prefix=path_prefix,
+        file_types=[file_type.lstrip(".") for file_type in file_types],
+    )
+    return None if search_filter.is_empty else search_filter
+
+
+@cli.command()
+@click.option("--host", type=str, default="127.0.0.1")
+@click.option("--port", type=click.IntRange(min=0), default=8765)
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Listen on a Unix socket instead of --host and --port.",
+)
+@click.option("--workers", type=click.IntRange(min=1), default=16)
+@click.option("--no-search-cache", is_flag=True, default=False)
+def serve(host, port, socket_path, workers, no_search_cache):
+    """
+    Serves searches over HTTP, keeping the vector store and embedding clients
+    warm between queries. Use `search-chunks --server` as a client.
+    """
+    import asyncio
+
+    from codemine.presentation.cli.containers import get_search_chunks_use_case
+    from codemine.presentation.server.search_server import SearchServer
+
+    server = SearchServer(
+        get_search_chunks_use_case(use_cache=not no_search_cache),
+        max_workers=workers,
+    )
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(server.serve(host=host, port=port, socket_path=socket_path))
+
+
+@cli.command()
+@click.option("--server", type=str, required=True)
+@click.option("--query", type=str, multiple=True, required=True)
+@click.option("--requests", type=click.IntRange(min=1), default=500)
+@click.option("--concurrency", type=click.IntRange(min=1), default=16)
+@click.option("--top-k", type=click.IntRange(min=1), default=10)
+def bench_server(server, query, requests, concurrency, top_k):
+    """Measures search latency of a running server under concurrent load."""
+    from rich.console import Console
+
+    from codemine.presentation.server.load_test import run_load_test
+
+    results = run_load_test(
+        server, list(query), requests=requests, concurrency=concurrency, top_k=top_k
+    )
+    console = Console()
+    for name, value in results.items():
+        console.print(
+            f"{name}: {value:.2f}" if isinstance(value, float) else f"{name}: {value}"
+        )
+
+
+@cli.command()
+@click.option("--repo-owner", type=str, required=True)
+@click.option("--repo-name", type=str, required=True)
+def reconcile(repo_owner, repo_name):
+    from rich.console import Console
+
+    from codemine.application.commands import ReconcileManifestCommand
+    from codemine.presentation.cli.containers import get_reconcile_manifest_use_case
+
+    console = Console()
+    with console.status("Reconciling chunk manifest...", spinner="arc"):
+        use_case = get_reconcile_manifest_use_case()
+        results = use_case.execute(
+            ReconcileManifestCommand(repo_owner=repo_owner, repo_name=repo_name)
+        )
+    console.print(f"Chunks in vector store: {results['stored_chunks']}")
+    console.print(f"Manifest entries removed: {results['removed_entries']}")
+    console.print(f"Manifest entries added: {results['added_entries']}")
+
+
+@cli.group()
+def lexical_index(): ...
+
+
+@lexical_index.command("stats")
+def lexical_index_stats():
+    from rich.console import Console
+
+    from codemine.presentation.cli.containers import get_lexical_index
+
+    index = get_lexical_index()
+    if index is None:
+        raise click.UsageError("LEXICAL_INDEX_DIR is not set")
+    console = Console()
+    for name, value in index.stats().items():
+        console.print(f"{name}: {value}")
+    index.close()
+
+
+@cli.group()
+def enrichment_cache(): ...
+
+
+@enrichment_cache.command("stats")
+def enrichment_cache_stats():
+    from rich.console import Console
+
+    from codemine.presentation.cli.containers import get_enrichment_cache
+
+    console = Console()
+    cache = get_enrichment_cache()
+    for name, value in cache.stats().items():
+        console.print(f"{name}: {value}")
+    cache.close()
+
+
+@enrichment_cache.command("prune")
+@click.option("--max-size-mb", type=click.IntRange(min=0), default=None)
+@click.option("--older-than-days", type=click.FloatRange(min=0), default=None)
+def enrichment_cache_prune(max_size_mb, older_than_days):
+    from rich.console import Console
+
+    from codemine.presentation.cli.containers import get_enrichment_cache
+
+    console = Console()
+    max_size_bytes = None
+    if max_size_mb is not None:
+        max_size_bytes = max_size_mb * 1024 * 1024
+    older_than_seconds = None
+    if older_than_days is not None:
+        older_than_seconds = older_than_days * 24 * 60 * 60
+    cache = get_enrichment_cache()
+    removed = cache.prune(
+        max_size_bytes=max_size_bytes, older_than_seconds=older_than_seconds
+    )
+    console.print(f"Removed {removed} cache entries")
+    cache.close()
+
+
+@enrichment_cache.command("clear")
+def enrichment_cache_clear():
+    from rich.console import Console
+
+    from codemine.presentation.cli.containers import get_enrichment_cache
+
+    console = Console()
+    cache = get_enrichment_cache()
+    cache.clear()
+    console.print("Enrichment cache cleared")
+    cache.close()
+
+
+@cli.group()
+def search_cache(): ...
+
+
+@search_cache.command("stats")
+def search_cache_stats():
+    from rich.console import Console
+
+    from codemine.presentation.cli.containers import get_search_cache
+
+    console = Console()
+    cache = get_search_cache()
+    for name, value in cache.stats().items():
+        console.print(f"{name}: {value}")
+    cache.close()
+
+
+@search_cache.command("clear")
+def search_cache_clear():
+    from rich.console import Console
+
+    from codemine.presentation.cli.containers import get_search_cache
+
+    console = Console()
+    cache = get_search_cache()
+    cache.clear()
+    console.print("Search cache cleared")
+    cache.close()
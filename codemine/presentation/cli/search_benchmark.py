@@ -0,0 +1,152 @@
+import re
+import time
+from itertools import cycle, islice
+
+from codemine.application.queries import (
+    BatchSearchEmbeddingsQuery,
+    SearchEmbeddingsQuery,
+)
+from codemine.application.use_cases.search_chunks import SearchChunksUseCase
+from codemine.domain.repositories.lexical_index_repo import LexicalIndexRepo
+from codemine.domain.repositories.vector_store_repo import VectorIndexRepo
+from codemine.domain.value_objects import SearchFilter, SearchMode
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]{3,}")
+COMPOUND_PATTERN = re.compile(r"[a-z][A-Z]")
+
+
+def run_search_benchmark(
+    vector_store: VectorIndexRepo,
+    queries: list[str],
+    query_count: int,
+    top_k: int = 10,
+    search_filter: SearchFilter | None = None,
+    max_concurrency: int = 8,
+) -> dict:
+    """
+    Searches query_count queries, cycling through queries, first one at a time
+    with search_vectors and then with search_vectors_batch. Returns the
+    queries per second of each and the mean number of results.
+    """
+    vector_store.warm_up()
+    workload = list(islice(cycle(queries), query_count))
+
+    start = time.perf_counter()
+    sequential_results = sum(
+        len(vector_store.search_vectors(query, top_k, search_filter))
+        for query in workload
+    )
+    sequential_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_results = sum(
+        len(results)
+        for results in vector_store.search_vectors_batch(
+            workload, top_k, search_filter, max_concurrency
+        )
+    )
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "queries": query_count,
+        "sequential_queries_per_second": query_count / sequential_seconds,
+        "batch_queries_per_second": query_count / batch_seconds,
+        "speedup": sequential_seconds / batch_seconds,
+        "mean_sequential_results": sequential_results / query_count,
+        "mean_batch_results": batch_results / query_count,
+    }
+
+
+def run_use_case_search_benchmark(
+    search_chunks_use_case: SearchChunksUseCase,
+    queries: list[str],
+    query_count: int,
+    top_k: int = 10,
+    search_mode: SearchMode = "hybrid",
+) -> dict:
+    """
+    Searches query_count queries with search_mode, cycling through queries,
+    first one at a time with execute and then with execute_batch, so both
+    the vector and the lexical half of a search are measured. Returns the
+    queries per second of each.
+    """
+    workload = list(islice(cycle(queries), query_count))
+
+    start = time.perf_counter()
+    for query in workload:
+        search_chunks_use_case.execute(
+            SearchEmbeddingsQuery(query=query, top_k=top_k, search_mode=search_mode)
+        )
+    sequential_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in search_chunks_use_case.execute_batch(
+        BatchSearchEmbeddingsQuery(
+            queries=workload, top_k=top_k, search_mode=search_mode
+        )
+    ):
+        pass
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "queries": query_count,
+        "sequential_queries_per_second": query_count / sequential_seconds,
+        "batch_queries_per_second": query_count / batch_seconds,
+        "speedup": sequential_seconds / batch_seconds,
+    }
+
+
+def run_retrieval_benchmark(
+    search_chunks_use_case: SearchChunksUseCase,
+    lexical_index: LexicalIndexRepo,
+    samples: int,
+    top_k: int = 10,
+    seed: int = 0,
+) -> dict:
+    """
+    Known-item benchmark: samples chunks from the lexical index, searches the
+    longest identifier of each with every search mode, and reports the
+    latency percentiles in milliseconds and the fraction of searches that
+    return the sampled chunk in the top_k (recall@k).
+    """
+    known_items = []
+    for record in lexical_index.sample_records(samples, seed=seed):
+        identifier = _longest_identifier(record.unembedded_content)
+        if identifier is not None:
+            known_items.append((identifier, record.id))
+    results = {"queries": len(known_items)}
+    for mode in ("vector", "lexical", "hybrid"):
+        latencies = []
+        found = 0
+        for identifier, record_id in known_items:
+            start = time.perf_counter()
+            records = search_chunks_use_case.execute(
+                SearchEmbeddingsQuery(query=identifier, top_k=top_k, search_mode=mode)
+            )
+            latencies.append(time.perf_counter() - start)
+            found += any(record.id == record_id for record in records)
+        latencies.sort()
+        results[mode] = {
+            "p50_ms": _percentile(latencies, 0.50),
+            "p99_ms": _percentile(latencies, 0.99),
+            f"recall_at_{top_k}": found / len(known_items) if known_items else 0.0,
+        }
+    return results
+
+
+def _longest_identifier(content: str) -> str | None:
+    """Prefers snake_case and camelCase identifiers, which are rarely prose."""
+    identifiers = IDENTIFIER_PATTERN.findall(content)
+    compound = [
+        identifier
+        for identifier in identifiers
+        if "_" in identifier.strip("_") or COMPOUND_PATTERN.search(identifier)
+    ]
+    return max(compound or identifiers, key=len, default=None)
+
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    position = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[position] * 1000
@@ -0,0 +1,60 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+
+from codemine.presentation.server.search_client import SearchClient, SearchServerError
+
+
+def run_load_test(
+    url: str,
+    queries: list[str],
+    requests: int,
+    concurrency: int,
+    top_k: int = 10,
+) -> dict:
+    """
+    Sends requests searches to the server at url from concurrency threads,
+    each with its own connection, cycling through queries. Returns the
+    latency percentiles in milliseconds and the throughput.
+    """
+    local = threading.local()
+    clients: list[SearchClient] = []
+    clients_lock = threading.Lock()
+
+    def search(query: str) -> float | None:
+        if not hasattr(local, "client"):
+            local.client = SearchClient(url)
+            with clients_lock:
+                clients.append(local.client)
+        start = time.perf_counter()
+        try:
+            local.client.search(query, top_k=top_k)
+        except SearchServerError:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(search, islice(cycle(queries), requests)))
+    seconds = time.perf_counter() - start
+    for client in clients:
+        client.close()
+    latencies = sorted(result for result in results if result is not None)
+
+    def percentile(fraction: float) -> float:
+        if not latencies:
+            return 0.0
+        position = min(len(latencies) - 1, int(fraction * len(latencies)))
+        return latencies[position] * 1000
+
+    return {
+        "requests": requests,
+        "errors": requests - len(latencies),
+        "concurrency": concurrency,
+        "p50_ms": percentile(0.50),
+        "p90_ms": percentile(0.90),
+        "p99_ms": percentile(0.99),
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+        "requests_per_second": requests / seconds if seconds else 0.0,
+    }
@@ -0,0 +1,97 @@
+import http.client
+import json
+import socket
+from urllib.parse import urlsplit
+
+from codemine.domain.value_objects import GenericRecord, SearchFilter, SearchMode
+
+DEFAULT_TIMEOUT = 60.0
+
+
+class SearchServerError(Exception):
+    pass
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class SearchClient:
+    """
+    Client of a codemine search server at an http://host:port or
+    unix:///path/to/socket URL. It only uses the standard library, and
+    reuses one keep-alive connection, so it is not safe to share between
+    threads.
+    """
+
+    def __init__(self, url: str, timeout: float = DEFAULT_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self._connection: http.client.HTTPConnection | None = None
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 10,
+        search_filter: SearchFilter | None = None,
+        search_mode: SearchMode = "hybrid",
+    ) -> list[GenericRecord]:
+        body = {"query": query, "top_k": top_k, "search_mode": search_mode}
+        if search_filter is not None:
+            body["search_filter"] = search_filter.model_dump()
+        payload = self._request("POST", "/search", body)
+        return [GenericRecord.model_validate(record) for record in payload["results"]]
+
+    def health(self) -> dict:
+        return self._request("GET", "/health")
+
+    def stats(self) -> dict:
+        return self._request("GET", "/stats")
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _request(self, method: str, path: str, payload: dict | None = None) -> dict:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        # A kept-alive connection may have been closed by the server since the
+        # last request, so the request is retried once on a new connection.
+        for attempt in range(2):
+            connection = self._get_connection()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (ConnectionError, http.client.HTTPException, OSError) as e:
+                self.close()
+                if attempt == 1:
+                    raise SearchServerError(
+                        f"Could not reach search server at {self.url}: {e}"
+                    ) from e
+        result = json.loads(data)
+        if response.status != 200:
+            raise SearchServerError(result.get("error", f"HTTP {response.status}"))
+        return result
+
+    def _get_connection(self) -> http.client.HTTPConnection:
+        if self._connection is None:
+            parts = urlsplit(self.url)
+            if parts.scheme == "unix":
+                self._connection = _UnixHTTPConnection(parts.path, self.timeout)
+            elif parts.scheme == "http":
+                self._connection = http.client.HTTPConnection(
+                    parts.hostname, parts.port, timeout=self.timeout
+                )
+            else:
+                raise ValueError(f"Unsupported search server URL: {self.url}")
+        return self._connection
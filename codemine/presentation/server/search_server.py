@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import pydantic
+import structlog
+
+from codemine.application.queries import SearchEmbeddingsQuery
+from codemine.application.use_cases.search_chunks import SearchChunksUseCase
+
+logger = structlog.get_logger()
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_WORKERS = 16
+# Latencies kept for the percentiles reported by /stats.
+LATENCY_WINDOW = 10_000
+MAX_BODY_BYTES = 1024 * 1024
+# Connections idle for longer than this are closed.
+KEEP_ALIVE_TIMEOUT = 30.0
+
+
+class HttpError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class SearchServer:
+    """
+    Minimal HTTP/1.1 server that keeps a SearchChunksUseCase, and the clients
+    behind it, warm between queries. Connections are kept alive, and searches
+    run on a thread pool of max_workers threads since the vector store clients
+    are blocking.
+
+    Routes:
+    - POST /search with a SearchEmbeddingsQuery as JSON returns the records.
+    - GET /health returns once the server is ready.
+    - GET /stats returns latency percentiles and search cache stats.
+    """
+
+    def __init__(
+        self,
+        search_chunks_use_case: SearchChunksUseCase,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ):
+        self.search_chunks_use_case = search_chunks_use_case
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="search"
+        )
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._requests = 0
+        self._errors = 0
+
+    async def serve(
+        self,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        socket_path: str | None = None,
+    ) -> None:
+        """Serves until cancelled, on socket_path if given, else on host:port."""
+        # Connects to the index up front so the first query is not slower.
+        await asyncio.get_running_loop().run_in_executor(
+            self._executor, self.search_chunks_use_case.vector_store.warm_up
+        )
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            server = await asyncio.start_unix_server(self._handle, path=socket_path)
+            address = f"unix://{socket_path}"
+        else:
+            server = await asyncio.start_server(self._handle, host=host, port=port)
+            port = server.sockets[0].getsockname()[1]
+            address = f"http://{host}:{port}"
+        logger.bind(address=address, max_workers=self.max_workers).warning(
+            "Search server listening"
+        )
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            if socket_path is not None and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        stats = {
+            "requests": self._requests,
+            "errors": self._errors,
+            "p50_ms": _percentile(latencies, 0.50) * 1000,
+            "p99_ms": _percentile(latencies, 0.99) * 1000,
+        }
+        search_cache = self.search_chunks_use_case.search_cache
+        if search_cache is not None:
+            stats["search_cache"] = search_cache.stats()
+        return stats
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(
+                        _read_request(reader), KEEP_ALIVE_TIMEOUT
+                    )
+                except (TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    return
+                if request is None:
+                    return
+                method, path, headers, body = request
+                status, payload = await self._route(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await _write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    return
+        except HttpError as e:
+            await _write_response(writer, e.status, {"error": str(e)}, False)
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes) -> tuple:
+        match method, path:
+            case "POST", "/search":
+                return await self._search(body)
+            case "GET", "/health":
+                return HTTPStatus.OK, {"status": "ok"}
+            case "GET", "/stats":
+                return HTTPStatus.OK, self.stats()
+            case _, "/search" | "/health" | "/stats":
+                return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Method not allowed"}
+            case _:
+                return HTTPStatus.NOT_FOUND, {"error": f"No route for {path}"}
+
+    async def _search(self, body: bytes) -> tuple:
+        start = time.perf_counter()
+        self._requests += 1
+        try:
+            query = SearchEmbeddingsQuery.model_validate_json(body)
+        except pydantic.ValidationError as e:
+            self._errors += 1
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        try:
+            records = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.search_chunks_use_case.execute, query
+            )
+        except Exception as e:
+            self._errors += 1
+            logger.bind(query=query.query).exception("Search failed")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+        seconds = time.perf_counter() - start
+        self._latencies.append(seconds)
+        return HTTPStatus.OK, {
+            "results": [record.model_dump() for record in records],
+            "seconds": seconds,
+        }
+
+
+async def _read_request(
+    reader: asyncio.StreamReader,
+) -> tuple[str, str, dict[str, str], bytes] | None:
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError as e:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Malformed request line") from e
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_BYTES:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, path.split("?", 1)[0], headers, body
+
+
+async def _write_response(
+    writer: asyncio.StreamWriter, status: HTTPStatus, payload: dict, keep_alive: bool
+) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    position = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[position]